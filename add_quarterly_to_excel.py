@@ -1,44 +1,61 @@
 import os
 import pandas as pd
-import glob
 from openpyxl import load_workbook
 from openpyxl.utils.dataframe import dataframe_to_rows
+from artifact_catalog import (load_or_rebuild_catalog, save_catalog, lookup_artifact,
+                              register_artifact, symbols_with, get_base_name, get_safe_name,
+                              WORKBOOK)
+from stage_exchange import read_stage, symbols_with_stage, to_export_frame, load_use_japanese_columns
+from file_lock import file_lock, atomic_path
 
-def add_quarterly_to_excel(quarterly_file_path, excel_dir):
+def add_quarterly_to_excel(quarterly_file_path, excel_dir, catalog, symbol):
     """
-    四半期足データをExcelファイルに追加する関数
+    四半期足データのCSVファイルをExcelファイルに追加する関数
     
     Parameters:
     quarterly_file_path (str): 四半期足データのCSVファイルパス
     excel_dir (str): Excelファイルが保存されているディレクトリパス
+    catalog (dict): 成果物カタログ（Excelファイルの場所と銘柄名を引く）
+    symbol (str): ティッカーシンボル
     
     Returns:
     bool: 処理が成功したかどうか
     """
+    file_name = os.path.basename(quarterly_file_path)
     try:
-        # CSVファイル名から銘柄名を取得
-        file_name = os.path.basename(quarterly_file_path)
-        ticker_name = file_name.replace('_四半期足.csv', '')
-        
         # 四半期足データを読み込む
         df_quarterly = pd.read_csv(quarterly_file_path)
         
         # Dateカラムをdatetime型に変換
         df_quarterly['Date'] = pd.to_datetime(df_quarterly['Date'])
+    except Exception as e:
+        print(f"エラー ({file_name}): {e}")
+        return False
+    
+    return write_quarterly_sheet(df_quarterly, excel_dir, catalog, symbol)
+
+def write_quarterly_sheet(df_quarterly, excel_dir, catalog, symbol):
+    """
+    四半期足データをExcelファイルのシートに書き込む関数
+    
+    Parameters:
+    df_quarterly (pd.DataFrame): Date列を持つ四半期足データ
+    excel_dir (str): Excelファイルが保存されているディレクトリパス
+    catalog (dict): 成果物カタログ（Excelファイルの場所と銘柄名を引く）
+    symbol (str): ティッカーシンボル
+    
+    Returns:
+    bool: 処理が成功したかどうか
+    """
+    # カタログから銘柄名を取得（ファイル名からの逆算はしない）
+    ticker_name = get_base_name(catalog, symbol)
+    stock_name = get_safe_name(catalog, symbol)
+    try:
+        # 対応するExcelファイルをカタログから探す
+        excel_path = lookup_artifact(catalog, symbol, WORKBOOK, excel_dir)
         
-        # 対応するExcelファイルを探す
-        excel_files = glob.glob(os.path.join(excel_dir, f"{ticker_name}*.xlsx"))
-        
-        if not excel_files:
+        if excel_path is None:
             print(f"警告: {ticker_name}に対応するExcelファイルが見つかりませんでした。新規作成します。")
-            # ティッカーシンボルまたは銘柄コードから銘柄名を抽出
-            if "_" in ticker_name:
-                # ファイル名に_が含まれる場合、最後の部分を銘柄名と仮定
-                stock_name = ticker_name.split("_")[-1]
-            else:
-                # _がない場合はそのままを銘柄名として使用
-                stock_name = ticker_name
-                
             # シート名を作成（銘柄名_四半期足）
             sheet_name = f"{stock_name}_四半期足"
             
@@ -47,83 +64,100 @@ def add_quarterly_to_excel(quarterly_file_path, excel_dir):
             
             # 新規Excelファイルを作成
             excel_path = os.path.join(excel_dir, f"{ticker_name}.xlsx")
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                # 既存のシートに月足データを書き込む
-                df_quarterly.to_excel(writer, sheet_name=sheet_name, index=False)
+            with file_lock(excel_path), atomic_path(excel_path) as tmp_path:
+                with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
+                    # 既存のシートに月足データを書き込む
+                    df_quarterly.to_excel(writer, sheet_name=sheet_name, index=False)
+            register_artifact(catalog, symbol, WORKBOOK, excel_path, excel_dir)
             print(f"新規Excelファイル作成: {excel_path}")
             return True
         
-        # 最初に見つかったExcelファイルを使用
-        excel_path = excel_files[0]
         print(f"Excelファイル検出: {excel_path}")
         
-        # Excelファイルを開く
-        book = load_workbook(excel_path)
-        
-        # ティッカーシンボルまたは銘柄コードから銘柄名を抽出
-        # ファイル名のパターンは通常「コード_銘柄名_四半期足.csv」の形式と想定
-        # または単に「銘柄名_四半期足.csv」の場合もある
+        # 読み込み→書き込みの間は他の処理がブックを書き換えないようにロックする
+        with file_lock(excel_path):
+            # Excelファイルを開く
+            book = load_workbook(excel_path)
         
-        # ファイル名から銘柄名を抽出
-        if "_" in ticker_name:
-            # ファイル名に_が含まれる場合、最後の部分を銘柄名と仮定
-            stock_name = ticker_name.split("_")[-1]
-        else:
-            # _がない場合はそのままを銘柄名として使用
-            stock_name = ticker_name
-            
-        # シート名を作成（銘柄名_四半期足）
-        sheet_name = f"{stock_name}_四半期足"
+            # シート名を作成（銘柄名_四半期足）
+            sheet_name = f"{stock_name}_四半期足"
         
-        # シート名の長さ制限（31文字まで）
-        sheet_name = sheet_name[:31]
+            # シート名の長さ制限（31文字まで）
+            sheet_name = sheet_name[:31]
         
-        # '銘柄名_四半期足'シートが存在するか確認し、なければ作成
-        if sheet_name not in book.sheetnames:
-            sheet = book.create_sheet(sheet_name)
-        else:
-            sheet = book[sheet_name]
-            # シートをクリア
-            for row in sheet.rows:
-                for cell in row:
-                    cell.value = None
+            # '銘柄名_四半期足'シートが存在するか確認し、なければ作成
+            if sheet_name not in book.sheetnames:
+                sheet = book.create_sheet(sheet_name)
+            else:
+                sheet = book[sheet_name]
+                # シートをクリア
+                for row in sheet.rows:
+                    for cell in row:
+                        cell.value = None
         
-        # DataFrameをシートに書き込む
-        rows = dataframe_to_rows(df_quarterly, index=False, header=True)
-        for r_idx, row in enumerate(rows, 1):
-            for c_idx, value in enumerate(row, 1):
-                sheet.cell(row=r_idx, column=c_idx, value=value)
+            # DataFrameをシートに書き込む
+            rows = dataframe_to_rows(df_quarterly, index=False, header=True)
+            for r_idx, row in enumerate(rows, 1):
+                for c_idx, value in enumerate(row, 1):
+                    sheet.cell(row=r_idx, column=c_idx, value=value)
         
-        # Excelファイルを保存
-        book.save(excel_path)
+            # Excelファイルを保存
+            with atomic_path(excel_path) as tmp_path:
+                book.save(tmp_path)
         print(f"四半期足データをシート「{sheet_name}」に追加完了: {excel_path}")
         return True
         
     except Exception as e:
-        print(f"エラー ({file_name}): {e}")
+        print(f"エラー ({ticker_name}): {e}")
         return False
 
-def main():
+def add_all_quarterly(data_folder, catalog, use_japanese_columns=False):
     """
-    メイン関数：全ての四半期足CSVファイルをExcelに追加
+    全ての四半期足データを銘柄ごとのExcelファイルに追加する
+
+    前のステージが受け渡したデータを優先し、なければ書き出し済みのCSVを使う。
+
+    Parameters:
+    data_folder (str): 株価データの出力ディレクトリ（Excelファイルも同じフォルダ）
+    catalog (dict): 成果物カタログ（新規作成したExcelファイルを登録して保存する）
+    use_japanese_columns (bool): シートのカラム名を日本語にするかどうか
+
+    Returns:
+    int: 追加に成功した銘柄数
     """
-    # 株価データフォルダのパス
-    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '株価データ')
-    # Excelフォルダのパス（株価データフォルダと同じと仮定）
-    excel_folder = data_folder
-    
-    # 四半期足CSVファイルを検索
-    quarterly_files = glob.glob(os.path.join(data_folder, '*_四半期足.csv'))
+    staged = symbols_with_stage(catalog, "四半期足")
+    symbols = staged + [s for s in symbols_with(catalog, "四半期足") if s not in staged]
     
-    print(f"処理対象ファイル数: {len(quarterly_files)}")
+    print(f"処理対象ファイル数: {len(symbols)}")
     
     success_count = 0
-    # 各四半期足CSVファイルをExcelに追加
-    for quarterly_file in quarterly_files:
-        if add_quarterly_to_excel(quarterly_file, excel_folder):
+    # 各銘柄の四半期足データをExcelに追加
+    for symbol in symbols:
+        df_quarterly = read_stage(data_folder, catalog, symbol, "四半期足")
+        if df_quarterly is not None:
+            if write_quarterly_sheet(to_export_frame(df_quarterly, use_japanese_columns), data_folder, catalog, symbol):
+                success_count += 1
+            continue
+        
+        quarterly_file = lookup_artifact(catalog, symbol, "四半期足", data_folder)
+        if quarterly_file is None:
+            print(f"警告: {symbol}の四半期足ファイルが見つかりません。")
+            continue
+        if add_quarterly_to_excel(quarterly_file, data_folder, catalog, symbol):
             success_count += 1
     
-    print(f"処理完了: {success_count}/{len(quarterly_files)} ファイルを処理しました")
+    save_catalog(catalog, data_folder)
+    print(f"処理完了: {success_count}/{len(symbols)} ファイルを処理しました")
+    return success_count
+
+def main():
+    """
+    メイン関数：全ての四半期足データをExcelに追加
+    """
+    # 株価データフォルダのパス（Excelファイルも同じフォルダにある）
+    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '株価データ')
+    catalog = load_or_rebuild_catalog(data_folder)
+    add_all_quarterly(data_folder, catalog, load_use_japanese_columns())
 
 if __name__ == "__main__":
     main()
@@ -1,76 +1,109 @@
 import pandas as pd
-import os
-import glob
-from openpyxl import load_workbook
+import shutil
+from artifact_catalog import (load_or_rebuild_catalog, lookup_artifact, symbols_with,
+                              get_base_name, get_safe_name, WORKBOOK)
+from stage_exchange import read_stage, symbols_with_stage, load_use_japanese_columns
+from price_store import JAPANESE_COLUMNS
+from file_lock import file_lock, atomic_path
 
 # 出力ディレクトリ
-data_dir = "C:\\Users\\rilak\\Desktop\\株価\\株価データ"
-print(f"処理対象ディレクトリ: {data_dir}")
+DATA_DIR = "C:\\Users\\rilak\\Desktop\\株価\\株価データ"
 
-# 年足CSVファイルを検索
-yearly_csv_files = glob.glob(os.path.join(data_dir, "*_年足.csv"))
-print(f"見つかった年足CSVファイル: {len(yearly_csv_files)}個")
+def load_yearly_data(data_dir, catalog, symbol, use_japanese_columns=False):
+    """
+    年足データを読み込む（前のステージが受け渡したデータを優先し、なければ書き出し済みのCSVを使う）
 
-for yearly_csv_file in yearly_csv_files:
-    try:
-        # ファイル名から情報を抽出
-        basename = os.path.basename(yearly_csv_file)
-        ticker_and_name = basename.replace('_年足.csv', '')
-        
-        print(f"処理中: {basename} -> {ticker_and_name}")
-        
-        # 元のExcelファイルのパス
-        excel_file = os.path.join(data_dir, f"{ticker_and_name}.xlsx")
-        
-        if not os.path.exists(excel_file):
-            print(f"警告: 元のExcelファイルが見つかりません: {excel_file}")
-            continue
-        
-        # 年足CSVデータを読み込む
-        yearly_data = pd.read_csv(yearly_csv_file, index_col=0, parse_dates=True)
-        
-        # ティッカーシンボルまたは銘柄コードから銘柄名を抽出
-        # ファイル名のパターンは通常「コード_銘柄名_年足.csv」の形式と想定
-        # または単に「銘柄名_年足.csv」の場合もある
-        
-        # ファイル名から銘柄名を抽出
-        if "_" in ticker_and_name:
-            # ファイル名に_が含まれる場合、最後の部分を銘柄名と仮定
-            stock_name = ticker_and_name.split("_")[-1]
-        else:
-            # _がない場合はそのままを銘柄名として使用
-            stock_name = ticker_and_name
+    Returns:
+    pd.DataFrame: 日時インデックスの年足データ（見つからない場合はNone）
+    """
+    yearly_data = read_stage(data_dir, catalog, symbol, "年足")
+    if yearly_data is not None:
+        if use_japanese_columns:
+            yearly_data = yearly_data.rename(columns=JAPANESE_COLUMNS)
+        return yearly_data.rename_axis('日付' if use_japanese_columns else 'Date')
+
+    yearly_csv_file = lookup_artifact(catalog, symbol, "年足", data_dir)
+    if yearly_csv_file is None:
+        return None
+    return pd.read_csv(yearly_csv_file, index_col=0, parse_dates=True)
+
+def add_all_yearly(data_dir, catalog, use_japanese_columns=False):
+    """
+    カタログに登録された全ての年足データを元のExcelファイルに追加する
+
+    Parameters:
+    data_dir (str): 株価データの出力ディレクトリ
+    catalog (dict): 成果物カタログ（年足のデータとExcelファイルを引く）
+    use_japanese_columns (bool): シートのカラム名を日本語にするかどうか
+
+    Returns:
+    int: 追加に成功した銘柄数
+    """
+    staged = symbols_with_stage(catalog, "年足")
+    symbols = staged + [s for s in symbols_with(catalog, "年足") if s not in staged]
+    print(f"見つかった年足データ: {len(symbols)}個")
+    
+    success_count = 0
+    for symbol in symbols:
+        try:
+            # カタログから情報を取得
+            ticker_and_name = get_base_name(catalog, symbol)
             
-        # シート名を作成（銘柄名_年足）
-        sheet_name = f"{stock_name}_年足"
-        
-        # シート名の長さ制限（31文字まで）
-        sheet_name = sheet_name[:31]
+            print(f"処理中: {ticker_and_name}")
+            
+            # 元のExcelファイルのパス
+            excel_file = lookup_artifact(catalog, symbol, WORKBOOK, data_dir)
+            
+            if excel_file is None:
+                print(f"警告: 元のExcelファイルが見つかりません: {ticker_and_name}.xlsx")
+                continue
+            
+            # 年足データを読み込む
+            yearly_data = load_yearly_data(data_dir, catalog, symbol, use_japanese_columns)
+            if yearly_data is None:
+                print(f"警告: {symbol}の年足データが見つかりません。")
+                continue
+            
+            # カタログから銘柄名を取得（ファイル名からの逆算はしない）
+            stock_name = get_safe_name(catalog, symbol)
+            
+            # シート名を作成（銘柄名_年足）
+            sheet_name = f"{stock_name}_年足"
+            
+            # シート名の長さ制限（31文字まで）
+            sheet_name = sheet_name[:31]
+            
+            # シートの削除と追加は1回の保存で行う（途中の状態のブックを保存しない）
+            # 他の処理が同じブックを書き換えないようロックし、コピーに書き込んでから置き換える
+            try:
+                with file_lock(excel_file), atomic_path(excel_file) as tmp_path:
+                    shutil.copy2(excel_file, tmp_path)
+                    with pd.ExcelWriter(tmp_path, engine='openpyxl', mode='a', if_sheet_exists='replace') as writer:
+                        if sheet_name in writer.book.sheetnames:
+                            print(f"シート '{sheet_name}' はすでに存在します。置き換えます。")
+                        yearly_data.to_excel(writer, sheet_name=sheet_name)
+                success_count += 1
+                print(f"年足データを元のExcelファイルに追加しました: {excel_file} (シート: {sheet_name})")
+            except Exception as e:
+                print(f"エラー: {e}")
         
-        # シートの存在を確認し、存在する場合は上書き
-        try:
-            book = load_workbook(excel_file)
-            if sheet_name in book.sheetnames:
-                print(f"シート '{sheet_name}' はすでに存在します。削除します。")
-                std = book[sheet_name]
-                book.remove(std)
-                book.save(excel_file)
-            book.close()
         except Exception as e:
-            print(f"Excelファイルの読み込み中にエラーが発生しました: {e}")
-            continue
+            print(f"処理中にエラーが発生しました: {e}")
         
-        try:
-            # Excelファイルに年足データを追加
-            with pd.ExcelWriter(excel_file, engine='openpyxl', mode='a') as writer:
-                yearly_data.to_excel(writer, sheet_name=sheet_name)
-            print(f"年足データを元のExcelファイルに追加しました: {excel_file} (シート: {sheet_name})")
-        except Exception as e:
-            print(f"エラー: {e}")
+        print("=" * 50)
     
-    except Exception as e:
-        print(f"処理中にエラーが発生しました: {e}")
+    return success_count
+
+def main():
+    """
+    メイン関数：カタログに登録された全ての年足データを元のExcelファイルに追加
+    """
+    data_dir = DATA_DIR
+    print(f"処理対象ディレクトリ: {data_dir}")
     
-    print("=" * 50)
+    catalog = load_or_rebuild_catalog(data_dir)
+    add_all_yearly(data_dir, catalog, load_use_japanese_columns())
+    print("\n処理が完了しました。年足データを元のExcelファイルに追加しました。")
 
-print("\n処理が完了しました。年足データを元のExcelファイルに追加しました。")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+import os
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+from columnar_store import STORE_META_FILE, STORE_FORMAT_VERSION, write_frame, read_frame, read_meta
+from price_store import read_prices, get_data_version, resample_ohlcv
+from file_lock import file_lock
+
+# 集計結果を保存するフォルダ（出力ディレクトリの analytics フォルダ内、universe_analytics と共有）
+AGGREGATE_DIR = os.path.join("analytics", "aggregates")
+
+# メモリに保持する集計結果の合計サイズの上限（MB）
+MEMORY_CACHE_MB = 64
+
+# ディスクに保存する集計結果の合計サイズの上限（MB）
+DISK_CACHE_MB = 512
+
+def get_cache_dir(output_dir):
+    """集計結果を保存するフォルダのパスを返す"""
+    return os.path.join(output_dir, AGGREGATE_DIR)
+
+def get_aggregator_name(aggregate):
+    """
+    集計関数の名前（キーに含め、同じ期間名でも集計方法が違う結果を区別する）
+
+    スクリプトとして実行した場合と読み込んだ場合で同じ名前になるよう、モジュール名は含めない。
+    """
+    if aggregate is None:
+        return "resample_ohlcv"
+    return aggregate.__qualname__
+
+def get_slot(symbol, source_interval, rule, aggregate=None):
+    """
+    銘柄・元の期間・集計の組み合わせごとの保存先の名前を返す
+
+    元データのバージョンは含めない（元データが更新された場合は同じ場所を上書きする）。
+    """
+    key = "|".join([symbol, source_interval, rule, get_aggregator_name(aggregate)])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
+
+def get_source_hash(catalog, symbol, source_interval):
+    """
+    元データのバージョンのハッシュを返す（未登録の場合はNone）
+
+    列ファイルの保存形式のバージョンも含める（古い形式から読んだ結果は列の型が違うため使わない）。
+    """
+    version = get_data_version(catalog, symbol, source_interval)
+    if version is None:
+        return None
+    return hashlib.sha1(f"{version}|{STORE_FORMAT_VERSION}".encode('utf-8')).hexdigest()
+
+def get_frame_bytes(df):
+    """データフレームのメモリ上のサイズ（バイト）"""
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+def get_dir_bytes(path):
+    """フォルダ内のファイルの合計サイズ（バイト）"""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+class AggregateCache:
+    """
+    足の変換・集計の結果を保持するキャッシュ（メモリとディスクの2段）
+
+    キーは (銘柄, 元の期間, 変換の指定, 元データのバージョン)。元データが書き換えられると
+    バージョンが変わるため、古い結果が使われることはない。
+    メモリは最近使った順、ディスクは最後に使った日時の順に、上限を超えた分を削除する。
+    """
+
+    def __init__(self, memory_mb=MEMORY_CACHE_MB, disk_mb=DISK_CACHE_MB):
+        self.memory_limit = memory_mb * 1024 * 1024
+        self.disk_limit = disk_mb * 1024 * 1024
+        self.items = OrderedDict()
+        self.memory_bytes = 0
+        self.lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get(self, output_dir, catalog, symbol, source_interval, rule, aggregate=None, load=None):
+        """
+        集計結果をキャッシュから取得し、なければ集計して保存する
+
+        Parameters:
+        output_dir (str): 出力ディレクトリ
+        catalog (dict): 成果物カタログ
+        symbol (str): ティッカーシンボル
+        source_interval (str): 元データの期間名（日足、月足など）
+        rule (str): 変換の指定（pandasの期間指定、または集計関数を使う場合はその名前）
+        aggregate (function): 元データを受け取り集計結果を返す関数（省略時は resample_ohlcv(df, rule)）
+        load (function): 元データを読み込む関数（省略時は read_prices）
+
+        Returns:
+        pd.DataFrame: 集計結果（元データがない場合はNone）
+        """
+        source_hash = get_source_hash(catalog, symbol, source_interval)
+        if source_hash is None:
+            # カタログに登録されていないデータはバージョンが分からないためキャッシュしない
+            return self.compute(output_dir, catalog, symbol, source_interval, rule, aggregate, load)
+
+        key, entry_dir, df = self.lookup(output_dir, symbol, source_interval, rule, aggregate, source_hash)
+        if df is not None:
+            return df
+        df = self.compute(output_dir, catalog, symbol, source_interval, rule, aggregate, load)
+        if df is None:
+            return None
+        self.store(output_dir, key, entry_dir, df, source_hash,
+                   {"symbol": symbol, "source_interval": source_interval, "rule": rule})
+        return df.copy()
+
+    def get_many(self, output_dir, catalog, symbols, source_interval, rule, aggregate, aggregate_many):
+        """
+        複数銘柄の集計結果をキャッシュから取得し、キャッシュにない銘柄はまとめて1回で集計する
+
+        Parameters:
+        output_dir (str): 出力ディレクトリ
+        catalog (dict): 成果物カタログ
+        symbols (list): ティッカーシンボルのリスト
+        source_interval (str): 元データの期間名（日足、月足など）
+        rule (str): 変換の指定（集計関数の名前）
+        aggregate (function): 1銘柄の集計関数（保存先の名前に使い、get と同じ保存先を共有する）
+        aggregate_many (function): {銘柄: 元データ} を受け取り {銘柄: 集計結果} を返す関数
+
+        Returns:
+        dict: 銘柄 → 集計結果（元データがない銘柄は含めない）
+        """
+        results = {}
+        pending = {}
+        for symbol in symbols:
+            source_hash = get_source_hash(catalog, symbol, source_interval)
+            if source_hash is None:
+                # カタログに登録されていないデータはバージョンが分からないためキャッシュしない
+                pending[symbol] = (None, None, None)
+                continue
+            key, entry_dir, df = self.lookup(output_dir, symbol, source_interval, rule, aggregate, source_hash)
+            if df is not None:
+                results[symbol] = df
+            else:
+                pending[symbol] = (key, entry_dir, source_hash)
+        if not pending:
+            return results
+
+        sources = {}
+        for symbol in pending:
+            df = read_prices(output_dir, symbol, source_interval, catalog)
+            if df is not None:
+                sources[symbol] = df
+        computed = aggregate_many(sources) if sources else {}
+
+        for symbol, df in computed.items():
+            key, entry_dir, source_hash = pending[symbol]
+            if key is not None:
+                self.store(output_dir, key, entry_dir, df, source_hash,
+                           {"symbol": symbol, "source_interval": source_interval, "rule": rule})
+                df = df.copy()
+            results[symbol] = df
+        return results
+
+    def lookup(self, output_dir, symbol, source_interval, rule, aggregate, source_hash):
+        """
+        メモリ・ディスクの順に集計結果を探す
+
+        Returns:
+        tuple: (メモリのキー, ディスクの保存先, 集計結果のコピー)（見つからない場合の集計結果はNone）
+        """
+        slot = get_slot(symbol, source_interval, rule, aggregate)
+        key = (os.path.abspath(output_dir), slot, source_hash)
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.memory_hits += 1
+                return key, None, self.items[key][0].copy()
+
+        entry_dir = os.path.join(get_cache_dir(output_dir), slot)
+        df = self.read_disk(entry_dir, source_hash)
+        with self.lock:
+            if df is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+        if df is None:
+            return key, entry_dir, None
+        self.remember(key, df)
+        return key, entry_dir, df.copy()
+
+    def store(self, output_dir, key, entry_dir, df, source_hash, info):
+        """集計結果をディスクに保存し、メモリに保持する"""
+        self.write_disk(output_dir, entry_dir, df, source_hash, info)
+        self.remember(key, df)
+
+    def compute(self, output_dir, catalog, symbol, source_interval, rule, aggregate=None, load=None):
+        """元データを読み込んで集計する"""
+        df = load() if load is not None else read_prices(output_dir, symbol, source_interval, catalog)
+        if df is None:
+            return None
+        return aggregate(df) if aggregate is not None else resample_ohlcv(df, rule)
+
+    def remember(self, key, df):
+        """集計結果をメモリに保持し、上限を超えた分を古い順に削除する"""
+        size = get_frame_bytes(df)
+        if size > self.memory_limit:
+            return
+        with self.lock:
+            if key in self.items:
+                self.memory_bytes -= self.items.pop(key)[1]
+            self.items[key] = (df, size)
+            self.memory_bytes += size
+            while self.memory_bytes > self.memory_limit:
+                _, (_, old_size) = self.items.popitem(last=False)
+                self.memory_bytes -= old_size
+
+    def read_disk(self, entry_dir, source_hash):
+        """ディスクの集計結果を読み込む（元データのバージョンが違う場合はNone）"""
+        meta = read_meta(entry_dir)
+        if meta is None or meta.get("source", {}).get("hash") != source_hash:
+            return None
+        try:
+            df = read_frame(entry_dir)
+        except Exception as e:
+            print(f"警告: 保存済みの集計結果を読み込めませんでした（集計し直します）: {e}")
+            return None
+        source = meta["source"]
+        df = df.astype(source.get("dtypes", {}))
+        df.index.name = source.get("index_name")
+        # 最後に使った日時を更新する（ディスクの削除順に使う）
+        os.utime(os.path.join(entry_dir, STORE_META_FILE))
+        return df
+
+    def write_disk(self, output_dir, entry_dir, df, source_hash, info):
+        """集計結果をディスクに保存し、上限を超えた分を使われていない順に削除する"""
+        source = dict(info, hash=source_hash, index_name=df.index.name,
+                      dtypes={col: str(dtype) for col, dtype in df.dtypes.items()})
+        try:
+            os.makedirs(os.path.dirname(entry_dir), exist_ok=True)
+            with file_lock(entry_dir):
+                write_frame(entry_dir, df, source=source)
+        except Exception as e:
+            print(f"警告: 集計結果をディスクに保存できませんでした: {e}")
+            return
+        self.evict_disk(get_cache_dir(output_dir), keep=os.path.basename(entry_dir))
+
+    def evict_disk(self, cache_dir, keep=None):
+        """ディスクの集計結果の合計サイズが上限を超えた場合、最後に使った日時が古いものから削除する"""
+        entries = []
+        for entry in os.scandir(cache_dir):
+            meta_path = os.path.join(entry.path, STORE_META_FILE)
+            if not entry.is_dir() or not os.path.exists(meta_path):
+                continue
+            entries.append((os.path.getmtime(meta_path), entry.name, get_dir_bytes(entry.path)))
+
+        total = sum(size for _, _, size in entries)
+        for _, name, size in sorted(entries):
+            if total <= self.disk_limit:
+                break
+            if name == keep:
+                continue
+            entry_dir = os.path.join(cache_dir, name)
+            with file_lock(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+
+    def stats(self):
+        """キャッシュの利用状況を返す"""
+        with self.lock:
+            return {"memory_hits": self.memory_hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "memory_items": len(self.items), "memory_mb": self.memory_bytes / 1024 / 1024}
+
+# プロセス内で共有するキャッシュ
+_default_cache = AggregateCache()
+
+def get_aggregate(output_dir, catalog, symbol, source_interval, rule, aggregate=None, load=None):
+    """
+    集計結果を共有のキャッシュ経由で取得する（引数は AggregateCache.get と同じ）
+
+    例: get_aggregate(output_dir, catalog, "7203.T", "日足", "2W")
+    """
+    return _default_cache.get(output_dir, catalog, symbol, source_interval, rule, aggregate, load)
+
+def get_aggregates(output_dir, catalog, symbols, source_interval, rule, aggregate, aggregate_many):
+    """
+    複数銘柄の集計結果を共有のキャッシュ経由でまとめて取得する（引数は AggregateCache.get_many と同じ）
+
+    例: get_aggregates(output_dir, catalog, symbols, "月足", "四半期足", monthly_to_quarterly, monthly_to_quarterly_universe)
+    """
+    return _default_cache.get_many(output_dir, catalog, symbols, source_interval, rule, aggregate, aggregate_many)
+
+def get_cache_stats():
+    """共有のキャッシュの利用状況を返す"""
+    return _default_cache.stats()
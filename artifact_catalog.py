@@ -0,0 +1,361 @@
+import os
+import glob
+from datetime import datetime
+
+import pandas as pd
+
+from csv_compression import strip_csv_suffix, open_csv_text, find_csv_variants
+from file_lock import file_lock, read_json, write_json
+
+# 設定ファイルのパス
+CONFIG_FILE = "stock_config.json"
+
+# カタログファイル名（出力ディレクトリ直下に作成）
+CATALOG_FILE_NAME = "catalog.json"
+
+# カタログ形式のバージョン
+CATALOG_FORMAT_VERSION = 1
+
+# Excelブックを登録する際の期間名の代わりに使うキー
+WORKBOOK = "workbook"
+
+# yfinanceの期間コードと期間名の対応
+INTERVAL_NAMES = {
+    "1d": "日足",
+    "1wk": "週足",
+    "1mo": "月足",
+    "3mo": "四半期足",
+    "1y": "年足"
+}
+
+def make_safe_ticker(ticker):
+    """ティッカーシンボルからファイル名用の文字列を作成する（ピリオドを除去）"""
+    return ticker.replace('.', '_')
+
+def make_safe_name(name):
+    """銘柄名からファイル名に使えない文字を削除する"""
+    for ch in ['/', '\\', ':', '*', '?', '"', '<', '>', '|']:
+        name = name.replace(ch, '')
+    return name
+
+def make_base_name(symbol, name):
+    """成果物ファイル名の共通部分（コード_銘柄名）を作成する"""
+    return f"{make_safe_ticker(symbol)}_{make_safe_name(name)}"
+
+def get_catalog_path(output_dir):
+    """出力ディレクトリに対応するカタログファイルのパスを返す"""
+    return os.path.join(output_dir, CATALOG_FILE_NAME)
+
+def new_catalog():
+    """空のカタログを作成する"""
+    return {"format": CATALOG_FORMAT_VERSION, "symbols": {}}
+
+def load_catalog(output_dir):
+    """
+    カタログを読み込む（存在しない場合は空のカタログを返す）
+
+    Parameters:
+    output_dir (str): 株価データの出力ディレクトリ
+
+    Returns:
+    dict: カタログ
+    """
+    catalog_path = get_catalog_path(output_dir)
+    if os.path.exists(catalog_path):
+        try:
+            catalog = read_json(catalog_path)
+            catalog.setdefault("symbols", {})
+            return catalog
+        except Exception as e:
+            print(f"カタログの読み込み中にエラーが発生しました: {e}")
+            print("空のカタログを使用します。")
+    return new_catalog()
+
+def is_newer_artifact(artifact, current):
+    """成果物のエントリが現在のエントリより新しいかどうか（同じバージョンなら列ファイルの登録がある方）"""
+    version = artifact.get("version", 0)
+    current_version = current.get("version", 0)
+    if version != current_version:
+        return version > current_version
+    return "store" in artifact and "store" not in current
+
+def merge_catalog(catalog, saved):
+    """
+    保存済みのカタログのうち、他の処理が後から登録した成果物をカタログに取り込む
+
+    別々の銘柄を処理するパイプラインを同時に実行した場合に、互いの登録を上書きしないようにする。
+    同じ成果物はバージョンが新しい方を使う。
+    """
+    for symbol, saved_entry in saved.get("symbols", {}).items():
+        entry = catalog["symbols"].get(symbol)
+        if entry is None:
+            catalog["symbols"][symbol] = saved_entry
+            continue
+        artifacts = entry.setdefault("artifacts", {})
+        for interval, saved_artifact in saved_entry.get("artifacts", {}).items():
+            artifact = artifacts.get(interval)
+            if artifact is None or is_newer_artifact(saved_artifact, artifact):
+                artifacts[interval] = saved_artifact
+    return catalog
+
+def save_catalog(catalog, output_dir):
+    """
+    カタログを保存する（一時ファイルに書き込んでから置き換える）
+
+    保存の間はカタログをロックし、読み込んだ後に他の処理が保存した登録を取り込んでから書き込む。
+    """
+    catalog_path = get_catalog_path(output_dir)
+    with file_lock(catalog_path):
+        if os.path.exists(catalog_path):
+            try:
+                merge_catalog(catalog, read_json(catalog_path))
+            except Exception as e:
+                print(f"保存済みのカタログを読み込めませんでした（上書きします）: {e}")
+        catalog["updated"] = datetime.now().isoformat(timespec='seconds')
+        write_json(catalog_path, catalog)
+
+def register_symbol(catalog, symbol, name, exchange=None):
+    """
+    銘柄をカタログに登録する（登録済みの場合は銘柄名・取引所を更新する）
+
+    設定ファイルで指定された取引所を記録し、設定を読まない処理（価格の読み込みなど）でも同じ取引所を使う。
+
+    Returns:
+    dict: 銘柄のエントリ
+    """
+    entry = catalog["symbols"].setdefault(symbol, {"artifacts": {}})
+    entry["name"] = name
+    entry["safe_name"] = make_safe_name(name)
+    entry["base_name"] = make_base_name(symbol, name)
+    if exchange:
+        entry["exchange"] = exchange
+    else:
+        entry.pop("exchange", None)
+    entry.setdefault("artifacts", {})
+    return entry
+
+def get_symbol_exchange(catalog, symbol):
+    """設定ファイルで指定された銘柄の取引所を返す（指定がない場合はNone）"""
+    return catalog["symbols"].get(symbol, {}).get("exchange")
+
+def frame_range(df):
+    """
+    データフレームの行数と期間（最初と最後の日付）を取得する
+
+    Returns:
+    tuple: (行数, 開始日時の文字列, 終了日時の文字列)
+    """
+    if len(df) == 0:
+        return 0, None, None
+    if 'Date' in df.columns:
+        first, last = df['Date'].iloc[0], df['Date'].iloc[-1]
+    elif '日付' in df.columns:
+        first, last = df['日付'].iloc[0], df['日付'].iloc[-1]
+    else:
+        first, last = df.index[0], df.index[-1]
+
+    def to_str(value):
+        return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+    return len(df), to_str(first), to_str(last)
+
+def register_artifact(catalog, symbol, interval, path, output_dir, rows=None, start=None, end=None, fetched=None):
+    """
+    成果物ファイルをカタログに登録する
+
+    Parameters:
+    catalog (dict): カタログ
+    symbol (str): ティッカーシンボル
+    interval (str): 期間名（日足、月足など）または WORKBOOK
+    path (str): 成果物ファイルのパス
+    output_dir (str): 出力ディレクトリ（パスはここからの相対パスで保存）
+    rows (int): データ行数
+    start (str): 最初の日付
+    end (str): 最後の日付
+    fetched (str): データを取得した日時（省略時は以前の取得日時を引き継ぐ。圧縮・隔離などで登録し直す場合）
+
+    Returns:
+    dict: 成果物のエントリ
+    """
+    entry = catalog["symbols"].setdefault(symbol, {"artifacts": {}})
+    artifacts = entry.setdefault("artifacts", {})
+    previous = artifacts.get(interval, {})
+
+    # 出力ディレクトリ内のファイルは相対パスで保存（フォルダ移動に対応するため）
+    abs_path = os.path.abspath(path)
+    abs_dir = os.path.abspath(output_dir)
+    try:
+        inside = os.path.commonpath([abs_path, abs_dir]) == abs_dir
+    except ValueError:
+        # ドライブが異なる場合（Windows）
+        inside = False
+    stored_path = os.path.relpath(abs_path, abs_dir) if inside else abs_path
+
+    artifact = {
+        "path": stored_path,
+        "version": previous.get("version", 0) + 1,
+        "rows": rows,
+        "start": start,
+        "end": end,
+        "updated": datetime.now().isoformat(timespec='seconds'),
+        "fetched": fetched or previous.get("fetched")
+    }
+    artifacts[interval] = artifact
+    return artifact
+
+def read_csv_range(path):
+    """
+    CSVファイルの日付の列だけを読み込み、行数と期間（最初と最後の日付）を取得する
+
+    Returns:
+    tuple: (行数, 開始日時の文字列, 終了日時の文字列)（読み込めない場合はすべてNone）
+    """
+    try:
+        with open_csv_text(path) as f:
+            dates = pd.read_csv(f, usecols=[0], dtype=str).iloc[:, 0]
+        if len(dates) == 0:
+            return 0, None, None
+        # register_frame と同じ形式（Timestamp.isoformat）で記録する
+        return len(dates), pd.Timestamp(dates.iloc[0]).isoformat(), pd.Timestamp(dates.iloc[-1]).isoformat()
+    except Exception as e:
+        print(f"{os.path.basename(path)} の期間の読み込み中にエラーが発生しました: {e}")
+        return None, None, None
+
+def register_frame(catalog, symbol, interval, path, output_dir, df, fetched=None):
+    """データフレームの行数と期間を含めて成果物を登録する"""
+    rows, start, end = frame_range(df)
+    return register_artifact(catalog, symbol, interval, path, output_dir, rows=rows, start=start, end=end,
+                             fetched=fetched)
+
+def lookup_entry(catalog, symbol, interval):
+    """銘柄・期間に対応する成果物のエントリを返す（未登録の場合はNone）"""
+    entry = catalog["symbols"].get(symbol)
+    if entry is None:
+        return None
+    return entry.get("artifacts", {}).get(interval)
+
+def lookup_artifact(catalog, symbol, interval, output_dir):
+    """
+    銘柄・期間に対応する成果物ファイルの絶対パスを返す
+
+    Returns:
+    str: ファイルパス（未登録またはファイルが存在しない場合はNone）
+    """
+    artifact = lookup_entry(catalog, symbol, interval)
+    if artifact is None:
+        return None
+    path = artifact["path"]
+    if not os.path.isabs(path):
+        path = os.path.join(output_dir, path)
+    if not os.path.exists(path):
+        # 読み込んだ後に他の処理が圧縮形式を変えた場合は、新しい形式のファイルを返す
+        variants = find_csv_variants(path)
+        return variants[0] if variants else None
+    return path
+
+def get_base_name(catalog, symbol):
+    """銘柄の成果物ファイル名の共通部分（コード_銘柄名）を返す"""
+    entry = catalog["symbols"].get(symbol, {})
+    return entry.get("base_name") or make_safe_ticker(symbol)
+
+def get_safe_name(catalog, symbol):
+    """銘柄のファイル名・シート名用の銘柄名を返す"""
+    entry = catalog["symbols"].get(symbol, {})
+    return entry.get("safe_name") or make_safe_ticker(symbol)
+
+def symbols_with(catalog, interval):
+    """指定した期間の成果物が登録されている銘柄のリストを返す"""
+    return [symbol for symbol, entry in catalog["symbols"].items()
+            if interval in entry.get("artifacts", {})]
+
+def rebuild_catalog(output_dir, tickers):
+    """
+    既存の出力ディレクトリを一度だけ走査してカタログを作り直す
+
+    ファイル名の大文字・小文字の違い（例: 9766_t_ と 9766_T_）は無視して
+    設定ファイルの銘柄に対応付ける。同じ銘柄・期間に複数のファイルがある場合は
+    更新日時が最も新しいものを登録する。
+
+    Parameters:
+    output_dir (str): 株価データの出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+
+    Returns:
+    dict: 作成したカタログ
+    """
+    catalog = new_catalog()
+    for symbol, name in tickers.items():
+        register_symbol(catalog, symbol, name)
+
+    # ファイル名の先頭（コード_）から銘柄を引けるようにする
+    prefixes = {make_safe_ticker(symbol).lower() + "_": symbol for symbol in tickers}
+    interval_suffixes = [(f"_{period_name}", period_name) for period_name in INTERVAL_NAMES.values()]
+
+    found = {}
+    for path in glob.glob(os.path.join(output_dir, "*")):
+        file_name = os.path.basename(path)
+        symbol = next((s for p, s in prefixes.items() if file_name.lower().startswith(p)), None)
+        if symbol is None:
+            continue
+
+        if file_name.endswith(".xlsx"):
+            interval = WORKBOOK
+        else:
+            # 圧縮されたCSV（.csv.gz、.csv.zst）も同じ期間のファイルとして扱う
+            stem = strip_csv_suffix(file_name)
+            if stem is None:
+                continue
+            interval = next((i for suffix, i in interval_suffixes if stem.endswith(suffix)), None)
+            if interval is None:
+                continue
+
+        # 同じ銘柄・期間のファイルが複数ある場合は新しい方を採用
+        key = (symbol, interval)
+        mtime = os.path.getmtime(path)
+        if key not in found or mtime > found[key][1]:
+            found[key] = (path, mtime)
+
+    for (symbol, interval), (path, _) in found.items():
+        # CSVは日付の列だけを読んで行数と期間を登録する（Excelブックには行数・期間がない）
+        rows, start, end = (None, None, None) if interval == WORKBOOK else read_csv_range(path)
+        register_artifact(catalog, symbol, interval, path, output_dir, rows=rows, start=start, end=end)
+
+    # ファイル名の共通部分は実際のファイル名（最も新しいCSV）に合わせる
+    newest_csv = {}
+    for (symbol, interval), (path, mtime) in found.items():
+        if interval != WORKBOOK and (symbol not in newest_csv or mtime > newest_csv[symbol][1]):
+            newest_csv[symbol] = (path, mtime, interval)
+    for symbol, (path, _, interval) in newest_csv.items():
+        entry = catalog["symbols"][symbol]
+        entry["base_name"] = strip_csv_suffix(os.path.basename(path))[:-len(f"_{interval}")]
+        entry["safe_name"] = entry["base_name"][len(make_safe_ticker(symbol)) + 1:]
+
+    print(f"カタログを再構築しました: {len(found)}個のファイルを登録")
+    return catalog
+
+def load_config_tickers():
+    """設定ファイルからティッカーシンボルと銘柄名の辞書を読み込む"""
+    if not os.path.exists(CONFIG_FILE):
+        return {}
+    try:
+        config = read_json(CONFIG_FILE)
+        return {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+    except Exception as e:
+        print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
+        return {}
+
+def load_or_rebuild_catalog(output_dir, tickers=None):
+    """
+    カタログを読み込み、空の場合は出力ディレクトリから再構築して保存する
+
+    Parameters:
+    output_dir (str): 株価データの出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書（省略時は設定ファイルから読み込む）
+    """
+    catalog = load_catalog(output_dir)
+    if tickers is None:
+        tickers = load_config_tickers()
+    if not catalog["symbols"] and os.path.isdir(output_dir):
+        catalog = rebuild_catalog(output_dir, tickers)
+        save_catalog(catalog, output_dir)
+    return catalog
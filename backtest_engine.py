@@ -0,0 +1,250 @@
+import os
+import sys
+import time
+import itertools
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog
+from price_store import read_prices, resolve_interval
+from file_lock import file_lock, atomic_path
+
+# 一度にバックテストする銘柄の数（メモリ使用量はおよそ パラメータ数 × 期間数 × この値）
+CHUNK_SIZE = 128
+
+# 売買1回あたりの取引コスト（片道、約定金額に対する割合）
+DEFAULT_COST = 0.0005
+
+# 休場日の前の終値で埋める最大の足の数（それ以上の欠損はリターンを計算しない）
+FILL_LIMIT = 5
+
+# 年率換算に使う1年あたりの足の数
+PERIODS_PER_YEAR = {
+    "日足": 252,
+    "週足": 52,
+    "月足": 12
+}
+
+def load_close_panel(output_dir, catalog, symbols, interval="日足"):
+    """
+    銘柄の終値を共通の日付に揃えた行列として読み込む
+
+    Returns:
+    tuple: (終値の行列（行=日付・列=銘柄、データのない日はNaN）, 日付のDatetimeIndex, 読み込めた銘柄のリスト)
+    """
+    series = {}
+    for symbol in symbols:
+        df = read_prices(output_dir, symbol, interval, catalog)
+        if df is None or df.empty or 'Close' not in df.columns:
+            print(f"警告: {symbol} の{resolve_interval(interval)}データがありません。スキップします。")
+            continue
+        index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+        closes = pd.Series(df['Close'].to_numpy(dtype=float), index=index.normalize())
+        series[symbol] = closes[~closes.index.duplicated(keep='last')]
+
+    if not series:
+        return np.empty((0, 0)), pd.DatetimeIndex([]), []
+    panel = pd.DataFrame(series).sort_index()
+    # 休場日は前の終値で埋める（FILL_LIMIT 本まで。上場前・データ終了後は欠損のまま）
+    panel = panel.ffill(limit=FILL_LIMIT).where(panel.bfill().notna())
+    return panel.to_numpy(dtype=np.float64), panel.index, list(panel.columns)
+
+def rolling_means(prices, windows):
+    """
+    複数の期間の単純移動平均をまとめて計算する（累積和を使うため期間の長さに依存しない）
+
+    Parameters:
+    prices (np.ndarray): 終値の行列（行=日付・列=銘柄）
+    windows (list): 移動平均の期間のリスト
+
+    Returns:
+    np.ndarray: 移動平均（期間 × 日付 × 銘柄、期間に満たない部分はNaN）
+    """
+    valid = ~np.isnan(prices)
+    zeros = np.zeros((1, prices.shape[1]))
+    sums = np.vstack([zeros, np.cumsum(np.where(valid, prices, 0.0), axis=0)])
+    counts = np.vstack([zeros, np.cumsum(valid, axis=0)])
+
+    means = np.full((len(windows),) + prices.shape, np.nan)
+    for k, w in enumerate(windows):
+        if w > prices.shape[0]:
+            continue
+        total = sums[w:] - sums[:-w]
+        count = counts[w:] - counts[:-w]
+        with np.errstate(invalid='ignore'):
+            means[k, w - 1:] = np.where(count == w, total / w, np.nan)
+    return means
+
+def sma_cross_signals(prices, params):
+    """短期移動平均が長期移動平均を上回っている間は買い持ちにする（パラメータ: (短期, 長期)）"""
+    windows = sorted({w for pair in params for w in pair})
+    position = {w: k for k, w in enumerate(windows)}
+    means = rolling_means(prices, windows)
+    fast = means[[position[f] for f, _ in params]]
+    slow = means[[position[s] for _, s in params]]
+    return fast > slow
+
+def momentum_signals(prices, params):
+    """一定期間前より終値が高い間は買い持ちにする（パラメータ: (期間,)）"""
+    signals = np.zeros((len(params),) + prices.shape, dtype=bool)
+    for k, (lookback,) in enumerate(params):
+        if lookback < prices.shape[0]:
+            with np.errstate(invalid='ignore'):
+                signals[k, lookback:] = prices[lookback:] > prices[:-lookback]
+    return signals
+
+# 売買ルール名 → (シグナル関数, 既定のパラメータの組)
+RULES = {
+    "sma_cross": (sma_cross_signals,
+                  [(f, s) for f, s in itertools.product([5, 10, 20, 50], [20, 50, 100, 200]) if f < s]),
+    "momentum": (momentum_signals, [(w,) for w in [20, 60, 120, 250]])
+}
+
+def run_backtest(prices, signals, cost=DEFAULT_COST, periods_per_year=252):
+    """
+    シグナルから全パラメータ × 全銘柄の損益を一度に計算する
+
+    シグナルは足の終値で判定し、次の足から持ち高に反映する。
+
+    Parameters:
+    prices (np.ndarray): 終値の行列（日付 × 銘柄）
+    signals (np.ndarray): 買い持ちするかどうか（パラメータ × 日付 × 銘柄）
+    cost (float): 売買1回あたりの取引コスト
+    periods_per_year (int): 年率換算に使う1年あたりの足の数
+
+    Returns:
+    tuple: (統計量の辞書（各値はパラメータ × 銘柄の配列）, 戦略の各足のリターン, 資産推移)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = prices[1:] / prices[:-1] - 1
+    valid = np.vstack([np.zeros((1, prices.shape[1]), dtype=bool), ~np.isnan(returns)])
+    returns = np.vstack([np.zeros((1, prices.shape[1])), np.nan_to_num(returns)])
+
+    position = np.zeros(signals.shape)
+    position[:, 1:] = signals[:, :-1]
+    position *= valid
+    turnover = np.abs(np.diff(position, axis=1, prepend=0.0))
+
+    strategy = position * returns - turnover * cost
+    equity = np.cumprod(1 + strategy, axis=1)
+
+    n = valid.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = strategy.sum(axis=1) / n
+        std = np.sqrt(((strategy - mean[:, None, :]) ** 2 * valid).sum(axis=1) / (n - 1))
+        total = equity[:, -1] - 1
+        stats = {
+            "total_return": total,
+            "cagr": (1 + total) ** (periods_per_year / n) - 1,
+            "volatility": std * np.sqrt(periods_per_year),
+            "sharpe": mean / std * np.sqrt(periods_per_year),
+            "max_drawdown": (equity / np.maximum.accumulate(equity, axis=1) - 1).min(axis=1),
+            "trades": (np.diff(position, axis=1) > 0).sum(axis=1),
+            "exposure": position.sum(axis=1) / n
+        }
+    return stats, strategy, equity
+
+def backtest_universe(output_dir, tickers, rule, params=None, interval="日足", cost=DEFAULT_COST):
+    """
+    全銘柄 × パラメータの組をバックテストする（銘柄を CHUNK_SIZE ずつに分けて計算する）
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    rule (str): 売買ルール名（RULES のキー）
+    params (list): パラメータの組のリスト（省略時はルールの既定値）
+    interval (str): 使用する足（日足・週足・月足）
+    cost (float): 売買1回あたりの取引コスト
+
+    Returns:
+    tuple: (銘柄 × パラメータごとの統計量, パラメータごとの等金額ポートフォリオの資産推移)
+    """
+    signal_function, default_params = RULES[rule]
+    params = params or default_params
+    periods_per_year = PERIODS_PER_YEAR.get(resolve_interval(interval), 252)
+
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    prices, dates, symbols = load_close_panel(output_dir, catalog, list(tickers), interval)
+    if not symbols:
+        return pd.DataFrame(), pd.DataFrame()
+
+    results = []
+    # 等金額ポートフォリオ：各足でデータのある銘柄のリターンを平均する
+    portfolio_sum = np.zeros((len(params), len(dates)))
+    portfolio_count = np.zeros(len(dates))
+
+    start_time = time.time()
+    for start in range(0, len(symbols), CHUNK_SIZE):
+        block = prices[:, start:start + CHUNK_SIZE]
+        stats, strategy, _ = run_backtest(block, signal_function(block, params), cost, periods_per_year)
+
+        with np.errstate(invalid='ignore'):
+            active = np.vstack([np.zeros((1, block.shape[1]), dtype=bool), ~np.isnan(block[1:] / block[:-1])])
+        portfolio_sum += (strategy * active).sum(axis=2)
+        portfolio_count += active.sum(axis=1)
+
+        chunk_symbols = symbols[start:start + block.shape[1]]
+        for k, param in enumerate(params):
+            frame = pd.DataFrame({key: value[k] for key, value in stats.items()})
+            frame.insert(0, "Param", str(param))
+            frame.insert(0, "Symbol", chunk_symbols)
+            results.append(frame)
+    elapsed = time.time() - start_time
+
+    combinations = len(params) * len(symbols)
+    print(f"{combinations}通り（{len(symbols)}銘柄 × {len(params)}パラメータ × {len(dates)}本）を"
+          f"{elapsed:.2f}秒で計算しました（{combinations / max(elapsed, 1e-9):,.0f}通り/秒）")
+
+    stats = pd.concat(results, ignore_index=True)
+    stats.insert(1, "Name", stats["Symbol"].map(tickers))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        portfolio_returns = np.where(portfolio_count > 0, portfolio_sum / portfolio_count, 0.0)
+    equity = pd.DataFrame(np.cumprod(1 + portfolio_returns, axis=1).T,
+                          index=dates, columns=[str(p) for p in params])
+    equity.index.name = "Date"
+    return stats, equity
+
+def main():
+    """
+    メイン関数：設定ファイルの全銘柄をバックテストしてCSVに保存する
+
+    使い方: python backtest_engine.py [ルール名] [-interval 週足] [-cost 0.001]
+    ルール名は sma_cross（既定）または momentum
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    args = sys.argv[1:]
+    rule = args[0] if args and not args[0].startswith("-") else "sma_cross"
+    if rule not in RULES:
+        print(f"エラー: 売買ルール {rule} はありません。{', '.join(RULES)} から指定してください。")
+        return
+    interval = args[args.index("-interval") + 1] if "-interval" in args[:-1] else "日足"
+    cost = float(args[args.index("-cost") + 1]) if "-cost" in args[:-1] else DEFAULT_COST
+
+    print("===== バックテスト =====")
+    print(f"ルール: {rule}  足: {resolve_interval(interval)}  取引コスト: {cost}")
+    stats, equity = backtest_universe(output_dir, tickers, rule, interval=interval, cost=cost)
+    if stats.empty:
+        print("バックテストできる銘柄がありません。")
+        return
+
+    stats_csv = os.path.join(output_dir, f"バックテスト_{rule}_統計.csv")
+    with file_lock(stats_csv), atomic_path(stats_csv) as tmp_path:
+        stats.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    print(f"統計量を保存しました: {stats_csv}")
+
+    equity_csv = os.path.join(output_dir, f"バックテスト_{rule}_資産推移.csv")
+    with file_lock(equity_csv), atomic_path(equity_csv) as tmp_path:
+        equity.to_csv(tmp_path, encoding='utf-8-sig')
+    print(f"資産推移を保存しました: {equity_csv}")
+
+    # パラメータごとの平均（全銘柄）
+    summary = stats.groupby("Param")[["cagr", "sharpe", "max_drawdown"]].mean()
+    print(summary.sort_values("sharpe", ascending=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import frame_backend
+from benchmark_rolling import measure
+from price_store import JAPANESE_COLUMNS, read_price_csv, resample_ohlcv, resample_universe
+from create_quarterly_data import monthly_to_quarterly_universe
+from create_yearly_data_fixed import monthly_to_yearly_universe
+
+# 比較する足の変換（週足・月足・四半期足・年足）
+RULES = ["W", "ME", "QE", "YE"]
+
+# 取引所のタイムゾーン（東京証券取引所を想定）
+TIMEZONE = "Asia/Tokyo"
+
+def make_prices(n_rows, seed):
+    """日足データ（英語カラム名・タイムゾーン付きの日時インデックス）を作成する"""
+    rng = np.random.default_rng(seed)
+    dates = pd.bdate_range("1990-01-01", periods=n_rows, tz=TIMEZONE, name='Date')
+    close = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, n_rows)))
+    open_ = close * np.exp(rng.normal(0, 0.005, n_rows))
+    dividends = np.where(rng.random(n_rows) < 0.01, rng.random(n_rows) * 10, 0.0)
+    return pd.DataFrame({
+        'Open': open_,
+        'High': np.maximum(open_, close) * (1 + rng.random(n_rows) * 0.01),
+        'Low': np.minimum(open_, close) * (1 - rng.random(n_rows) * 0.01),
+        'Close': close,
+        'Volume': rng.integers(1000, 10 ** 7, n_rows),
+        'Dividends': dividends,
+        'Stock Splits': 0.0
+    }, index=dates)
+
+def write_universe(folder, n_files, n_rows):
+    """パイプラインと同じ形式（日本語カラム名）のCSVファイルを作成する"""
+    paths = []
+    for i in range(n_files):
+        path = os.path.join(folder, f"{i:04d}_日足.csv")
+        make_prices(n_rows, i).rename(columns=JAPANESE_COLUMNS).to_csv(path, encoding='utf-8-sig')
+        paths.append(path)
+    return paths
+
+def same_frames(left, right):
+    """2つの結果のデータフレームが値・型・インデックスまで一致するかどうか（インデックスの freq 属性は比べない）"""
+    if len(left) != len(right):
+        return False
+    try:
+        for a, b in zip(left, right):
+            pd.testing.assert_frame_equal(a, b, check_exact=True, check_freq=False)
+    except AssertionError:
+        return False
+    return True
+
+def run_benchmark(n_files, n_rows, repeat=3):
+    """
+    CSVの読み込み・足の変換をpandasとpolarsの実装で比較する
+
+    Parameters:
+    n_files (int): 銘柄（CSVファイル）の数
+    n_rows (int): 1銘柄あたりの日足の本数
+    repeat (int): 繰り返す回数（最短の時間を使う）
+
+    Returns:
+    pd.DataFrame: 処理ごとの実行時間と結果の一致
+    """
+    folder = tempfile.mkdtemp(prefix="benchmark_backend_")
+    try:
+        paths = write_universe(folder, n_files, n_rows)
+        frames = {path: read_price_csv(path, TIMEZONE) for path in paths}
+        monthly = {path: resample_ohlcv(df, "MS") for path, df in frames.items()}
+
+        # 足の変換はパイプラインと同じく全銘柄をまとめて変換する（polarsでは1回の集計になる）
+        cases = {"CSVの読み込み": lambda: [read_price_csv(path, TIMEZONE) for path in paths]}
+        for rule in RULES:
+            cases[f"足の変換 {rule}"] = lambda rule=rule: list(resample_universe(frames, rule).values())
+        cases["四半期足（月足から）"] = lambda: list(monthly_to_quarterly_universe(monthly).values())
+        cases["年足（月足から）"] = lambda: list(monthly_to_yearly_universe(monthly).values())
+
+        rows = []
+        for name, function in cases.items():
+            frame_backend.set_backend("pandas")
+            pandas_time, expected = measure(function, repeat)
+            row = {"処理": name, "pandas(ms)": pandas_time * 1000}
+            if frame_backend.pl is not None:
+                frame_backend.set_backend("polars")
+                polars_time, result = measure(function, repeat)
+                row["polars(ms)"] = polars_time * 1000
+                row["polars倍率"] = pandas_time / polars_time
+                row["polars一致"] = same_frames(result, expected)
+            rows.append(row)
+        return pd.DataFrame(rows)
+    finally:
+        frame_backend.set_backend(frame_backend.DEFAULT_BACKEND)
+        shutil.rmtree(folder, ignore_errors=True)
+
+def main():
+    """
+    メイン関数：ベンチマークを実行して結果を表示する
+
+    使い方: python benchmark_backend.py [銘柄数] [本数]（既定は 200銘柄 × 5000本）
+    """
+    n_files = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n_rows = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+    print("===== 計算処理（pandas・polars）のベンチマーク =====")
+    print(f"データ: {n_files}銘柄 × {n_rows}本  polars: {'あり' if frame_backend.pl is not None else 'なし（pandasのみ計測）'}"
+          f"  CPU: {os.cpu_count()}")
+    result = run_benchmark(n_files, n_rows)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.2f}'.format):
+        print(result.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import rolling_kernels
+
+# 比較する窓の長さ（20日高値・60日平均・1年高値などを想定）
+WINDOWS = [5, 20, 60, 250]
+
+def measure(function, repeat=3):
+    """関数を繰り返し実行して最短の実行時間（秒）と結果を返す"""
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def run_benchmark(n_rows, n_cols, windows=WINDOWS):
+    """
+    移動窓の計算をpandasのrollingと比較する
+
+    Parameters:
+    n_rows (int): 時系列の長さ（日足の本数）
+    n_cols (int): 銘柄の数
+    windows (list): 窓の長さのリスト
+
+    Returns:
+    pd.DataFrame: 計算ごとの実行時間と結果の一致
+    """
+    rng = np.random.default_rng(0)
+    prices = 1000 * np.exp(np.cumsum(rng.normal(0, 0.02, size=(n_rows, n_cols)), axis=0))
+    # 上場前の期間を想定して一部の銘柄の先頭を欠損にする
+    prices[:n_rows // 10, ::7] = np.nan
+    frame = pd.DataFrame(prices)
+
+    engines = {"numpy": False}
+    if rolling_kernels.USE_NUMBA:
+        engines["numba"] = True
+        # JITコンパイルの時間は計測に含めない
+        rolling_kernels.rolling_max(prices[:10], 2, use_numba=True)
+        rolling_kernels.rolling_mean(prices[:10], 2, use_numba=True)
+        rolling_kernels.rolling_var(prices[:10], 2, use_numba=True)
+
+    cases = {
+        "max": (lambda w, u: rolling_kernels.rolling_max(prices, w, u), lambda w: frame.rolling(w).max()),
+        "min": (lambda w, u: rolling_kernels.rolling_min(prices, w, u), lambda w: frame.rolling(w).min()),
+        "mean": (lambda w, u: rolling_kernels.rolling_mean(prices, w, u), lambda w: frame.rolling(w).mean()),
+        "var": (lambda w, u: rolling_kernels.rolling_var(prices, w, use_numba=u), lambda w: frame.rolling(w).var())
+    }
+
+    rows = []
+    for window in windows:
+        for name, (kernel, reference) in cases.items():
+            pandas_time, expected = measure(lambda: reference(window))
+            row = {"計算": name, "窓": window, "pandas(ms)": pandas_time * 1000}
+            for engine, use_numba in engines.items():
+                kernel_time, result = measure(lambda: kernel(window, use_numba))
+                row[f"{engine}(ms)"] = kernel_time * 1000
+                row[f"{engine}倍率"] = pandas_time / kernel_time
+                # pandasの移動分散は逐次更新の誤差を含むため、相対誤差1e-4までを一致とみなす
+                row[f"{engine}一致"] = np.allclose(result, expected.to_numpy(), rtol=1e-4, equal_nan=True)
+            rows.append(row)
+
+    pandas_time, expected = measure(lambda: (frame / frame.cummax() - 1).min())
+    row = {"計算": "max_drawdown", "窓": n_rows, "pandas(ms)": pandas_time * 1000}
+    kernel_time, result = measure(lambda: rolling_kernels.max_drawdown(prices))
+    row["numpy(ms)"] = kernel_time * 1000
+    row["numpy倍率"] = pandas_time / kernel_time
+    row["numpy一致"] = np.allclose(result, expected.to_numpy(), equal_nan=True)
+    rows.append(row)
+    return pd.DataFrame(rows)
+
+def main():
+    """
+    メイン関数：ベンチマークを実行して結果を表示する
+
+    使い方: python benchmark_rolling.py [本数] [銘柄数]（既定は 5000本 × 500銘柄）
+    """
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    n_cols = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+
+    print("===== 移動窓カーネルのベンチマーク =====")
+    print(f"データ: {n_rows}本 × {n_cols}銘柄  Numba: {'あり' if rolling_kernels.USE_NUMBA else 'なし（NumPy・pandasで計算）'}")
+    result = run_benchmark(n_rows, n_cols)
+    with pd.option_context('display.width', 200, 'display.float_format', '{:.2f}'.format):
+        print(result.to_string(index=False))
+
+if __name__ == "__main__":
+    main()
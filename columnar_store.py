@@ -0,0 +1,244 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from artifact_catalog import make_safe_ticker
+from file_lock import file_lock, get_tmp_path
+
+# 列ごとのバイナリファイルを置くフォルダ（出力ディレクトリ内）
+STORE_DIR_NAME = "store"
+
+# メタ情報のファイル名
+STORE_META_FILE = "meta.json"
+
+# 保存形式のバージョン（2から列の型をそのまま保存する。1は全ての列を浮動小数で保存していた）
+STORE_FORMAT_VERSION = 2
+
+# 日時の列のファイル名（UTCの1970年からのナノ秒）
+DATE_COLUMN = "Date"
+
+def get_store_dir(output_dir, symbol, interval):
+    """銘柄・期間の列ファイルを置くフォルダのパスを返す"""
+    return os.path.join(output_dir, STORE_DIR_NAME, make_safe_ticker(symbol), interval)
+
+def get_column_file(column):
+    return column.replace(' ', '_') + ".npy"
+
+def compute_checksum(arrays):
+    """列の配列（列名の順）からチェックサムを計算する"""
+    digest = hashlib.sha1()
+    for name, values in arrays:
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+def column_values(values):
+    """
+    列を保存する配列に変換する
+
+    整数・浮動小数・真偽値の列は元の型のまま保存し（CSVから読んだ場合と同じ型で読み込むため）、
+    それ以外の列は数値に変換して浮動小数で保存する。
+    """
+    values = pd.Series(values)
+    if isinstance(values.dtype, np.dtype) and values.dtype.kind in 'iufb':
+        return values.to_numpy()
+    return pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64)
+
+def frame_to_arrays(df):
+    """
+    データフレームを保存する列の配列に変換する（列の型はそのまま保存する）
+
+    Returns:
+    tuple: ([(列名, 配列)], タイムゾーン名)
+    """
+    index = pd.DatetimeIndex(df.index)
+    timezone = str(index.tz) if index.tz is not None else None
+    if index.tz is not None:
+        index = index.tz_convert("UTC").tz_localize(None)
+    arrays = [(DATE_COLUMN, index.as_unit('ns').asi8.astype(np.int64))]
+    for col in df.columns:
+        arrays.append((col, column_values(df[col])))
+    return arrays, timezone
+
+def write_arrays(store_dir, arrays, timezone=None, source=None):
+    """
+    列の配列をフォルダに保存する
+
+    一時フォルダに書き込んでから置き換えるため、書き込み途中のデータを読むことはない。
+
+    Parameters:
+    store_dir (str): 保存先のフォルダ
+    arrays (list): [(列名, 配列)]（最初の列は日時のナノ秒）
+    timezone (str): 読み込み時に変換するタイムゾーン
+    source (dict): 元データの情報（CSVのパス・バージョンなど）
+
+    Returns:
+    dict: 保存したメタ情報
+    """
+    # 一時フォルダと退避先はプロセス・スレッドごとに別の名前にする（同時に書き込んでも衝突しない）
+    tmp_dir = get_tmp_path(store_dir)
+    old_dir = tmp_dir + ".old"
+    try:
+        os.makedirs(tmp_dir)
+        for name, values in arrays:
+            np.save(os.path.join(tmp_dir, get_column_file(name)), np.ascontiguousarray(values))
+
+        dates = arrays[0][1]
+        meta = {
+            "format_version": STORE_FORMAT_VERSION,
+            "columns": [name for name, _ in arrays[1:]],
+            "dtypes": {name: str(values.dtype) for name, values in arrays[1:]},
+            "rows": int(len(dates)),
+            "timezone": timezone,
+            "start": int(dates[0]) if len(dates) else None,
+            "end": int(dates[-1]) if len(dates) else None,
+            "checksum": compute_checksum(arrays),
+            "source": source or {},
+            "written": datetime.now().isoformat(timespec='seconds')
+        }
+        with open(os.path.join(tmp_dir, STORE_META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # 既存のフォルダは退避してから置き換える（Windowsではフォルダを上書きできないため）
+        # 置き換えの間はフォルダが存在しないため、読み込み（read_arrays）が待つようにロックする
+        with file_lock(store_dir):
+            if os.path.exists(store_dir):
+                os.replace(store_dir, old_dir)
+            os.replace(tmp_dir, store_dir)
+    finally:
+        for path in (tmp_dir, old_dir):
+            if os.path.exists(path):
+                shutil.rmtree(path, ignore_errors=True)
+    return meta
+
+def write_frame(store_dir, df, source=None):
+    """英語カラム名・日時インデックスのデータフレームを保存する"""
+    arrays, timezone = frame_to_arrays(df)
+    return write_arrays(store_dir, arrays, timezone, source)
+
+def read_meta(store_dir):
+    """メタ情報を読み込む（存在しない場合はNone）"""
+    path = os.path.join(store_dir, STORE_META_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def read_arrays(store_dir, columns=None, mmap=True):
+    """
+    列の配列を読み込む（既定ではメモリマップで開くため、使う部分だけが読み込まれる）
+
+    Parameters:
+    store_dir (str): 保存先のフォルダ
+    columns (list): 読み込む列（省略時は全列）
+    mmap (bool): メモリマップで開くかどうか
+
+    Returns:
+    tuple: (メタ情報, 日時のナノ秒の配列, {列名: 配列})
+    """
+    # 書き込み側がフォルダを置き換えている間は待つ（開いた後のファイルは置き換えられても読める）
+    with file_lock(store_dir, shared=True):
+        meta = read_meta(store_dir)
+        if meta is None:
+            raise FileNotFoundError(f"保存データがありません: {store_dir}")
+        mode = 'r' if mmap else None
+        dates = np.load(os.path.join(store_dir, get_column_file(DATE_COLUMN)), mmap_mode=mode)
+        names = meta["columns"] if columns is None else [c for c in columns if c in meta["columns"]]
+        values = {name: np.load(os.path.join(store_dir, get_column_file(name)), mmap_mode=mode) for name in names}
+    return meta, dates, values
+
+def read_frame(store_dir, columns=None, start=None, end=None):
+    """
+    保存データをデータフレームとして読み込む
+
+    日時は昇順に並んでいるため、期間を指定した場合は二分探索で必要な行だけを取り出す。
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックスのデータフレーム
+    """
+    meta, dates, values = read_arrays(store_dir, columns)
+    first, last = 0, len(dates)
+    timezone = meta.get("timezone")
+    if start is not None:
+        first = int(np.searchsorted(dates, to_utc_ns(start, timezone), side='left'))
+    if end is not None:
+        end_ts = pd.Timestamp(end)
+        # 終了日はその日の終わりまでを含める
+        if end_ts == end_ts.normalize():
+            end_ts = end_ts + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        last = int(np.searchsorted(dates, to_utc_ns(end_ts, timezone), side='right'))
+
+    # メモリマップから必要な範囲だけをコピーする（ファイルを開いたままにしないため）
+    index = pd.DatetimeIndex(np.array(dates[first:last]).view('datetime64[ns]'), name='Date')
+    if timezone:
+        index = index.tz_localize("UTC").tz_convert(timezone)
+    data = {name: np.array(column[first:last]) for name, column in values.items()}
+    return pd.DataFrame(data, index=index)
+
+def to_utc_ns(value, timezone):
+    """日時を保存データと比較できるUTCのナノ秒に変換する"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None and timezone:
+        ts = ts.tz_localize(timezone)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert("UTC").tz_localize(None)
+    return ts.as_unit('ns').value
+
+def verify_store(store_dir):
+    """
+    保存データを読み直して行数とチェックサムを確認する
+
+    Returns:
+    tuple: (問題がないかどうか, メッセージ)
+    """
+    meta, dates, values = read_arrays(store_dir, mmap=False)
+    arrays = [(DATE_COLUMN, dates)] + [(name, values[name]) for name in meta["columns"]]
+    lengths = {len(a) for _, a in arrays}
+    if lengths != {meta["rows"]}:
+        return False, f"行数が一致しません（メタ情報: {meta['rows']}、列: {sorted(lengths)}）"
+    if compute_checksum(arrays) != meta["checksum"]:
+        return False, "チェックサムが一致しません"
+    return True, f"{meta['rows']}行"
+
+def register_store(catalog, symbol, interval, store_dir, output_dir, meta):
+    """
+    保存データをカタログの成果物（CSV）のエントリに登録する
+
+    元のCSVのバージョンを記録しておき、CSVが書き直された（バージョンが変わった）場合は
+    保存データを使わないようにする。
+    """
+    artifact = catalog["symbols"][symbol]["artifacts"][interval]
+    artifact["store"] = {
+        "path": os.path.relpath(os.path.abspath(store_dir), os.path.abspath(output_dir)),
+        "source_version": artifact.get("version"),
+        "rows": meta["rows"],
+        "checksum": meta["checksum"],
+        "format_version": meta.get("format_version")
+    }
+    return artifact["store"]
+
+def lookup_store(catalog, symbol, interval, output_dir):
+    """
+    銘柄・期間の最新の保存データのフォルダを返す
+
+    Returns:
+    str: フォルダのパス（未登録・CSVより古い・古い保存形式・存在しない場合はNone）
+    """
+    artifact = catalog["symbols"].get(symbol, {}).get("artifacts", {}).get(interval)
+    if not artifact or "store" not in artifact:
+        return None
+    store = artifact["store"]
+    if store.get("source_version") != artifact.get("version"):
+        return None
+    # 古い保存形式は出来高などの整数の列も浮動小数になっているため使わない（CSVを読む）
+    if store.get("format_version") != STORE_FORMAT_VERSION:
+        return None
+    store_dir = os.path.join(output_dir, store["path"])
+    if not os.path.exists(os.path.join(store_dir, STORE_META_FILE)):
+        return None
+    return store_dir
@@ -0,0 +1,183 @@
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog, lookup_entry, lookup_artifact, register_artifact, save_catalog
+from columnar_store import read_meta, register_store
+from file_lock import file_lock, atomic_path
+from csv_compression import (resolve_compression, get_csv_suffix, get_compression_method, strip_csv_suffix,
+                             compress_bytes, decompress_bytes, read_csv_bytes, round_float_columns)
+
+def compress_file(csv_path, compression, float_precision=None):
+    """
+    1つのCSVファイルを圧縮する（別プロセスで実行する）
+
+    小数の有効桁数を指定した場合は数値を丸めて書き直し、指定しない場合は元の内容をそのまま圧縮する。
+    圧縮したデータを展開して行数（丸めない場合は内容）が元と一致することを確認してから元のファイルを削除する。
+
+    Returns:
+    dict: 結果（ok・新しいパス・圧縮前後のバイト数・所要時間・メッセージ）
+    """
+    started = time.time()
+    new_path = strip_csv_suffix(csv_path) + get_csv_suffix(compression)
+    result = {"csv_path": csv_path, "new_path": new_path, "ok": False, "old_bytes": os.path.getsize(csv_path)}
+    try:
+        # 元のファイルと圧縮後のファイルをロックし、書き出し（exporter）と同時に置き換えないようにする
+        with file_lock(csv_path), file_lock(new_path):
+            data = read_csv_bytes(csv_path)
+            if float_precision:
+                df = pd.read_csv(io.BytesIO(data), index_col=0, encoding='utf-8-sig')
+                buffer = io.BytesIO()
+                round_float_columns(df, float_precision).to_csv(buffer, encoding='utf-8-sig')
+                content = buffer.getvalue()
+            else:
+                content = data
+
+            # 展開して元のデータと比べてから、一時ファイルとの置き換えで書き込む
+            compressed = compress_bytes(content, compression)
+            restored = decompress_bytes(compressed, compression)
+            if restored.count(b'\n') != data.count(b'\n') or (not float_precision and restored != data):
+                result["message"] = "圧縮後のデータが元のファイルと一致しません"
+                return result
+
+            with atomic_path(new_path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+            if new_path != csv_path:
+                os.remove(csv_path)
+        result.update(ok=True, new_bytes=os.path.getsize(new_path), message="")
+    except Exception as e:
+        result["message"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.time() - started
+    return result
+
+def collect_tasks(catalog, output_dir, compression, float_precision=None):
+    """
+    カタログから圧縮するCSVファイルを集める
+
+    既に指定した形式で圧縮されているファイルは、桁数を変える場合を除いて対象にしない。
+
+    Returns:
+    list: (シンボル, 期間, CSVファイルのパス) のリスト
+    """
+    tasks = []
+    for symbol, entry in catalog["symbols"].items():
+        for interval, artifact in entry.get("artifacts", {}).items():
+            if strip_csv_suffix(artifact.get("path", "")) is None:
+                continue
+            csv_path = lookup_artifact(catalog, symbol, interval, output_dir)
+            if csv_path is None or not os.path.isfile(csv_path):
+                continue
+            if get_compression_method(csv_path) == compression and not float_precision:
+                continue
+            tasks.append((symbol, interval, csv_path))
+    return tasks
+
+def reregister(catalog, symbol, interval, new_path, output_dir, lossless):
+    """
+    圧縮したファイルをカタログに登録し直す
+
+    データの範囲は変わらないため以前のエントリの行数・期間を引き継ぐ。
+    内容を変えずに圧縮した場合は、列ファイルも新しいバージョンに対応するものとして登録し直す。
+    """
+    previous = lookup_entry(catalog, symbol, interval) or {}
+    register_artifact(catalog, symbol, interval, new_path, output_dir,
+                      previous.get("rows"), previous.get("start"), previous.get("end"))
+    store = previous.get("store")
+    if lossless and store and store.get("source_version") == previous.get("version"):
+        store_dir = os.path.join(output_dir, store["path"])
+        meta = read_meta(store_dir)
+        if meta is not None:
+            register_store(catalog, symbol, interval, store_dir, output_dir, meta)
+
+def compress_archive(output_dir, tickers, compression, float_precision=None, workers=None):
+    """
+    出力ディレクトリのCSVファイルを並列に圧縮し、カタログに登録し直す
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    compression (str): "gzip" または "zstd"
+    float_precision (int): 小数の有効桁数（省略時は数値を変えずに圧縮する）
+    workers (int): 並列に処理するプロセスの数（省略時はCPUの数）
+
+    Returns:
+    list: ファイルごとの圧縮結果
+    """
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    tasks = collect_tasks(catalog, output_dir, compression, float_precision)
+    if not tasks:
+        print("圧縮が必要なファイルはありません。")
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(tasks)}個のファイルを{workers}プロセスで圧縮します（{compression}）...")
+    started = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(compress_file, csv_path, compression, float_precision): (symbol, interval)
+                   for symbol, interval, csv_path in tasks}
+        for future in as_completed(futures):
+            symbol, interval = futures[future]
+            result = future.result()
+            result.update(symbol=symbol, interval=interval)
+            results.append(result)
+            if result["ok"]:
+                reregister(catalog, symbol, interval, result["new_path"], output_dir, lossless=not float_precision)
+                print(f"  {symbol} {interval}: {result['old_bytes'] / 1024:.0f}KB → "
+                      f"{result['new_bytes'] / 1024:.0f}KB（{result['seconds']:.2f}秒）")
+            else:
+                print(f"  エラー: {symbol} {interval}: {result.get('message')}")
+
+    save_catalog(catalog, output_dir)
+
+    elapsed = time.time() - started
+    succeeded = [r for r in results if r["ok"]]
+    old_bytes = sum(r["old_bytes"] for r in succeeded)
+    new_bytes = sum(r["new_bytes"] for r in succeeded)
+    print(f"\n圧縮完了: {len(succeeded)}/{len(results)}ファイル、"
+          f"{old_bytes / 1024 / 1024:.1f}MB → {new_bytes / 1024 / 1024:.1f}MB"
+          f"（{new_bytes / max(old_bytes, 1):.1%}）を{elapsed:.1f}秒で処理しました"
+          f"（{old_bytes / 1024 / 1024 / max(elapsed, 1e-9):.1f}MB/秒）")
+    return results
+
+def main():
+    """
+    メイン関数：既存のCSVファイルを圧縮する
+
+    使い方: python compress_archive.py [-gzip | -zstd] [-precision 8] [-workers 8]
+    （形式・桁数を省略した場合は設定ファイルの csv_compression・csv_float_precision を使う）
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    args = sys.argv[1:]
+    if "-zstd" in args:
+        compression = "zstd"
+    elif "-gzip" in args:
+        compression = "gzip"
+    else:
+        compression = config.get("csv_compression") or "gzip"
+    compression = resolve_compression(compression)
+    if compression is None:
+        print("エラー: 圧縮形式を指定してください（-gzip または -zstd）")
+        sys.exit(1)
+    float_precision = int(args[args.index("-precision") + 1]) if "-precision" in args[:-1] else config.get("csv_float_precision")
+    workers = int(args[args.index("-workers") + 1]) if "-workers" in args[:-1] else None
+
+    print("===== CSVファイルの圧縮 =====")
+    print(f"出力ディレクトリ: {output_dir}")
+    if float_precision:
+        print(f"小数の有効桁数: {float_precision}")
+    results = compress_archive(output_dir, tickers, compression, float_precision, workers)
+    if any(not r["ok"] for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
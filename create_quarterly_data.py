@@ -1,149 +1,147 @@
 import os
+import sys
 import pandas as pd
-import glob
 from datetime import datetime
+from artifact_catalog import load_or_rebuild_catalog, save_catalog, symbols_with, get_base_name
+from price_store import JAPANESE_COLUMNS, OHLCV_AGGREGATION, read_price_csv
+from stage_exchange import write_stage, export_stage_csv, load_use_japanese_columns
+from csv_compression import strip_csv_suffix
+from aggregate_cache import get_aggregate, get_aggregates
+from frame_backend import use_polars, calendar_aggregate, calendar_aggregate_universe, load_backend_config
 
-def convert_monthly_to_quarterly(monthly_file_path):
+def monthly_to_quarterly(df_monthly):
     """
     月足データから四半期足データを作成する関数
+
+    四半期は取引所の現地時間の月で決める（UTCに変換すると1月の足が前年の10〜12月に入るため）。
+
+    Parameters:
+    df_monthly (pd.DataFrame): 英語カラム名・日時インデックスの月足データ
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックス（四半期の最初の月の1日）の四半期足データ
+    """
+    # 始値は最初の月、高値・安値は期間中の最大・最小、終値は最後の月、出来高・配当は合計
+    # （設定ファイルで polars を選んだ場合は polars で集計する。結果は pandas と同じ）
+    df_quarterly = calendar_aggregate(df_monthly, "quarter", OHLCV_AGGREGATION) if use_polars() else None
+    if df_quarterly is None:
+        years = df_monthly.index.year
+        quarters = (df_monthly.index.month - 1) // 3 + 1
+        aggregation = {col: how for col, how in OHLCV_AGGREGATION.items() if col in df_monthly.columns}
+        df_quarterly = df_monthly.groupby([years, quarters]).agg(aggregation)
+    return set_quarter_dates(df_quarterly)
+
+def set_quarter_dates(df_quarterly):
+    """（年, 四半期）のインデックスを四半期の日付（最初の月の1日）にする"""
+    df_quarterly.index = pd.DatetimeIndex(
+        [datetime(year, (quarter - 1) * 3 + 1, 1) for year, quarter in df_quarterly.index], name='Date')
+    return df_quarterly
+
+def monthly_to_quarterly_universe(frames):
+    """
+    複数銘柄の月足データをまとめて四半期足データに変換する
+
+    polarsで処理する設定の場合は全銘柄を1回の集計で変換する。
+
+    Parameters:
+    frames (dict): 銘柄 → 英語カラム名・日時インデックスの月足データ
+
+    Returns:
+    dict: 銘柄 → monthly_to_quarterly と同じ四半期足データ
+    """
+    aggregated = calendar_aggregate_universe(frames, "quarter", OHLCV_AGGREGATION) if use_polars() else None
+    if aggregated is None:
+        return {symbol: monthly_to_quarterly(df) for symbol, df in frames.items()}
+    return {symbol: set_quarter_dates(df) for symbol, df in aggregated.items()}
+
+def convert_monthly_to_quarterly(monthly_file_path):
+    """
+    月足データのCSVファイルから四半期足データを作成する関数
     
     Parameters:
     monthly_file_path (str): 月足データファイルのパス
     
     Returns:
-    pd.DataFrame: 四半期足データのデータフレーム
+    pd.DataFrame: 四半期足データのデータフレーム（カラム名は入力ファイルに合わせる）
     """
     # ファイル名から銘柄名を取得
     file_name = os.path.basename(monthly_file_path)
-    ticker_name = file_name.replace('_月足.csv', '')
-    
-    # 月足データの読み込み
-    df_monthly = pd.read_csv(monthly_file_path)
+    ticker_name = (strip_csv_suffix(file_name) or file_name).replace('_月足', '')
     
     # カラム名をチェックし、英語か日本語かを判断
-    if 'Open' in df_monthly.columns:
-        # 英語カラム名の場合
-        open_col = 'Open'
-        high_col = 'High'
-        low_col = 'Low'
-        close_col = 'Close'
-        volume_col = 'Volume'
-        dividend_col = 'Dividends'
-        split_col = 'Stock Splits'
-    else:
-        # 日本語カラム名の場合
-        open_col = '始値'
-        high_col = '高値'
-        low_col = '安値'
-        close_col = '終値'
-        volume_col = '出来高'
-        dividend_col = '配当'
-        split_col = '株式分割'
-    
-    # 日付をdatetime型に変換
-    df_monthly['Date'] = pd.to_datetime(df_monthly['Date'], utc=True)
-    
-    # 年と四半期の列を追加
-    df_monthly['Year'] = df_monthly['Date'].dt.year
-    df_monthly['Quarter'] = (df_monthly['Date'].dt.month - 1) // 3 + 1
-    
-    # 年と四半期でグループ化
-    quarterly_groups = df_monthly.groupby(['Year', 'Quarter'])
-    
-    # 四半期データの作成
-    quarterly_data = []
-    
-    for (year, quarter), group in quarterly_groups:
-        # 四半期の最初の月の始値を取得
-        open_price = group.iloc[0][open_col]
-        
-        # 四半期中の最高値
-        high_price = group[high_col].max()
-        
-        # 四半期中の最安値
-        low_price = group[low_col].min()
-        
-        # 四半期の最後の月の終値
-        close_price = group.iloc[-1][close_col]
-        
-        # 四半期の出来高の合計
-        volume = group[volume_col].sum()
-        
-        # 四半期の配当の合計
-        dividend = group[dividend_col].sum()
-        
-        # 株式分割情報（任意の処理方法）
-        # ここでは単純に最大値を取得
-        stock_split = group[split_col].max()
-        
-        # 四半期の日付（最初の月の日を1日にする）
-        quarter_start_month = (quarter - 1) * 3 + 1
-        quarter_date = datetime(year, quarter_start_month, 1)
-        
-        # 入力ファイルのカラム名の言語に合わせてデータを追加
-        if 'Open' in df_monthly.columns:
-            # 英語カラム名の場合
-            quarterly_data.append({
-                'Date': quarter_date,
-                'Open': open_price,
-                'High': high_price,
-                'Low': low_price,
-                'Close': close_price,
-                'Volume': volume,
-                'Dividends': dividend,
-                'Stock Splits': stock_split
-            })
-        else:
-            # 日本語カラム名の場合
-            quarterly_data.append({
-                'Date': quarter_date,
-                '始値': open_price,
-                '高値': high_price,
-                '安値': low_price,
-                '終値': close_price,
-                '出来高': volume,
-                '配当': dividend,
-                '株式分割': stock_split
-            })
-    
-    # データフレームに変換
-    df_quarterly = pd.DataFrame(quarterly_data)
-    
-    # 日付でソート
-    df_quarterly = df_quarterly.sort_values('Date')
-    
-    # データフレームのインデックスをリセット
-    df_quarterly = df_quarterly.reset_index(drop=True)
+    use_japanese_columns = '終値' in pd.read_csv(monthly_file_path, nrows=0).columns
     
+    df_quarterly = monthly_to_quarterly(read_price_csv(monthly_file_path)).reset_index()
+    if use_japanese_columns:
+        df_quarterly = df_quarterly.rename(columns=JAPANESE_COLUMNS)
     return df_quarterly, ticker_name
 
-def main():
+def create_quarterly_stage(data_folder, catalog, export_csv=False, use_japanese_columns=False):
     """
-    メイン関数：株価データフォルダの全ての月足データを四半期足に変換
+    カタログに登録された全ての月足データを四半期足に変換し、次のステージに受け渡す
+
+    Parameters:
+    data_folder (str): 株価データの出力ディレクトリ
+    catalog (dict): 成果物カタログ（変換結果を登録して保存する）
+    export_csv (bool): Trueの場合はCSVファイルも書き出す
+    use_japanese_columns (bool): CSVファイルのカラム名を日本語にするかどうか
+
+    Returns:
+    int: 変換した銘柄数
     """
-    # 株価データフォルダのパス
-    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '株価データ')
-    
-    # 月足データファイルを検索
-    monthly_files = glob.glob(os.path.join(data_folder, '*_月足.csv'))
-    
-    print(f"変換対象ファイル数: {len(monthly_files)}")
-    
-    # 各月足ファイルを四半期足に変換
-    for monthly_file in monthly_files:
+    symbols = symbols_with(catalog, "月足")
+    print(f"変換対象ファイル数: {len(symbols)}")
+    
+    # 全銘柄の月足データをまとめて四半期足に変換する（変換済みの銘柄はキャッシュを使う）
+    # （月足の読み込みは移行済みの列ファイルがあればCSVを読まずにそちらを使う）
+    try:
+        quarterly = get_aggregates(data_folder, catalog, symbols, "月足", "四半期足",
+                                   monthly_to_quarterly, monthly_to_quarterly_universe)
+    except Exception as e:
+        print(f"まとめて変換できませんでした（銘柄ごとに変換します）: {e}")
+        quarterly = {}
+    
+    converted = 0
+    # 各銘柄の四半期足データを次のステージに受け渡す
+    for symbol in symbols:
+        ticker_name = get_base_name(catalog, symbol)
         try:
-            df_quarterly, ticker_name = convert_monthly_to_quarterly(monthly_file)
+            df_quarterly = quarterly.get(symbol)
+            if df_quarterly is None:
+                df_quarterly = get_aggregate(data_folder, catalog, symbol, "月足", "四半期足", monthly_to_quarterly)
+            if df_quarterly is None:
+                print(f"警告: {symbol}の月足ファイルが見つかりません。")
+                continue
             
-            # 出力ファイルパス
-            output_path = os.path.join(data_folder, f"{ticker_name}_四半期足.csv")
+            write_stage(data_folder, catalog, symbol, "四半期足", df_quarterly)
             
-            # CSVファイルに保存（エンコーディングを明示的に指定）
-            df_quarterly.to_csv(output_path, index=False, encoding='utf-8-sig')
+            if export_csv:
+                csv_path = export_stage_csv(data_folder, catalog, symbol, "四半期足", use_japanese_columns)
+                print(f"CSVファイルを保存しました: {csv_path}")
             
+            converted += 1
             print(f"変換完了: {ticker_name}")
         except Exception as e:
-            print(f"エラー ({os.path.basename(monthly_file)}): {e}")
+            print(f"エラー ({ticker_name}): {e}")
+    
+    save_catalog(catalog, data_folder)
+    return converted
+
+def main():
+    """
+    メイン関数：株価データフォルダの全ての月足データを四半期足に変換
+
+    変換結果は次のステージ（Excelへの追加）がそのまま読めるファイルで受け渡す。
+    CSVファイルは -csv を指定した場合だけ書き出す。
+
+    使い方: python create_quarterly_data.py [-csv]
+    """
+    # 株価データフォルダのパス
+    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '株価データ')
+    print(f"計算処理: {load_backend_config()}")
     
+    catalog = load_or_rebuild_catalog(data_folder)
+    create_quarterly_stage(data_folder, catalog, "-csv" in sys.argv, load_use_japanese_columns())
     print("処理完了")
 
 if __name__ == "__main__":
@@ -1,174 +1,143 @@
 import pandas as pd
 import os
-import glob
+import sys
 from datetime import datetime
+from artifact_catalog import load_or_rebuild_catalog, save_catalog, symbols_with, get_base_name
+from price_store import OHLCV_AGGREGATION
+from stage_exchange import write_stage, export_stage_csv, load_use_japanese_columns
+from aggregate_cache import get_aggregate, get_aggregates
+from frame_backend import use_polars, calendar_aggregate, calendar_aggregate_universe, load_backend_config
 
-# 出力ディレクトリを確保
-output_dir = "C:\\Users\\rilak\\Desktop\\株価\\株価データ"
-os.makedirs(output_dir, exist_ok=True)
-print(f"データをローカルフォルダに保存します: {output_dir}")
+# 出力ディレクトリ
+OUTPUT_DIR = "C:\\Users\\rilak\\Desktop\\株価\\株価データ"
 
-# 月足CSVファイルを検索（*_月足.csvというパターンを検索）
-monthly_files = glob.glob(os.path.join(output_dir, "*_月足.csv"))
-print(f"見つかった月足ファイル: {len(monthly_files)}個")
+def monthly_to_yearly(df_monthly):
+    """
+    月足データから年足データを作成する関数
 
-# カラム名の言語を自動的に入力ファイルに合わせる
-print("入力ファイルのカラム名形式を継承します。")
+    年は取引所の現地時間の年で決める。日付は年末（12月31日）とし、Excelの互換性のためタイムゾーンは付けない。
 
-for monthly_file in monthly_files:
-    print(f"処理中: {os.path.basename(monthly_file)}")
+    Parameters:
+    df_monthly (pd.DataFrame): 英語カラム名・日時インデックスの月足データ
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックス（年末の日付）の年足データ
+    """
+    # 始値は年初、高値・安値は年間の最大・最小、終値は年末、出来高・配当は年間の合計
+    # （設定ファイルで polars を選んだ場合は polars で集計する。結果は pandas と同じ）
+    df_yearly = calendar_aggregate(df_monthly, "year", OHLCV_AGGREGATION) if use_polars() else None
+    if df_yearly is None:
+        aggregation = {col: how for col, how in OHLCV_AGGREGATION.items() if col in df_monthly.columns}
+        df_yearly = df_monthly.groupby(df_monthly.index.year).agg(aggregation)
+    return set_year_dates(df_yearly)
+
+def set_year_dates(df_yearly):
+    """年のインデックスを年末（12月31日）の日付にする"""
+    df_yearly.index = pd.DatetimeIndex([datetime(year, 12, 31) for year in df_yearly.index], name='Date')
+    return df_yearly
+
+def monthly_to_yearly_universe(frames):
+    """
+    複数銘柄の月足データをまとめて年足データに変換する
+
+    polarsで処理する設定の場合は全銘柄を1回の集計で変換する。
+
+    Parameters:
+    frames (dict): 銘柄 → 英語カラム名・日時インデックスの月足データ
+
+    Returns:
+    dict: 銘柄 → monthly_to_yearly と同じ年足データ
+    """
+    aggregated = calendar_aggregate_universe(frames, "year", OHLCV_AGGREGATION) if use_polars() else None
+    if aggregated is None:
+        return {symbol: monthly_to_yearly(df) for symbol, df in frames.items()}
+    return {symbol: set_year_dates(df) for symbol, df in aggregated.items()}
+
+def create_yearly_data(output_dir, catalog, export_csv=False, use_japanese_columns=False):
+    """
+    カタログに登録された全ての月足データを年足に変換し、次のステージに受け渡す
+
+    Parameters:
+    output_dir (str): 株価データの出力ディレクトリ
+    catalog (dict): 成果物カタログ（変換結果を登録して保存する）
+    export_csv (bool): Trueの場合はCSVファイルも書き出す
+    use_japanese_columns (bool): CSVファイルのカラム名を日本語にするかどうか
+
+    Returns:
+    int: 変換した銘柄数
+    """
+    symbols = symbols_with(catalog, "月足")
+    print(f"見つかった月足ファイル: {len(symbols)}個")
     
+    # 全銘柄の月足データをまとめて年足に変換する（変換済みの銘柄はキャッシュを使う）
     try:
-        # ファイル名から情報を抽出（銘柄コードと銘柄名）
-        basename = os.path.basename(monthly_file)
-        base_name_without_ext = os.path.splitext(basename)[0]  # 拡張子なしのファイル名
-        ticker_and_name = base_name_without_ext.replace('_月足', '')  # 月足部分を削除
-        
-        # 月足データを読み込む
-        df_monthly = pd.read_csv(monthly_file, index_col=0, parse_dates=True)
-        
-        # データがあるか確認
-        if df_monthly.empty:
-            print(f"データがありません: {basename}")
-            continue
-        
-        # データ列があるか確認
-        if len(df_monthly.columns) == 0:
-            print(f"警告: {basename} には列がありません。この問題を修正します。")
-            # ファイルを直接開いて内容を確認
-            with open(monthly_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                print(f"ファイル内容のプレビュー: {content[:200]}...")
+        yearly = get_aggregates(output_dir, catalog, symbols, "月足", "年足", monthly_to_yearly, monthly_to_yearly_universe)
+    except Exception as e:
+        print(f"まとめて変換できませんでした（銘柄ごとに変換します）: {e}")
+        yearly = {}
+    
+    converted = 0
+    for symbol in symbols:
+        ticker_and_name = get_base_name(catalog, symbol)
+        print(f"処理中: {ticker_and_name}")
+        
+        try:
+            yearly_data = yearly.get(symbol)
+            if yearly_data is None:
+                # 年足データに変換（同じ月足データから変換済みの場合はキャッシュを使う）
+                print("年足データに変換中...")
+                yearly_data = get_aggregate(output_dir, catalog, symbol, "月足", "年足", monthly_to_yearly)
+            if yearly_data is None:
+                print(f"警告: {symbol}の月足ファイルが見つかりません。")
+                continue
             
-            # 再度読み込み試行（パースオプションを変更）
-            df_monthly = pd.read_csv(monthly_file, parse_dates=True)
+            # データがあるか確認
+            if yearly_data.empty:
+                print(f"データがありません: {ticker_and_name}")
+                continue
             
-            # インデックスを設定
-            if '日付' in df_monthly.columns:
-                df_monthly.set_index('日付', inplace=True)
-            elif 'Date' in df_monthly.columns:
-                df_monthly.set_index('Date', inplace=True)
-            else:
-                # インデックス列を自動検出
-                if df_monthly.columns[0].lower() in ['date', '日付', 'datetime', 'time', '時間']:
-                    df_monthly.set_index(df_monthly.columns[0], inplace=True)
-        
-        # インデックスが日付型でない場合は変換
-        if not isinstance(df_monthly.index, pd.DatetimeIndex):
-            try:
-                df_monthly.index = pd.to_datetime(df_monthly.index)
-            except ValueError as e:
-                if "Tz-aware datetime" in str(e):
-                    # タイムゾーン情報付きの場合はUTCとして処理
-                    print("タイムゾーン情報付きの日付を処理中...")
-                    df_monthly.index = pd.to_datetime(df_monthly.index, utc=True)
-                else:
-                    raise
-        
-        # タイムゾーン情報を削除（Excelの互換性のため）
-        if hasattr(df_monthly.index, 'tz') and df_monthly.index.tz is not None:
-            df_monthly.index = df_monthly.index.tz_localize(None)
-        
-        # 年足データに変換
-        print("年足データに変換中...")
-        
-        # 年ごとにグループ化（YEを使用）
-        yearly_groups = df_monthly.groupby(pd.Grouper(freq='YE'))
-        
-        # 年足データフレームを作成
-        yearly_data = pd.DataFrame()
-        
-        # 日本語と英語の列名を定義
-        jp_columns = ['始値', '高値', '安値', '終値', '出来高', '配当', '株式分割']
-        en_columns = ['Open', 'High', 'Low', 'Close', 'Volume', 'Dividends', 'Stock Splits']
-        
-        # 現在の列名を確認
-        current_columns = list(df_monthly.columns)
-        print(f"現在の列名: {current_columns}")
-        
-        # 日本語列名か英語列名かを判断
-        is_jp = any(col in jp_columns for col in current_columns)
-        
-        # 列名のマッピングを作成
-        if is_jp:
-            col_open = '始値' if '始値' in current_columns else 'Open'
-            col_high = '高値' if '高値' in current_columns else 'High'
-            col_low = '安値' if '安値' in current_columns else 'Low'
-            col_close = '終値' if '終値' in current_columns else 'Close'
-            col_volume = '出来高' if '出来高' in current_columns else 'Volume'
-            col_dividends = '配当' if '配当' in current_columns else 'Dividends'
-            col_splits = '株式分割' if '株式分割' in current_columns else 'Stock Splits'
-        else:
-            col_open = 'Open' if 'Open' in current_columns else '始値'
-            col_high = 'High' if 'High' in current_columns else '高値'
-            col_low = 'Low' if 'Low' in current_columns else '安値'
-            col_close = 'Close' if 'Close' in current_columns else '終値'
-            col_volume = 'Volume' if 'Volume' in current_columns else '出来高'
-            col_dividends = 'Dividends' if 'Dividends' in current_columns else '配当'
-            col_splits = 'Stock Splits' if 'Stock Splits' in current_columns else '株式分割'
-        
-        # グループごとに年足データを計算
-        yearly_data_list = []
-        for name, group in yearly_groups:
-            if not group.empty:
-                # 年足データの計算
-                yearly_row = {}
-                
-                # 各カラムの処理を安全に行う
-                if col_open in group.columns:
-                    yearly_row[col_open] = group.iloc[0][col_open]  # 年初の始値
-                
-                if col_high in group.columns:
-                    yearly_row[col_high] = group[col_high].max()    # 年間最高値
-                
-                if col_low in group.columns:
-                    yearly_row[col_low] = group[col_low].min()      # 年間最安値
-                
-                if col_close in group.columns:
-                    yearly_row[col_close] = group.iloc[-1][col_close]  # 年末の終値
-                
-                if col_volume in group.columns:
-                    yearly_row[col_volume] = group[col_volume].sum()  # 年間出来高合計
-                
-                if col_dividends in group.columns:
-                    yearly_row[col_dividends] = group[col_dividends].sum()  # 年間配当合計
-                
-                if col_splits in group.columns:
-                    yearly_row[col_splits] = group[col_splits].sum()  # 年間株式分割合計
-                
-                yearly_data_list.append((name, yearly_row))
-        
-        # DataFrameに変換
-        if yearly_data_list:
-            yearly_data = pd.DataFrame([row for _, row in yearly_data_list], index=[name for name, _ in yearly_data_list])
-        
-        # 入力ファイルのカラム名形式を継承（日本語/英語を自動判断）
-        use_japanese_columns = is_jp
-        
-        # カラム名を希望の言語に変更（必要なし - 入力形式を継承）
-        # インデックス名を設定
-        yearly_data.index.name = '日付' if use_japanese_columns else 'Date'
-        
-        # 年足CSVファイルを保存
-        yearly_csv_path = os.path.join(output_dir, f"{ticker_and_name}_年足.csv")
-        yearly_data.to_csv(yearly_csv_path, encoding='utf-8-sig')
-        print(f"年足CSVファイルを保存しました: {yearly_csv_path}")
-        
-        # データの最初と最後の行を表示
-        if not yearly_data.empty:
+            write_stage(output_dir, catalog, symbol, "年足", yearly_data)
+            
+            if export_csv:
+                csv_path = export_stage_csv(output_dir, catalog, symbol, "年足", use_japanese_columns)
+                print(f"年足CSVファイルを保存しました: {csv_path}")
+            converted += 1
+            
+            # データの最初と最後の行を表示
             print("年足データの最初の行:")
             print(yearly_data.head(1))
             
             print("年足データの最後の行:")
             print(yearly_data.tail(1))
-        else:
-            print("警告: 年足データが空です。")
+            
+        except Exception as e:
+            print(f"エラーが発生しました: {e}")
+            import traceback
+            print(traceback.format_exc())  # 詳細なエラー情報を表示
         
-    except Exception as e:
-        print(f"エラーが発生しました: {e}")
-        import traceback
-        print(traceback.format_exc())  # 詳細なエラー情報を表示
+        print("\n" + "="*80 + "\n")  # 区切り線
+    
+    save_catalog(catalog, output_dir)
+    return converted
+
+def main():
+    """
+    メイン関数：カタログに登録された全ての月足データを年足に変換
+
+    変換結果は次のステージ（Excelへの追加）がそのまま読めるファイルで受け渡す。
+    CSVファイルは -csv を指定した場合だけ書き出す。
+
+    使い方: python create_yearly_data_fixed.py [-csv]
+    """
+    # 出力ディレクトリを確保
+    output_dir = OUTPUT_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"データをローカルフォルダに保存します: {output_dir}")
+    print(f"計算処理: {load_backend_config()}")
     
-    print("\n" + "="*80 + "\n")  # 区切り線
+    catalog = load_or_rebuild_catalog(output_dir)
+    create_yearly_data(output_dir, catalog, "-csv" in sys.argv, load_use_japanese_columns())
+    print("処理が完了しました。")
 
-print("処理が完了しました。年足データをCSV形式で保存しました。")
+if __name__ == "__main__":
+    main()
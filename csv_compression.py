@@ -0,0 +1,152 @@
+import io
+import os
+import gzip
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# 圧縮形式とファイル名の末尾
+COMPRESSION_SUFFIXES = {
+    "gzip": ".gz",
+    "zstd": ".zst"
+}
+
+# 読み込めるCSVファイルの末尾（圧縮なし・gzip・zstd）
+CSV_SUFFIXES = (".csv", ".csv.gz", ".csv.zst")
+
+# 圧縮レベル（書き込み速度と圧縮率のバランスを取った値）
+COMPRESSION_LEVELS = {
+    "gzip": 6,
+    "zstd": 10
+}
+
+def resolve_compression(compression):
+    """
+    設定ファイルの圧縮形式を確認する
+
+    zstdが指定されていてもzstandardがインストールされていない場合はgzipを使う。
+
+    Returns:
+    str: "gzip"、"zstd"、圧縮しない場合はNone
+    """
+    if not compression or str(compression).lower() == "none":
+        return None
+    compression = str(compression).lower()
+    if compression not in COMPRESSION_SUFFIXES:
+        print(f"警告: 対応していない圧縮形式です: {compression}（gzip または zstd）。圧縮せずに保存します。")
+        return None
+    if compression == "zstd" and zstandard is None:
+        print("警告: zstdで圧縮するには zstandard が必要です（pip install zstandard）。gzipで圧縮します。")
+        return "gzip"
+    return compression
+
+def get_csv_suffix(compression=None):
+    """圧縮形式に対応するCSVファイルの末尾を返す（.csv、.csv.gz、.csv.zst）"""
+    return ".csv" + COMPRESSION_SUFFIXES.get(compression, "")
+
+def strip_csv_suffix(file_name):
+    """
+    CSVファイル名から末尾（.csv、.csv.gz、.csv.zst）を除いた部分を返す
+
+    Returns:
+    str: 末尾を除いたファイル名（CSVファイルでない場合はNone）
+    """
+    for suffix in CSV_SUFFIXES:
+        if file_name.endswith(suffix):
+            return file_name[:-len(suffix)]
+    return None
+
+def get_compression_method(path):
+    """ファイル名の末尾から圧縮形式を判定する"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.endswith(".csv" + suffix):
+            return compression
+    return None
+
+def compress_bytes(data, compression):
+    """バイト列を指定した形式で圧縮する"""
+    if compression == "gzip":
+        return gzip.compress(data, compresslevel=COMPRESSION_LEVELS["gzip"], mtime=0)
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSION_LEVELS["zstd"]).compress(data)
+    return data
+
+def decompress_bytes(data, compression, name="CSV"):
+    """指定した形式で圧縮されたバイト列を展開する"""
+    if compression == "gzip":
+        return gzip.decompress(data)
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError(f"{name}を読み込むには zstandard が必要です（pip install zstandard）")
+        # 書き込み時に元のサイズを記録しない場合もあるため、ストリームとして展開する
+        return zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data)).read()
+    return data
+
+def read_csv_bytes(path):
+    """CSVファイルを（圧縮されている場合は展開して）バイト列として読み込む"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    return decompress_bytes(data, get_compression_method(path), os.path.basename(path))
+
+def open_csv_text(path, encoding='utf-8-sig'):
+    """CSVファイルを（圧縮されている場合は展開して）テキストとして開く"""
+    return io.TextIOWrapper(io.BytesIO(read_csv_bytes(path)), encoding=encoding)
+
+def get_to_csv_options(compression=None):
+    """
+    DataFrame.to_csv に渡す圧縮の指定を返す
+
+    小数の桁数は書式で指定せず、round_float_columns で丸めた値をそのまま書き出す
+    （書式の "%g" は 0.0 を "0" と書くため整数の列として読み込まれ、大きな値は指数表記になって整数部の桁が失われる）。
+
+    Parameters:
+    compression (str): "gzip"、"zstd"、圧縮しない場合はNone
+
+    Returns:
+    dict: to_csv のキーワード引数
+    """
+    options = {}
+    if compression == "gzip":
+        options["compression"] = {"method": "gzip", "compresslevel": COMPRESSION_LEVELS["gzip"], "mtime": 0}
+    elif compression == "zstd":
+        options["compression"] = {"method": "zstd", "level": COMPRESSION_LEVELS["zstd"]}
+    return options
+
+def round_significant(values, float_precision):
+    """
+    浮動小数の配列を有効桁数に丸める（整数部の桁は丸めない）
+
+    有効桁数より整数部の桁が多い値は小数点以下だけを丸める。
+    """
+    digits = int(float_precision)
+    significant = np.char.mod(f"%.{digits}g", values).astype(np.float64)
+    return np.where(np.abs(values) < 10.0 ** digits, significant, np.round(values))
+
+def round_float_columns(df, float_precision=None):
+    """
+    浮動小数の列を有効桁数に丸める（CSVには丸めた値を小数点付きでそのまま書き出す）
+
+    CSV以外の形式（列ファイル・SQLなど）にも同じ値を書き出し、どの形式から読んでも値が一致するようにする。
+
+    Returns:
+    pd.DataFrame: 丸めたデータフレーム（有効桁数を指定しない場合は元のデータフレーム）
+    """
+    if not float_precision:
+        return df
+    rounded = df.copy()
+    for col in df.columns:
+        if df[col].dtype.kind == 'f':
+            values = df[col].to_numpy()
+            rounded[col] = round_significant(values, float_precision).astype(values.dtype)
+    return rounded
+
+def find_csv_variants(path):
+    """同じCSVファイルの別の圧縮形式のファイル（存在するもの）を返す"""
+    stem = strip_csv_suffix(path)
+    if stem is None:
+        return []
+    return [stem + suffix for suffix in CSV_SUFFIXES if stem + suffix != path and os.path.exists(stem + suffix)]
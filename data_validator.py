@@ -0,0 +1,422 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import (load_or_rebuild_catalog, save_catalog, lookup_entry, lookup_artifact, register_frame,
+                              get_base_name, get_symbol_exchange)
+from market_calendar import EXCHANGES, get_exchange, is_trading_day, load_extra_holidays
+from price_store import read_price_csv, get_data_version
+from csv_compression import read_csv_bytes, compress_bytes, get_compression_method
+from file_lock import file_lock, atomic_path, read_json, write_json
+
+# 検証の状態ファイル（銘柄・期間ごとに検証済みの行数・直前の足・検出した問題を保持する）
+VALIDATION_STATE_FILE = "validation_state.json"
+
+# 問題の一覧を書き出すファイル
+VALIDATION_REPORT_CSV = "データ検証.csv"
+
+# 隔離した足を保存するフォルダ（出力ディレクトリ内）
+QUARANTINE_DIR_NAME = "quarantine"
+
+# 検証する期間（四半期足・年足は月足から作るため月足も検証する）
+VALIDATE_INTERVALS = ["日足", "週足", "月足"]
+
+# 前の足の終値からこの倍率以上（または1/倍率以下）に動いた足を急変とみなす（分割の未調整など）
+JUMP_RATIO = 3.0
+
+# 出来高0がこの本数以上続いた場合に報告する
+ZERO_VOLUME_RUN_BARS = 5
+
+# 取引日の欠落を調べる期間（最後の足からさかのぼる日数、古いデータは欠落が多いため対象にしない）
+MISSING_SESSION_DAYS = 366
+
+# 高値・安値の範囲の判定で許容する相対誤差（Yahoo Financeの丸め誤差）
+PRICE_TOLERANCE = 1e-6
+
+# 検証の種類 → (重大度, 内容)。error の足は隔離の対象にする
+CHECKS = {
+    "invalid_price": ("error", "価格が欠損・0以下、または出来高が負"),
+    "high_low": ("error", "高値が安値より低い"),
+    "ohlc_range": ("error", "始値・終値が高値・安値の範囲外"),
+    "duplicate": ("error", "日付が前の足と重複"),
+    "unordered": ("error", "日付が前の足より前"),
+    "jump": ("warning", "終値の急変"),
+    "zero_volume": ("warning", "出来高0の連続"),
+    "missing_session": ("warning", "取引日の欠落")
+}
+
+REPORT_COLUMNS = ["Symbol", "Name", "Interval", "Date", "Check", "Severity", "Detail", "Quarantined"]
+
+PRICE_COLUMNS = ["Open", "High", "Low", "Close"]
+
+def get_state_path(output_dir):
+    return os.path.join(output_dir, VALIDATION_STATE_FILE)
+
+def load_state(output_dir):
+    """検証の状態を読み込む（存在しない・壊れている場合は空の状態）"""
+    path = get_state_path(output_dir)
+    if os.path.exists(path):
+        try:
+            return read_json(path)
+        except (OSError, ValueError) as e:
+            print(f"検証の状態ファイルを読み込めません（全銘柄を検証し直します）: {e}")
+    return {"symbols": {}}
+
+def to_local_dates(index):
+    """日時インデックスを取引所の現地日付（タイムゾーンなし）の配列にする"""
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    return index.normalize().to_numpy(dtype='datetime64[ns]')
+
+def load_new_rows(output_dir, catalog, symbol, interval, interval_state):
+    """
+    1銘柄・1期間の検証する足を読み込む
+
+    前回検証した最後の足（値が確定していなかった可能性がある）以降だけを読み込み、その前の足を
+    前後の比較に使う。データの開始日が変わった場合や、読み込んだ最初の足が前回の最後の足と
+    一致しない場合（再取得で隔離した足が戻った場合など）は全体を読み直す。
+
+    Returns:
+    dict: 検証する足と前回の状態（データがない・変わっていない場合はNone）
+    """
+    entry = lookup_entry(catalog, symbol, interval)
+    path = lookup_artifact(catalog, symbol, interval, output_dir)
+    if entry is None or path is None or not os.path.isfile(path):
+        return None
+    version = get_data_version(catalog, symbol, interval)
+    if interval_state and interval_state.get("version") == version:
+        return None
+
+    exchange = get_exchange(symbol, get_symbol_exchange(catalog, symbol))
+    tz = EXCHANGES[exchange]["timezone"]
+    rows = entry.get("rows") or 0
+    context = (interval_state or {}).get("context")
+    incremental = (context is not None and interval_state.get("start") == entry.get("start")
+                   and 1 < interval_state.get("rows", 0) <= rows)
+    df = None
+    skip = 0
+    if incremental:
+        skip = interval_state["rows"] - 1
+        df = read_price_csv(path, tz, skip_rows=skip)
+        dates = to_local_dates(df.index[:1])
+        if len(dates) == 0 or str(dates[0])[:10] != interval_state.get("last_date"):
+            df = None
+    if df is None:
+        incremental = False
+        context = None
+        skip = 0
+        df = read_price_csv(path, tz)
+
+    return {"symbol": symbol, "interval": interval, "path": path, "frame": df, "skip": skip,
+            "context": context, "incremental": incremental, "state": interval_state or {},
+            "exchange": exchange}
+
+def build_panel(tasks):
+    """
+    全銘柄の検証する足を1つの縦長の配列にまとめる
+
+    各ブロック（銘柄・期間）の先頭には前回の状態の直前の足（比較用、行番号は-1）を置く。
+
+    Returns:
+    dict: 列名 → 配列（block はタスクの番号、row はファイル内のデータ行の番号）
+    """
+    parts = {col: [np.array([], dtype=float)] for col in PRICE_COLUMNS + ["Volume", "Stock Splits"]}
+    parts.update(block=[np.array([], dtype=int)], row=[np.array([], dtype=int)],
+                 date=[np.array([], dtype='datetime64[ns]')])
+    for number, task in enumerate(tasks):
+        df = task["frame"]
+        n = len(df)
+        context = task["context"]
+        if context is not None:
+            parts["block"].append(np.array([number]))
+            parts["row"].append(np.array([-1]))
+            parts["date"].append(np.array([context["Date"]], dtype='datetime64[ns]'))
+            for col in PRICE_COLUMNS:
+                parts[col].append(np.array([context["Close"]], dtype=float))
+            parts["Volume"].append(np.array([1.0 if context["zero_run"] == 0 else 0.0]))
+            parts["Stock Splits"].append(np.zeros(1))
+        parts["block"].append(np.full(n, number))
+        parts["row"].append(np.arange(task["skip"], task["skip"] + n))
+        parts["date"].append(to_local_dates(df.index))
+        for col in PRICE_COLUMNS + ["Volume", "Stock Splits"]:
+            values = df[col].to_numpy(dtype=float) if col in df.columns else \
+                np.zeros(n) if col == "Stock Splits" else np.full(n, np.nan)
+            parts[col].append(values)
+    return {col: np.concatenate(values) for col, values in parts.items()}
+
+def get_session_days(exchange, first, last, extra_holidays=()):
+    """期間内の取引日（datetime64の配列）を返す"""
+    days = pd.date_range(first, last, freq='D')
+    return days[[is_trading_day(exchange, d.date(), extra_holidays) for d in days]].to_numpy(dtype='datetime64[ns]')
+
+def check_panel(panel, tasks, extra_holidays=None):
+    """
+    全銘柄の足をまとめて検証する（前後の足の比較はブロック内だけで行う）
+
+    Returns:
+    tuple: (問題の一覧（block・row・Date・Check・Detail、比較用の足は含めない）,
+            次回に引き継ぐ値（足ごとの出来高0の連続本数・ブロックごとの出来高の有無）)
+    """
+    extra_holidays = extra_holidays or {}
+    block = panel["block"].astype(int)
+    n = len(block)
+    index = np.arange(n)
+    same = np.r_[False, block[1:] == block[:-1]]
+    target = panel["row"] >= 0
+    date = panel["date"]
+    prev_date = np.r_[date[:1], date[:-1]]
+    open_, high, low, close = (panel[col] for col in PRICE_COLUMNS)
+    volume = panel["Volume"]
+    prev_close = np.r_[np.nan, close[:-1]]
+
+    found = []
+
+    def add(check, mask, detail=None):
+        mask = mask & target
+        if mask.any():
+            found.append((check, np.flatnonzero(mask), detail))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        prices = np.column_stack([open_, high, low, close])
+        invalid = (np.isnan(prices) | (prices <= 0)).any(axis=1) | (volume < 0)
+        add("invalid_price", invalid)
+        high_low = ~invalid & (high < low * (1 - PRICE_TOLERANCE))
+        add("high_low", high_low)
+        upper = high * (1 + PRICE_TOLERANCE)
+        lower = low * (1 - PRICE_TOLERANCE)
+        outside = (open_ > upper) | (open_ < lower) | (close > upper) | (close < lower)
+        add("ohlc_range", ~invalid & ~high_low & outside)
+        add("duplicate", same & (date == prev_date))
+        add("unordered", same & (date < prev_date))
+
+        ratio = close / prev_close
+        jump = same & (prev_close > 0) & (close > 0) & ((ratio >= JUMP_RATIO) | (ratio <= 1 / JUMP_RATIO))
+        add("jump", jump,
+            lambda i: f"前の足の{ratio[i]:.2f}倍" + ("（株式分割あり）" if panel["Stock Splits"][i] > 0 else ""))
+
+        # 出来高0の連続本数（ブロックの先頭では前回までの本数を引き継ぐ）
+        zero = volume == 0
+        block_start = ~same
+        anchor = np.where(~zero, index, np.where(block_start, index - 1, -1))
+        last_nonzero = np.maximum.accumulate(anchor)
+        start_index = np.maximum.accumulate(np.where(block_start, index, 0))
+        carry = np.array([max((task["context"] or {}).get("zero_run", 0) - 1, 0) for task in tasks], dtype=int)[block]
+        zero_run = np.where(zero, index - last_nonzero + np.where(last_nonzero == start_index - 1, carry, 0), 0)
+        has_volume = np.zeros(len(tasks), dtype=bool)
+        np.logical_or.at(has_volume, block, (volume > 0) & target)
+        has_volume |= np.array([bool(task["state"].get("has_volume")) for task in tasks], dtype=bool)
+        add("zero_volume", (zero_run == ZERO_VOLUME_RUN_BARS) & has_volume[block],
+            lambda i: f"出来高0が{ZERO_VOLUME_RUN_BARS}本連続")
+
+    # 日足の取引日の欠落（取引所ごとにまとめて取引日と照合する）
+    block_last = np.zeros(len(tasks), dtype='datetime64[ns]')
+    np.maximum.at(block_last, block, date)
+    recent = date >= block_last[block] - np.timedelta64(MISSING_SESSION_DAYS, 'D')
+    daily = np.array([task["interval"] == "日足" for task in tasks], dtype=bool)[block]
+    exchanges = np.array([task["exchange"] for task in tasks], dtype=object)[block]
+    candidates = same & target & daily & recent & (date > prev_date)
+    gaps = np.zeros(n, dtype=int)
+    for exchange in np.unique(exchanges[candidates]):
+        rows = candidates & (exchanges == exchange)
+        days = get_session_days(exchange, prev_date[rows].min(), date[rows].max(), extra_holidays.get(exchange, ()))
+        gaps[rows] = np.searchsorted(days, date[rows], 'left') - np.searchsorted(days, prev_date[rows], 'right')
+    add("missing_session", gaps > 0,
+        lambda i: f"{str(prev_date[i])[:10]}〜{str(date[i])[:10]}の間の取引日{gaps[i]}日分がない")
+
+    records = []
+    for check, positions, detail in found:
+        for i in positions:
+            records.append({"block": int(block[i]), "row": int(panel["row"][i]), "Date": str(date[i])[:10],
+                            "Check": check, "Detail": detail(i) if detail else CHECKS[check][1]})
+    issues = pd.DataFrame(records, columns=["block", "row", "Date", "Check", "Detail"])
+    return issues, {"zero_run": zero_run, "has_volume": has_volume}
+
+def get_quarantine_path(output_dir, catalog, symbol, interval):
+    folder = os.path.join(output_dir, QUARANTINE_DIR_NAME)
+    return os.path.join(folder, f"{get_base_name(catalog, symbol)}_{interval}_隔離.csv")
+
+def quarantine_rows(output_dir, catalog, symbol, interval, path, rows):
+    """
+    CSVファイルから指定したデータ行を取り除き、隔離用のCSVファイルに移す
+
+    行を書式ごとそのまま移すため、カラム名・日付・数値の書式は元のファイルと同じになる。
+
+    Returns:
+    int: 取り除いた行数
+    """
+    rows = set(rows)
+    with file_lock(path):
+        data = read_csv_bytes(path)
+        lines = data.split(b'\n')
+        header, body = lines[0], lines[1:]
+        trailing = body and body[-1] == b''
+        if trailing:
+            body = body[:-1]
+        if max(rows) >= len(body):
+            print(f"警告: {symbol} {interval}: ファイルの行数が変わったため隔離できませんでした")
+            return 0
+        moved = [line for i, line in enumerate(body) if i in rows]
+        kept = [line for i, line in enumerate(body) if i not in rows]
+        content = b'\n'.join([header] + kept) + (b'\n' if trailing else b'')
+
+        quarantine_path = get_quarantine_path(output_dir, catalog, symbol, interval)
+        os.makedirs(os.path.dirname(quarantine_path), exist_ok=True)
+        with file_lock(quarantine_path):
+            existing = set()
+            if os.path.exists(quarantine_path):
+                with open(quarantine_path, 'rb') as f:
+                    existing = set(f.read().split(b'\n')[1:])
+            new_lines = [line for line in moved if line not in existing]
+            if new_lines:
+                with open(quarantine_path, 'ab') as f:
+                    if not existing:
+                        f.write(header + b'\n')
+                    f.write(b'\n'.join(new_lines) + b'\n')
+
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                f.write(compress_bytes(content, get_compression_method(path)))
+
+    exchange = get_exchange(symbol, get_symbol_exchange(catalog, symbol))
+    tz = EXCHANGES[exchange]["timezone"]
+    register_frame(catalog, symbol, interval, path, output_dir, read_price_csv(path, tz))
+    return len(moved)
+
+def has_pending_errors(interval_state):
+    """隔離していない重大な問題（error）が残っているかどうか"""
+    return any(CHECKS[issue["Check"]][0] == "error" and not issue.get("Quarantined")
+               for issue in (interval_state or {}).get("issues", []))
+
+def make_context(dates, closes, zero_runs):
+    """次回の検証で比較に使う足（最後から2番目の足）を状態に保存する形式にする"""
+    if len(dates) < 2:
+        return None, None
+    return ({"Date": str(dates[-2])[:10], "Close": float(closes[-2]), "zero_run": int(zero_runs[-2])},
+            str(dates[-1])[:10])
+
+def validate_universe(output_dir, catalog, tickers, config=None, quarantine=False, full=False):
+    """
+    全銘柄の日足・週足・月足を検証し、問題の一覧をCSVに保存する（前回以降に追記された足だけを検証する）
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    catalog (dict): 成果物カタログ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    config (dict): 設定（market_holidays を参照）
+    quarantine (bool): Trueの場合は重大な問題（error）のある足をCSVから取り除いて隔離する
+    full (bool): Trueの場合は状態を使わずに全体を検証し直す
+
+    Returns:
+    pd.DataFrame: 問題の一覧（全銘柄分、前回までに検出したものを含む）
+    """
+    started = time.perf_counter()
+    state = {"symbols": {}} if full else load_state(output_dir)
+    symbols_state = {symbol: dict(state["symbols"].get(symbol, {})) for symbol in tickers}
+
+    tasks = []
+    for symbol in tickers:
+        for interval in VALIDATE_INTERVALS:
+            interval_state = symbols_state[symbol].get(interval)
+            if quarantine and has_pending_errors(interval_state):
+                # 前回までに検出して隔離していない足があれば、行の位置を求めるため全体を検証し直す
+                interval_state = None
+            try:
+                task = load_new_rows(output_dir, catalog, symbol, interval, interval_state)
+            except Exception as e:
+                print(f"{symbol}の{interval}を読み込めませんでした: {e}")
+                continue
+            if task is not None:
+                tasks.append(task)
+
+    panel = build_panel(tasks)
+    checked_rows = int((panel["row"] >= 0).sum()) if tasks else 0
+    issues, carried = check_panel(panel, tasks, load_extra_holidays(config or {}))
+
+    quarantined_files = 0
+    for number, task in enumerate(tasks):
+        symbol, interval = task["symbol"], task["interval"]
+        found = issues[issues["block"] == number]
+        bad_rows = sorted(set(found.loc[found["Check"].map(lambda c: CHECKS[c][0]) == "error", "row"]))
+        removed = set()
+        if quarantine and bad_rows:
+            try:
+                if quarantine_rows(output_dir, catalog, symbol, interval, task["path"], bad_rows):
+                    removed = set(bad_rows)
+                    quarantined_files += 1
+            except Exception as e:
+                print(f"{symbol}の{interval}の隔離中にエラーが発生しました: {e}")
+
+        # 隔離済みの足はファイルにないため前回の結果を残す。それ以外の前回の問題は、
+        # 読み直した足より前のものだけを残し、以降は今回の結果で置き換える
+        first_date = task["state"].get("last_date") if task["incremental"] else None
+        kept_issues = {(issue["Date"], issue["Check"]): issue
+                       for issue in (symbols_state[symbol].get(interval) or {}).get("issues", [])
+                       if issue.get("Quarantined") or (first_date is not None and issue["Date"] < first_date)}
+        for _, issue in found.iterrows():
+            kept_issues[(issue["Date"], issue["Check"])] = {
+                "Date": issue["Date"], "Check": issue["Check"], "Detail": issue["Detail"],
+                "Quarantined": issue["row"] in removed}
+
+        # 次回の比較に使う足（隔離した足は除く）
+        in_block = panel["block"] == number
+        keep = in_block & ~np.isin(panel["row"], list(removed))
+        context, last_date = make_context(panel["date"][keep], panel["Close"][keep], carried["zero_run"][keep])
+        entry = lookup_entry(catalog, symbol, interval) or {}
+        symbols_state[symbol][interval] = {
+            "version": get_data_version(catalog, symbol, interval), "start": entry.get("start"),
+            "rows": entry.get("rows") or 0, "last_date": last_date, "context": context,
+            "has_volume": bool(carried["has_volume"][number]),
+            "issues": sorted(kept_issues.values(), key=lambda issue: issue["Date"])
+        }
+
+    state["symbols"] = symbols_state
+    write_json(get_state_path(output_dir), state, indent=None)
+    if quarantined_files:
+        save_catalog(catalog, output_dir)
+
+    records = []
+    for symbol, intervals in symbols_state.items():
+        for interval, interval_state in intervals.items():
+            for issue in interval_state.get("issues", []):
+                records.append(dict(issue, Symbol=symbol, Name=tickers.get(symbol, symbol), Interval=interval,
+                                    Severity=CHECKS[issue["Check"]][0]))
+    report = pd.DataFrame(records, columns=REPORT_COLUMNS)
+    report = report.sort_values(["Severity", "Symbol", "Interval", "Date"]).reset_index(drop=True)
+
+    report_path = os.path.join(output_dir, VALIDATION_REPORT_CSV)
+    with file_lock(report_path), atomic_path(report_path) as tmp_path:
+        report.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+
+    elapsed = time.perf_counter() - started
+    print(f"データを検証しました（{len(tasks)}ファイル・{checked_rows}本を{elapsed:.2f}秒で検証、"
+          f"問題{len(report)}件）: {report_path}")
+    if len(report):
+        counts = report.groupby(["Severity", "Check"]).size()
+        for (severity, check), count in counts.items():
+            print(f"  {severity:7s} {CHECKS[check][1]}: {count}件")
+    if quarantined_files:
+        print(f"  {quarantined_files}ファイルの問題のある足を隔離しました: "
+              f"{os.path.join(output_dir, QUARANTINE_DIR_NAME)}")
+    return report
+
+def main():
+    """
+    メイン関数：設定ファイルの全銘柄のデータを検証する
+    "-full" で状態を使わずに全体を検証し直し、"-quarantine" で問題のある足を隔離する
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    quarantine = "-quarantine" in sys.argv or config.get("quarantine_bad_bars", False)
+    report = validate_universe(output_dir, catalog, tickers, config, quarantine=quarantine, full="-full" in sys.argv)
+    if any((report["Severity"] == "error") & ~report["Quarantined"].astype(bool)):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+import os
+import sys
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+import multiprocessing
+from contextlib import closing
+
+import stock_data_all_new
+import summary_table
+import data_validator
+import versioned_store
+from artifact_catalog import load_catalog, save_catalog
+from intraday_store import collect_intraday
+from market_calendar import select_tickers_to_refresh
+
+# 作業キューのファイル名（出力ディレクトリ内。複数のマシンから共有フォルダ経由で使う）
+QUEUE_FILE_NAME = "fetch_queue.sqlite"
+
+# 1つの作業単位にまとめる銘柄数
+SHARD_SIZE = 20
+
+# 作業を借りてから期限切れになるまでの秒数（ハートビートで延長する）
+LEASE_SECONDS = 300
+
+# ハートビートの間隔（秒）
+HEARTBEAT_SECONDS = 30
+
+# 作業を借りられるまで待つ間隔（秒）
+POLL_SECONDS = 5
+
+# 1つの作業を試す最大回数（超えた場合は失敗とする）
+MAX_ATTEMPTS = 3
+
+def connect(queue_path):
+    """作業キューのデータベースに接続する（トランザクションは明示的に開始する）"""
+    conn = sqlite3.connect(queue_path, timeout=60, isolation_level=None)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id TEXT NOT NULL,
+            tickers TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_token TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            updated REAL
+        )""")
+    conn.execute("CREATE INDEX IF NOT EXISTS items_status ON items (status, id)")
+    return conn
+
+def create_run(conn, tickers, shard_size=SHARD_SIZE):
+    """
+    銘柄の一覧を作業単位に分けてキューに追加する
+
+    Parameters:
+    conn (sqlite3.Connection): 作業キューの接続
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    shard_size (int): 1つの作業単位の銘柄数
+
+    Returns:
+    str: 実行ID
+    """
+    run_id = time.strftime("%Y%m%d%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    items = list(tickers.items())
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    for i in range(0, len(items), shard_size):
+        conn.execute("INSERT INTO items (run_id, tickers, updated) VALUES (?, ?, ?)",
+                     (run_id, json.dumps(dict(items[i:i + shard_size]), ensure_ascii=False), now))
+    conn.execute("COMMIT")
+    return run_id
+
+def requeue_expired(conn, now=None):
+    """
+    期限切れの作業を実行待ちに戻す（試行回数を超えた作業は失敗にする）
+
+    Returns:
+    int: 実行待ちに戻した作業の数
+    """
+    now = now or time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute("""UPDATE items SET status = 'failed', error = 'リースの期限切れが続いたため中止', updated = ?
+                    WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?""", (now, now, MAX_ATTEMPTS))
+    requeued = conn.execute("""UPDATE items SET status = 'pending', worker = NULL, lease_token = NULL, updated = ?
+                               WHERE status = 'leased' AND lease_expires < ?""", (now, now)).rowcount
+    conn.execute("COMMIT")
+    return requeued
+
+def lease_item(conn, worker_id):
+    """
+    実行待ちの作業を1つ借りる
+
+    Returns:
+    tuple: (作業ID, リースのトークン, 銘柄の辞書)（実行待ちの作業がない場合はNone）
+    """
+    requeue_expired(conn)
+    now = time.time()
+    conn.execute("BEGIN IMMEDIATE")
+    row = conn.execute("SELECT id, tickers FROM items WHERE status = 'pending' ORDER BY id LIMIT 1").fetchone()
+    if row is None:
+        conn.execute("COMMIT")
+        return None
+    token = uuid.uuid4().hex
+    conn.execute("""UPDATE items SET status = 'leased', worker = ?, lease_token = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated = ? WHERE id = ?""",
+                 (worker_id, token, now + LEASE_SECONDS, now, row[0]))
+    conn.execute("COMMIT")
+    return row[0], token, json.loads(row[1])
+
+def heartbeat(conn, item_id, token):
+    """
+    借りている作業の期限を延長する
+
+    Returns:
+    bool: 延長できたかどうか（期限切れで他のワーカーに移った場合はFalse）
+    """
+    now = time.time()
+    updated = conn.execute("""UPDATE items SET lease_expires = ?, updated = ?
+                              WHERE id = ? AND lease_token = ? AND status = 'leased'""",
+                           (now + LEASE_SECONDS, now, item_id, token)).rowcount
+    return updated == 1
+
+def complete_item(conn, item_id, token, result):
+    """作業を完了にする（リースを失っている場合は何もしない）"""
+    updated = conn.execute("""UPDATE items SET status = 'done', result = ?, lease_token = NULL, updated = ?
+                              WHERE id = ? AND lease_token = ? AND status = 'leased'""",
+                           (json.dumps(result, ensure_ascii=False), time.time(), item_id, token)).rowcount
+    return updated == 1
+
+def release_item(conn, item_id, token, error):
+    """作業を実行待ちに戻す（試行回数を超えた場合は失敗にする）"""
+    conn.execute("""UPDATE items SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                    worker = NULL, lease_token = NULL, error = ?, updated = ?
+                    WHERE id = ? AND lease_token = ? AND status = 'leased'""",
+                 (MAX_ATTEMPTS, error, time.time(), item_id, token))
+
+def queue_status(conn, run_id=None):
+    """状態ごとの作業の数を返す"""
+    if run_id is None:
+        rows = conn.execute("SELECT status, COUNT(*) FROM items GROUP BY status").fetchall()
+    else:
+        rows = conn.execute("SELECT status, COUNT(*) FROM items WHERE run_id = ? GROUP BY status", (run_id,)).fetchall()
+    status = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+    status.update(dict(rows))
+    return status
+
+def heartbeat_loop(queue_path, item_id, token, stop_event, lost_event):
+    """作業中に定期的にリースを延長する（別スレッドで実行する）"""
+    with closing(connect(queue_path)) as conn:
+        while not stop_event.wait(HEARTBEAT_SECONDS):
+            if not heartbeat(conn, item_id, token):
+                lost_event.set()
+                return
+
+def process_item(tickers, output_dir, config):
+    """
+    作業単位の銘柄を取得して共有の出力ディレクトリに書き出す
+
+    カタログはワーカーごとの複製に登録し、更新した銘柄のエントリを結果として返す
+    （catalog.jsonへの反映はコーディネーターがまとめて行う）。
+
+    Returns:
+    dict: 結果（entries・fetched・failed・seconds）
+    """
+    started = time.time()
+    catalog = load_catalog(output_dir)
+    use_japanese_columns = config.get("use_japanese_columns", False)
+    export_formats = config.get("export_formats")
+    configured_exchanges = {item["symbol"]: item.get("exchange") for item in config.get("tickers", [])}
+    fetched, failed = [], []
+    for ticker, name in tickers.items():
+        print(f"\n{ticker}（{name}）の株価データを取得中...")
+        if stock_data_all_new.fetch_ticker_data(ticker, name, catalog, output_dir, use_japanese_columns, export_formats,
+                                                config, configured_exchanges.get(ticker)):
+            fetched.append(ticker)
+        else:
+            failed.append(ticker)
+        for interval in config.get("intraday_intervals", []):
+            try:
+                collect_intraday(ticker, interval, output_dir, catalog)
+            except Exception as e:
+                print(f"{interval}データの取得中にエラーが発生しました: {e}")
+        # 連続リクエストによるAPIの制限を避けるため少し待つ
+        time.sleep(1)
+
+    entries = {ticker: catalog["symbols"][ticker] for ticker in tickers if ticker in catalog["symbols"]}
+    return {"entries": entries, "fetched": fetched, "failed": failed, "seconds": time.time() - started}
+
+def run_worker(output_dir, queue_path, worker_id=None, config=None):
+    """
+    ワーカー：作業を借りて処理し、作業がなくなったら終了する
+
+    他のワーカーが作業中の場合は、その作業が期限切れで戻される可能性があるため待ち続ける。
+
+    Returns:
+    int: 完了した作業の数
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    config = config or stock_data_all_new.load_config()
+    completed = 0
+    with closing(connect(queue_path)) as conn:
+        while True:
+            leased = lease_item(conn, worker_id)
+            if leased is None:
+                status = queue_status(conn)
+                if status["pending"] == 0 and status["leased"] == 0:
+                    break
+                time.sleep(POLL_SECONDS)
+                continue
+
+            item_id, token, tickers = leased
+            print(f"[{worker_id}] 作業{item_id}を開始します（{len(tickers)}銘柄）")
+            stop_event, lost_event = threading.Event(), threading.Event()
+            beater = threading.Thread(target=heartbeat_loop, args=(queue_path, item_id, token, stop_event, lost_event),
+                                      daemon=True)
+            beater.start()
+            try:
+                result = process_item(tickers, output_dir, config)
+            except Exception as e:
+                release_item(conn, item_id, token, f"{type(e).__name__}: {e}")
+                print(f"[{worker_id}] 作業{item_id}でエラーが発生しました: {e}")
+                continue
+            finally:
+                stop_event.set()
+                beater.join()
+
+            if lost_event.is_set() or not complete_item(conn, item_id, token, result):
+                print(f"[{worker_id}] 作業{item_id}のリースが期限切れになったため結果を破棄しました")
+                continue
+            completed += 1
+            print(f"[{worker_id}] 作業{item_id}が完了しました（{result['seconds']:.1f}秒）")
+    print(f"[{worker_id}] 作業がなくなったため終了します（完了: {completed}件）")
+    return completed
+
+def merge_results(conn, run_id, output_dir):
+    """
+    完了した作業の結果をカタログに反映する
+
+    Returns:
+    tuple: (カタログ, 取得できた銘柄のリスト, 失敗した銘柄のリスト)
+    """
+    catalog = load_catalog(output_dir)
+    fetched, failed = [], []
+    rows = conn.execute("SELECT status, tickers, result FROM items WHERE run_id = ? ORDER BY id", (run_id,)).fetchall()
+    for status, tickers, result in rows:
+        if status != "done":
+            failed.extend(json.loads(tickers))
+            continue
+        result = json.loads(result)
+        catalog["symbols"].update(result["entries"])
+        fetched.extend(result["fetched"])
+        failed.extend(result["failed"])
+    save_catalog(catalog, output_dir)
+    return catalog, fetched, failed
+
+def run_coordinator(output_dir, queue_path, tickers, shard_size=SHARD_SIZE, local_workers=0, config=None):
+    """
+    コーディネーター：銘柄を作業単位に分けてキューに入れ、完了まで監視して結果をカタログに反映する
+
+    Parameters:
+    output_dir (str): 共有の出力ディレクトリ
+    queue_path (str): 作業キューのパス
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    shard_size (int): 1つの作業単位の銘柄数
+    local_workers (int): このマシンで起動するワーカーの数（0の場合は他のマシンのワーカーを待つ）
+    config (dict): 設定
+
+    Returns:
+    tuple: (取得できた銘柄のリスト, 失敗した銘柄のリスト)
+    """
+    started = time.time()
+    with closing(connect(queue_path)) as conn:
+        run_id = create_run(conn, tickers, shard_size)
+        total = queue_status(conn, run_id)["pending"]
+        print(f"実行ID {run_id}: {len(tickers)}銘柄を{total}個の作業に分けました")
+
+        processes = []
+        for i in range(local_workers):
+            process = multiprocessing.Process(target=run_worker, args=(output_dir, queue_path, None, config))
+            process.start()
+            processes.append(process)
+
+        while True:
+            requeued = requeue_expired(conn)
+            if requeued:
+                print(f"期限切れの作業を{requeued}件戻しました")
+            status = queue_status(conn, run_id)
+            if status["pending"] == 0 and status["leased"] == 0:
+                break
+            print(f"進捗: 完了 {status['done']}/{total}  作業中 {status['leased']}  待ち {status['pending']}  "
+                  f"失敗 {status['failed']}")
+            time.sleep(POLL_SECONDS)
+
+        for process in processes:
+            process.join()
+
+        catalog, fetched, failed = merge_results(conn, run_id, output_dir)
+
+    elapsed = time.time() - started
+    print(f"\n取得完了: {len(fetched)}銘柄を{elapsed:.1f}秒で取得しました"
+          f"（{len(fetched) / max(elapsed, 1e-9) * 60:.1f}銘柄/分）")
+    if failed:
+        print(f"取得できなかった銘柄: {', '.join(failed)}")
+    if fetched:
+        config = config or {}
+        all_tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])} or tickers
+        # 追記された足を検証する（設定の quarantine_bad_bars が true の場合は問題のある足を隔離する）
+        if config.get("validate", True):
+            try:
+                data_validator.validate_universe(output_dir, catalog, all_tickers, config,
+                                                 quarantine=config.get("quarantine_bad_bars", False))
+            except Exception as e:
+                print(f"データの検証中にエラーが発生しました: {e}")
+        summary_table.update_summary(output_dir, catalog, all_tickers)
+        # 今回の実行の時点のファイルを履歴に記録する（設定の history が false の場合は記録しない）
+        try:
+            versioned_store.snapshot_after_fetch(output_dir, catalog, config)
+        except Exception as e:
+            print(f"履歴の記録中にエラーが発生しました: {e}")
+    return fetched, failed
+
+def main():
+    """
+    メイン関数：複数のワーカーで株価データを分担して取得する
+
+    使い方:
+        python distributed_fetch.py coordinator [-shard 20] [-force]    作業をキューに入れて完了を待つ
+        python distributed_fetch.py worker [-id 名前]                   キューの作業を処理する（各マシンで実行）
+        python distributed_fetch.py local [-workers 4] [-shard 20]      このマシンで複数のワーカーを起動して取得する
+        python distributed_fetch.py status                              キューの状態を表示する
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    queue_path = os.path.join(output_dir, QUEUE_FILE_NAME)
+    os.makedirs(output_dir, exist_ok=True)
+
+    args = sys.argv[1:]
+    mode = args[0] if args else "status"
+    shard_size = int(args[args.index("-shard") + 1]) if "-shard" in args[:-1] else SHARD_SIZE
+
+    if mode == "worker":
+        worker_id = args[args.index("-id") + 1] if "-id" in args[:-1] else None
+        run_worker(output_dir, queue_path, worker_id, config)
+    elif mode in ("coordinator", "local"):
+        tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+        if "-force" not in args:
+            tickers, skipped = select_tickers_to_refresh(tickers, load_catalog(output_dir), config)
+            if skipped:
+                print(f"前回の取得以降に確定した取引セッションがない{len(skipped)}銘柄をスキップします。")
+        if not tickers:
+            print("更新が必要な銘柄はありません。")
+            return
+        local_workers = 0
+        if mode == "local":
+            local_workers = int(args[args.index("-workers") + 1]) if "-workers" in args[:-1] else os.cpu_count() or 1
+        run_coordinator(output_dir, queue_path, tickers, shard_size, local_workers, config)
+    elif mode == "status":
+        with closing(connect(queue_path)) as conn:
+            print(queue_status(conn))
+    else:
+        print(main.__doc__)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import numpy as np
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets法で折れ線グラフ用にデータ点を間引く
+
+    最初と最後の点を残し、残りを threshold-2 個のバケットに分けて、
+    各バケットから前に選んだ点と次のバケットの平均点で作る三角形の面積が
+    最大になる点を1つずつ選ぶ。高値・安値の形を保ったまま点数を減らせる。
+
+    Parameters:
+    x (array-like): X座標（昇順）
+    y (array-like): Y座標
+    threshold (int): 間引いた後の点の数
+
+    Returns:
+    tuple: (間引いたX座標, 間引いたY座標) のNumPy配列
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # 欠損値は描画できないため除外する
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+
+    # バケットの境界（最初と最後の点は除く）
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    selected = np.empty(threshold, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+
+        # 次のバケットの平均点（最後のバケットの次は最後の点）
+        next_start = edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # 三角形の面積（の2倍）が最大になる点を選ぶ
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+
+    return x[selected], y[selected]
+
+def minmax_envelope(x, y, buckets):
+    """
+    データ点をバケットごとの最小値・最大値に集約する（ローソク足のような縦線の描画用）
+
+    Parameters:
+    x (array-like): X座標（昇順）
+    y (array-like): Y座標
+    buckets (int): バケットの数
+
+    Returns:
+    tuple: (各バケットの先頭のX座標, 最小値, 最大値) のNumPy配列
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x, y = x[valid], y[valid]
+
+    n = len(x)
+    if n == 0:
+        return x, y, y
+    buckets = min(buckets, n)
+    starts = np.unique(np.linspace(0, n, buckets, endpoint=False).astype(int))
+    return x[starts], np.minimum.reduceat(y, starts), np.maximum.reduceat(y, starts)
@@ -0,0 +1,242 @@
+import os
+import time
+import sqlite3
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from artifact_catalog import register_frame, register_artifact, lookup_entry, make_safe_ticker, make_safe_name, WORKBOOK
+from columnar_store import get_store_dir, write_frame, register_store
+from price_store import JAPANESE_COLUMNS
+from csv_compression import (resolve_compression, get_csv_suffix, get_to_csv_options, find_csv_variants,
+                             round_float_columns)
+from file_lock import file_lock, atomic_path
+
+# 既定で書き出す形式（設定ファイルの "export_formats" で変更できる）
+DEFAULT_FORMATS = ["csv", "xlsx", "store"]
+
+# SQL形式で書き出すデータベースのファイル名（出力ディレクトリ内、期間ごとのテーブルに全銘柄を入れる）
+SQL_FILE_NAME = "株価データ.sqlite"
+
+def make_job(ticker, name, period_data, output_dir, use_japanese_columns, options=None):
+    """
+    書き出すデータを一度だけ整える
+
+    カラム名の変更とExcel用のタイムゾーンの削除はここで一度だけ行い、各形式はそれを共有する。
+    列のデータはコピーせず、元のデータフレームを参照する（小数の有効桁数を指定した場合は丸めたコピー）。
+
+    Parameters:
+    ticker (str): ティッカーシンボル
+    name (str): 銘柄名
+    period_data (dict): 期間名 → 英語カラム名・日時インデックスのデータフレーム
+    output_dir (str): 出力ディレクトリ
+    use_japanese_columns (bool): カラム名を日本語にするかどうか
+    options (dict): 書き出しの設定（csv_compression・csv_float_precision）
+
+    Returns:
+    dict: 書き出しの情報
+    """
+    options = options or {}
+    # 小数の有効桁数を指定した場合は全ての形式に丸めた値を書き出す（CSVと列ファイルなどの値を揃える）
+    float_precision = options.get("csv_float_precision")
+    if float_precision:
+        period_data = {period_name: round_float_columns(data, float_precision)
+                       for period_name, data in period_data.items()}
+    frames = {}
+    excel_indexes = {}
+    for period_name, data in period_data.items():
+        frames[period_name] = data.rename(columns=JAPANESE_COLUMNS) if use_japanese_columns else data
+        index = data.index.tz_localize(None) if data.index.tz is not None else data.index
+        excel_indexes[period_name] = index.rename('日付' if use_japanese_columns else 'Date')
+
+    safe_name = make_safe_name(name)
+    return {
+        "ticker": ticker,
+        "output_dir": output_dir,
+        "safe_name": safe_name,
+        "base_name": f"{make_safe_ticker(ticker)}_{safe_name}",
+        "sources": period_data,
+        "frames": frames,
+        "excel_indexes": excel_indexes,
+        "csv_compression": resolve_compression(options.get("csv_compression"))
+    }
+
+def write_csv(job):
+    """
+    期間ごとのCSVファイルに書き出す
+
+    圧縮形式を指定した場合は .csv.gz / .csv.zst に書き出し、期間ごとに並列に圧縮する
+    （gzip・zstdの圧縮中はGILを解放するため、スレッドで並列に処理できる）。
+    """
+    compression = job["csv_compression"]
+    options = get_to_csv_options(compression)
+
+    def write(period_name, frame):
+        csv_path = os.path.join(job["output_dir"], f"{job['base_name']}_{period_name}{get_csv_suffix(compression)}")
+        with file_lock(csv_path):
+            with atomic_path(csv_path) as tmp_path:
+                frame.to_csv(tmp_path, encoding='utf-8-sig', **options)
+            # 圧縮形式を変えた場合は以前の形式のファイルを削除する（カタログは新しいファイルを指す）
+            for old_path in find_csv_variants(csv_path):
+                os.remove(old_path)
+        return {"key": period_name, "path": csv_path, "frame": frame}
+
+    if compression is None:
+        return [write(period_name, frame) for period_name, frame in job["frames"].items()]
+    with ThreadPoolExecutor(max_workers=len(job["frames"]) or 1) as executor:
+        return list(executor.map(lambda item: write(*item), job["frames"].items()))
+
+def write_xlsx(job):
+    """全期間のデータを1つのExcelファイルのシートに書き出す"""
+    safe_name = job["safe_name"]
+    excel_path = os.path.join(job["output_dir"], f"{job['base_name']}.xlsx")
+    with file_lock(excel_path), atomic_path(excel_path) as tmp_path:
+        with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
+            for period_name, frame in job["frames"].items():
+                # シート名（31文字以内に制限）
+                sheet_name = f"{safe_name[:15]}_{period_name}" if len(safe_name) > 15 else f"{safe_name}_{period_name}"
+                sheet_name = sheet_name[:31]
+                frame.set_axis(job["excel_indexes"][period_name], axis=0).to_excel(writer, sheet_name=sheet_name)
+    return [{"key": WORKBOOK, "path": excel_path}]
+
+def write_store(job):
+    """期間ごとの列ファイル（read_pricesが読む形式）に書き出す"""
+    artifacts = []
+    for period_name, data in job["sources"].items():
+        store_dir = get_store_dir(job["output_dir"], job["ticker"], period_name)
+        meta = write_frame(store_dir, data, source={"interval": period_name})
+        artifacts.append({"key": period_name, "path": store_dir, "store_meta": meta})
+    return artifacts
+
+def write_parquet(job):
+    """期間ごとのParquetファイルに書き出す（pyarrowが必要）"""
+    artifacts = []
+    for period_name, frame in job["frames"].items():
+        parquet_path = os.path.join(job["output_dir"], f"{job['base_name']}_{period_name}.parquet")
+        with file_lock(parquet_path), atomic_path(parquet_path) as tmp_path:
+            frame.to_parquet(tmp_path)
+        artifacts.append({"key": f"parquet:{period_name}", "path": parquet_path, "frame": frame})
+    return artifacts
+
+def write_sql(job):
+    """
+    SQLiteデータベースの期間ごとのテーブルに書き出す（銘柄の既存の行は置き換える）
+
+    全銘柄で1つのテーブルを共有するため、カラム名の設定にかかわらず英語のカラム名で書き出す。
+    """
+    db_path = os.path.join(job["output_dir"], SQL_FILE_NAME)
+    ticker = job["ticker"]
+    with closing(sqlite3.connect(db_path, timeout=30)) as conn, conn:
+        for period_name, data in job["sources"].items():
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{period_name}")')]
+            if columns:
+                conn.execute(f'DELETE FROM "{period_name}" WHERE Symbol = ?', (ticker,))
+                # 銘柄によって列が増える場合（投資信託のCapital Gainsなど）は列を追加する
+                for col in data.columns:
+                    if col not in columns:
+                        conn.execute(f'ALTER TABLE "{period_name}" ADD COLUMN "{col}" REAL')
+            table = data.set_axis(data.index.map(lambda ts: ts.isoformat()), axis=0)
+            table.insert(0, "Symbol", ticker)
+            table.to_sql(period_name, conn, if_exists='append', index=True, index_label='Date')
+    return [{"key": "sql", "path": db_path}]
+
+# 書き出し形式 → 書き出す関数（関数は書き出したファイルの一覧を返す）
+WRITERS = {
+    "csv": write_csv,
+    "xlsx": write_xlsx,
+    "store": write_store,
+    "parquet": write_parquet,
+    "sql": write_sql
+}
+
+def register_writer(name, writer):
+    """
+    書き出し形式を追加する
+
+    Parameters:
+    name (str): 形式名（設定ファイルの "export_formats" に書く名前）
+    writer (function): 書き出しの情報を受け取り、[{"key": カタログのキー, "path": パス}] を返す関数
+    """
+    WRITERS[name] = writer
+
+def run_writer(name, job):
+    """1つの形式を書き出し、所要時間と結果を返す（例外は結果に含める）"""
+    started = time.perf_counter()
+    result = {"writer": name, "artifacts": [], "error": None}
+    try:
+        result["artifacts"] = WRITERS[name](job)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def register_results(catalog, ticker, output_dir, results, fetched=None):
+    """
+    書き出したファイルをカタログに登録する
+
+    fetched にはデータを取得した日時を渡し、再取得の判定（market_calendar.needs_refresh）に使う。
+
+    列ファイルは対応するCSVのバージョンを記録するため、CSVなどのファイルを登録した後に登録する。
+    今回のCSVの書き出しが失敗した期間の列ファイルは、前回のCSVと内容が一致しないため登録しない。
+    """
+    stores = []
+    csv_written = set()
+    for result in results:
+        if result["writer"] == "csv" and not result["error"]:
+            csv_written.update(artifact["key"] for artifact in result["artifacts"])
+        for artifact in result["artifacts"]:
+            if "store_meta" in artifact:
+                stores.append(artifact)
+            elif "frame" in artifact:
+                register_frame(catalog, ticker, artifact["key"], artifact["path"], output_dir, artifact["frame"],
+                               fetched=fetched)
+            else:
+                register_artifact(catalog, ticker, artifact["key"], artifact["path"], output_dir, fetched=fetched)
+
+    for artifact in stores:
+        if artifact["key"] not in csv_written or lookup_entry(catalog, ticker, artifact["key"]) is None:
+            # 今回CSVを書き出していない場合は読み込み時にCSVと内容が食い違うため登録しない
+            continue
+        register_store(catalog, ticker, artifact["key"], artifact["path"], output_dir, artifact["store_meta"])
+
+def export_ticker(ticker, name, period_data, catalog, output_dir, use_japanese_columns, formats=None, options=None,
+                  fetched=None):
+    """
+    1銘柄のデータを指定した形式に並列に書き出し、カタログに登録する
+
+    形式ごとに別のスレッドで書き出すため、形式を追加しても他の形式の書き出しは待たされない。
+
+    Parameters:
+    ticker (str): ティッカーシンボル
+    name (str): 銘柄名
+    period_data (dict): 期間名 → 英語カラム名・日時インデックスのデータフレーム
+    catalog (dict): 成果物カタログ
+    output_dir (str): 出力ディレクトリ
+    use_japanese_columns (bool): カラム名を日本語にするかどうか
+    formats (list): 書き出す形式（省略時は DEFAULT_FORMATS）
+    options (dict): 書き出しの設定（設定ファイルの csv_compression・csv_float_precision）
+    fetched (str): データを取得した日時
+
+    Returns:
+    list: 形式ごとの結果（writer・seconds・artifacts・error）
+    """
+    formats = formats or DEFAULT_FORMATS
+    unknown = [f for f in formats if f not in WRITERS]
+    if unknown:
+        print(f"警告: 対応していない書き出し形式です: {', '.join(unknown)}")
+    formats = [f for f in formats if f in WRITERS]
+
+    job = make_job(ticker, name, period_data, output_dir, use_japanese_columns, options)
+    with ThreadPoolExecutor(max_workers=max(len(formats), 1)) as executor:
+        results = list(executor.map(lambda f: run_writer(f, job), formats))
+
+    # カタログの更新は呼び出し元のスレッドでまとめて行う
+    register_results(catalog, ticker, output_dir, results, fetched)
+
+    for result in results:
+        if result["error"]:
+            print(f"  {result['writer']}: エラー {result['error']}")
+        else:
+            print(f"  {result['writer']}: {len(result['artifacts'])}ファイル {result['seconds']:.2f}秒")
+    return results
@@ -0,0 +1,149 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+# ロックファイルを置くディレクトリ名（対象ファイルと同じディレクトリ内に作る）
+LOCK_DIR_NAME = ".locks"
+
+# ロックを待つ最大時間（秒）
+LOCK_TIMEOUT = 60
+
+# ロックが取得できない場合に再試行する間隔（秒）
+LOCK_POLL_SECONDS = 0.05
+
+# このスレッドが取得中のロック（同じファイルを入れ子でロックした場合は外側のロックを使う）
+_held = threading.local()
+
+def get_lock_path(path):
+    """
+    ファイルに対応するロックファイルのパスを返す
+
+    対象ファイルは一時ファイルとの置き換えで別のファイルになるため、ロックは別のファイルで取る。
+    """
+    abs_path = os.path.abspath(path)
+    return os.path.join(os.path.dirname(abs_path), LOCK_DIR_NAME, os.path.basename(abs_path) + ".lock")
+
+def try_lock(f, shared):
+    """
+    ロックファイルのロックを待たずに取得する
+
+    fcntlが使える場合は読み込み用（共有）と書き込み用（排他）を区別する。
+    Windows（msvcrt）では共有ロックがないため、読み込みも排他ロックで行う。
+    どちらも使えない環境ではロックせずに続ける。
+
+    Returns:
+    bool: ロックを取得できたかどうか
+    """
+    if fcntl is not None:
+        try:
+            fcntl.flock(f.fileno(), (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            return True
+        except BlockingIOError:
+            return False
+    if msvcrt is not None:
+        try:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+    return True
+
+def release_lock(f):
+    """ロックファイルのロックを解放する"""
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path, shared=False, timeout=LOCK_TIMEOUT):
+    """
+    ファイルを読み書きする間、他のプロセスからの書き込みを待たせる
+
+    読み込み（shared=True）は同時に何個でも取得でき、書き込みは1つだけ取得できる。
+    読み込み→変更→書き込みを行う場合は、最初から書き込み用のロックを取る。
+
+    Parameters:
+    path (str): ロックするファイルのパス
+    shared (bool): Trueの場合は読み込み用のロックを取る
+    timeout (float): ロックを待つ最大時間（秒、Noneの場合は無期限に待つ）
+    """
+    lock_path = get_lock_path(path)
+    held = getattr(_held, "paths", None)
+    if held is None:
+        held = _held.paths = set()
+    if lock_path in held:
+        yield
+        return
+
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a+b') as f:
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not try_lock(f, shared):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"{os.path.basename(path)} のロックを{timeout}秒以内に取得できませんでした"
+                                   "（他の処理が使用中です）")
+            time.sleep(LOCK_POLL_SECONDS)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            release_lock(f)
+
+def get_tmp_path(path):
+    """
+    書き込み用の一時ファイルのパスを返す
+
+    プロセス・スレッドごとに別の名前にし、拡張子は元のファイルと同じにする
+    （pandas・openpyxlは拡張子から形式を判定するため）。
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}-{threading.get_ident()}.tmp{ext}"
+
+@contextmanager
+def atomic_path(path):
+    """
+    一時ファイルのパスを渡し、書き込みが成功した場合だけ元のファイルと置き換える
+
+    読み込む側には書き込み途中のファイルが見えない。書き込みに失敗した場合は一時ファイルを削除する。
+
+    使い方:
+    with atomic_path(csv_path) as tmp_path:
+        df.to_csv(tmp_path)
+    """
+    tmp_path = get_tmp_path(path)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def read_json(path):
+    """JSONファイルを読み込み用のロックを取って読み込む"""
+    with file_lock(path, shared=True):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+def write_json(path, data, indent=2):
+    """JSONファイルを書き込み用のロックを取り、一時ファイルとの置き換えで書き込む"""
+    with file_lock(path), atomic_path(path) as tmp_path:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=indent)
+            f.flush()
+            os.fsync(f.fileno())
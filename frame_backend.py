@@ -0,0 +1,386 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.tseries.frequencies import to_offset
+from pandas.tseries import offsets
+
+from csv_compression import get_compression_method, read_csv_bytes
+from file_lock import read_json
+from artifact_catalog import CONFIG_FILE
+
+try:
+    import polars as pl
+except ImportError:
+    pl = None
+
+# 選べる計算処理の実装（設定ファイルの "backend" で指定する）
+BACKENDS = ("pandas", "polars")
+
+# 既定の実装
+DEFAULT_BACKEND = "pandas"
+
+# 型を推定するために読む行数（pandasが書き出したCSVは浮動小数の列に必ず小数点があるため少なくてよい）
+INFER_SCHEMA_ROWS = 10000
+
+# 日時の列の形式（pandasが書き出す形式）と、polarsで読む場合の書式
+DATE_FORMATS = [
+    (re.compile(r"^\d{4}-\d{2}-\d{2}$"), "%Y-%m-%d", False),
+    (re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$"), "%Y-%m-%d %H:%M:%S", False),
+    (re.compile(r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}[+-]\d{2}:\d{2}$"), "%Y-%m-%d %H:%M:%S%:z", True)
+]
+
+# 現在の実装（プロセス内で共有する）
+_backend = DEFAULT_BACKEND
+
+def resolve_backend(backend):
+    """
+    設定ファイルの実装名を確認する
+
+    polarsが指定されていてもインストールされていない場合はpandasを使う。
+
+    Returns:
+    str: "pandas" または "polars"
+    """
+    backend = str(backend or DEFAULT_BACKEND).lower()
+    if backend not in BACKENDS:
+        print(f"警告: 対応していない実装です: {backend}（{' または '.join(BACKENDS)}）。pandasを使います。")
+        return DEFAULT_BACKEND
+    if backend == "polars" and pl is None:
+        print("警告: polarsで処理するには polars が必要です（pip install polars）。pandasを使います。")
+        return DEFAULT_BACKEND
+    return backend
+
+def set_backend(backend):
+    """CSVの読み込み・足の集計に使う実装を切り替える（切り替え後の実装名を返す）"""
+    global _backend
+    _backend = resolve_backend(backend)
+    return _backend
+
+def get_backend():
+    """現在の実装名を返す"""
+    return _backend
+
+def load_backend_config():
+    """設定ファイルの "backend" を読み込んで実装を切り替える"""
+    backend = DEFAULT_BACKEND
+    if os.path.exists(CONFIG_FILE):
+        try:
+            backend = read_json(CONFIG_FILE).get("backend", DEFAULT_BACKEND)
+        except Exception as e:
+            print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
+    return set_backend(backend)
+
+def use_polars():
+    return _backend == "polars"
+
+# ===== CSVの読み込み =====
+
+def parse_date_column(values, parse_dates, tz=None):
+    """
+    日時の列（文字列）をDatetimeIndexに変換する
+
+    pandasが書き出す決まった形式の場合はpolarsで並列に変換し、それ以外の形式やタイムゾーンを
+    指定しない場合は parse_dates（pandas）で変換する。結果の型・時刻の単位はpandasで変換した場合と同じにする。
+    """
+    sample = values.drop_nulls().head(1).to_list()
+    if not sample or values.null_count() > 0:
+        return parse_dates(pd.Index(values.to_list()), tz)
+    for pattern, date_format, has_offset in DATE_FORMATS:
+        if not pattern.match(sample[0]):
+            continue
+        if has_offset and tz is None:
+            # オフセットが1種類の場合と混在する場合でpandasの結果の型が変わるため、pandasに任せる
+            break
+        try:
+            parsed = values.str.to_datetime(date_format, time_unit='us', time_zone='UTC' if has_offset else None)
+        except Exception:
+            break
+        unit = pd.Timestamp(sample[0]).unit
+        index = pd.DatetimeIndex(parsed.to_numpy()).as_unit(unit)
+        if has_offset:
+            index = index.tz_localize('UTC').tz_convert(tz)
+        return index
+    return parse_dates(pd.Index(values.to_list()), tz)
+
+def read_price_csv_polars(path, parse_dates, tz=None, skip_rows=0):
+    """
+    価格のCSVファイルをpolarsで読み込む（複数スレッドで解析する）
+
+    price_store.read_price_csv と同じデータフレーム（カラム名の変換前）を返す。
+    数値でない列があるなど、pandasと同じ結果にならない可能性がある場合はNoneを返す（呼び出し元がpandasで読む）。
+
+    Parameters:
+    path (str): CSVファイルのパス（.csv.gz・.csv.zst も可）
+    parse_dates (function): pandasで日時を変換する関数（決まった形式でない場合に使う）
+    tz (str): 変換先のタイムゾーン
+    skip_rows (int): 読み飛ばすデータ行の数
+
+    Returns:
+    pd.DataFrame: 日時インデックスのデータフレーム（読めない場合はNone）
+    """
+    source = read_csv_bytes(path) if get_compression_method(path) else path
+    try:
+        table = pl.read_csv(source, skip_rows_after_header=skip_rows, infer_schema_length=INFER_SCHEMA_ROWS,
+                            encoding='utf8')
+    except Exception:
+        return None
+    if table.width == 0:
+        return None
+
+    date_name = table.columns[0]
+    columns = table.columns[1:]
+    if any(not table.schema[col].is_numeric() for col in columns):
+        return None
+
+    index = parse_date_column(table[date_name].cast(pl.String), parse_dates, tz)
+    index.name = date_name or None
+    data = {col: table[col].to_numpy() for col in columns}
+    return pd.DataFrame(data, index=index, columns=columns)
+
+# ===== 足の集計 =====
+# 銘柄ごとの小さなデータフレームを1つずつpolarsに変換すると変換の手間の方が大きくなるため、
+# 全銘柄を銘柄の番号（__symbol__）の列を付けた1つのデータフレームにまとめ、1回の集計で全銘柄を処理する。
+
+def split_by_schema(frames):
+    """
+    列名と型が同じ銘柄ごとにまとめる（投資信託のCapital Gainsなど、列が違う銘柄は別々に集計する）
+
+    Returns:
+    list: {銘柄: データフレーム} のリスト
+    """
+    batches = {}
+    for symbol, df in frames.items():
+        schema = tuple((col, str(dtype)) for col, dtype in df.dtypes.items())
+        batches.setdefault(schema, {})[symbol] = df
+    return list(batches.values())
+
+def to_polars_universe(frames):
+    """
+    列名と型が同じ複数銘柄のデータフレームを、1つのpolarsのデータフレームにまとめる
+
+    銘柄は __symbol__ 列の番号（frames の順）、日時は __date__ 列にする。
+    日時は取引所の現地時間（タイムゾーンなし）にする（pandasも現地時間の暦で集計するため）。
+    欠損値（NaN）はnullにする（pandasの集計と同じく欠損値を飛ばすため）。
+    """
+    dfs = list(frames.values())
+    lengths = [len(df) for df in dfs]
+    dates = [(df.index.tz_localize(None) if df.index.tz is not None else df.index).as_unit('us').to_numpy()
+             for df in dfs]
+    columns = {
+        "__symbol__": pl.Series("__symbol__", np.repeat(np.arange(len(dfs), dtype=np.int32), lengths)),
+        "__date__": pl.Series("__date__", np.concatenate(dates))
+    }
+    for col in dfs[0].columns:
+        values = np.concatenate([df[col].to_numpy() for df in dfs])
+        columns[col] = pl.Series(col, values, nan_to_null=values.dtype.kind == 'f')
+    return pl.DataFrame(columns)
+
+def get_aggregation_exprs(df, aggregation):
+    """
+    集計方法（first・last・max・min・sum）をpolarsの式にする（pandasと同じく欠損値は飛ばす）
+
+    浮動小数の合計はpandasが補正付きの加算（Kahan法）で計算するため、polarsでは計算せず
+    aggregate_universe で全銘柄まとめてpandasの groupby で計算する（結果をpandasと同じ値にするため）。
+
+    Returns:
+    tuple: (polarsの式のリスト, pandasで合計する列のリスト)（対応しない集計方法がある場合はNone）
+    """
+    exprs = []
+    pandas_sums = []
+    for col, how in aggregation.items():
+        if col not in df.columns:
+            continue
+        expr = pl.col(col)
+        if how == 'first':
+            expr = expr.drop_nulls().first()
+        elif how == 'last':
+            expr = expr.drop_nulls().last()
+        elif how == 'max':
+            expr = expr.max()
+        elif how == 'min':
+            expr = expr.min()
+        elif how == 'sum':
+            if df[col].dtype.kind == 'f':
+                pandas_sums.append(col)
+                continue
+            expr = expr.sum()
+        else:
+            return None
+        exprs.append(expr.alias(col))
+    return exprs, pandas_sums
+
+def aggregate_universe(frames, key, aggregation):
+    """
+    複数銘柄の足を、行ごとの集計キー（polarsの式）でまとめて集計する
+
+    列名と型が同じ銘柄は1つの遅延評価のクエリ（銘柄・キーごとの group_by、複数スレッドで実行）で集計する。
+
+    Parameters:
+    frames (dict): 銘柄 → 日時インデックスのデータフレーム
+    key (pl.Expr): 現地時間の日時（__date__）から集計キーを求める式（キーの昇順が足の順になるもの）
+    aggregation (dict): 列名 → 集計方法
+
+    Returns:
+    dict: 銘柄 → (キーの配列, {列名: 配列})（対応しない集計方法がある場合はNone）
+    """
+    results = {}
+    for batch in split_by_schema(frames):
+        sample = next(iter(batch.values()))
+        spec = get_aggregation_exprs(sample, aggregation)
+        if spec is None:
+            return None
+        exprs, pandas_sums = spec
+        symbols = list(batch)
+
+        table = to_polars_universe(batch).lazy().with_columns(key.alias("__key__"))
+        queries = [table.group_by(["__symbol__", "__key__"]).agg(exprs).sort(["__symbol__", "__key__"])]
+        if pandas_sums:
+            queries.append(table.select(["__symbol__", "__key__"]))
+        collected = pl.collect_all(queries)
+        grouped = collected[0]
+
+        data = {}
+        if pandas_sums:
+            # pandasの groupby も（銘柄, キー）の昇順に並ぶため、polarsの結果と行が対応する
+            rows = collected[1]
+            values = pd.DataFrame({col: np.concatenate([df[col].to_numpy() for df in batch.values()])
+                                   for col in pandas_sums})
+            sums = values.groupby([rows["__symbol__"].to_numpy(), rows["__key__"].to_numpy()]).sum()
+        for col in [col for col in aggregation if col in sample.columns]:
+            if col in pandas_sums:
+                data[col] = sums[col].to_numpy()
+                continue
+            values = grouped[col].to_numpy()
+            if sample[col].dtype.kind == 'f' and values.dtype.kind != 'f':
+                values = values.astype(np.float64)
+            data[col] = values
+
+        # 結果は銘柄の番号順に並んでいるため、銘柄ごとの範囲に切り分ける
+        codes = grouped["__symbol__"].to_numpy()
+        keys = grouped["__key__"].to_numpy()
+        bounds = np.searchsorted(codes, np.arange(len(symbols) + 1))
+        for i, symbol in enumerate(symbols):
+            part = slice(bounds[i], bounds[i + 1])
+            results[symbol] = (keys[part], {col: values[part] for col, values in data.items()})
+    return results
+
+def calendar_aggregate_universe(frames, period, aggregation):
+    """
+    複数銘柄の足を暦の年・四半期ごとにまとめて集計する（polars）
+
+    銘柄ごとに df.groupby([年, 四半期]).agg(aggregation) と同じ結果を返す。
+
+    Parameters:
+    frames (dict): 銘柄 → 英語カラム名・日時インデックスのデータフレーム
+    period (str): "quarter"（年・四半期ごと）または "year"（年ごと）
+    aggregation (dict): 列名 → 集計方法
+
+    Returns:
+    dict: 銘柄 → 年（と四半期）をインデックスにした集計結果（polarsで集計できない場合はNone）
+    """
+    if not frames or any(not isinstance(df.index, pd.DatetimeIndex) for df in frames.values()):
+        return None
+    date = pl.col("__date__")
+    key = date.dt.year() * 10 + (date.dt.quarter() if period == "quarter" else 0)
+    aggregated = aggregate_universe(frames, key, aggregation)
+    if aggregated is None:
+        return None
+
+    results = {}
+    for symbol, (keys, data) in aggregated.items():
+        year = (keys // 10).astype(np.int32)
+        if period == "quarter":
+            index = pd.MultiIndex.from_arrays([year, (keys % 10).astype(np.int32)])
+        else:
+            index = pd.Index(year)
+        results[symbol] = pd.DataFrame(data, index=index, columns=list(data), copy=False)
+    return results
+
+def calendar_aggregate(df, period, aggregation):
+    """
+    暦の年・四半期ごとに足を集計する（polars、1銘柄の場合。引数は calendar_aggregate_universe と同じ）
+
+    Returns:
+    pd.DataFrame: 年（と四半期）をインデックスにした集計結果（polarsで集計できない場合はNone）
+    """
+    results = calendar_aggregate_universe({0: df}, period, aggregation)
+    return None if results is None else results[0]
+
+def get_bin_key(offset):
+    """
+    pandasの期間指定に対応する、足の日時（現地時間）を求めるpolarsの式を返す
+
+    期間の始まりで区切る指定（D・MS・QS・YS）は期間の始まりに切り捨て、期間の終わりで区切る指定
+    （W・ME・QE・YE）はその日を含む期間の最終日にする（pandasは日中の足もその日の足として扱う）。
+    1より大きい倍数などは対応せずNoneを返す。
+    """
+    if offset.n != 1:
+        return None
+    date = pl.col("__date__")
+    if type(offset) is offsets.Day:
+        return date.dt.truncate("1d")
+    if type(offset) is offsets.MonthBegin:
+        return date.dt.truncate("1mo")
+    if type(offset) is offsets.QuarterBegin and offset.startingMonth == 1:
+        return date.dt.truncate("1q")
+    if type(offset) is offsets.YearBegin and offset.month == 1:
+        return date.dt.truncate("1y")
+
+    day = date.dt.truncate("1d")
+    if type(offset) is offsets.Week and offset.weekday == 6:
+        return day.dt.offset_by(((7 - day.dt.weekday()) % 7).cast(pl.String) + "d")
+    if type(offset) is offsets.MonthEnd:
+        return day.dt.month_end()
+    if type(offset) is offsets.QuarterEnd and offset.startingMonth == 12:
+        return day.dt.truncate("1q").dt.offset_by("1q").dt.offset_by("-1d")
+    if type(offset) is offsets.YearEnd and offset.month == 12:
+        return day.dt.truncate("1y").dt.offset_by("1y").dt.offset_by("-1d")
+    return None
+
+def resample_universe_polars(frames, rule, aggregation):
+    """
+    複数銘柄の足をまとめて任意の期間に変換する（polars）
+
+    銘柄ごとに price_store.resample_ohlcv と同じ結果（取引のない期間は除く）を返す。
+    始値の列がない・空のデータフレームなど、polarsで変換しない銘柄は結果に含めない（呼び出し元がpandasで変換する）。
+
+    Returns:
+    dict: 銘柄 → 変換後のデータフレーム（polarsで変換できない指定の場合はNone）
+    """
+    try:
+        key = get_bin_key(to_offset(rule))
+    except ValueError:
+        return None
+    if key is None:
+        return None
+    frames = {symbol: df for symbol, df in frames.items()
+              if 'Open' in df.columns and isinstance(df.index, pd.DatetimeIndex) and len(df) > 0}
+    aggregated = aggregate_universe(frames, key, aggregation)
+    if aggregated is None:
+        return None
+
+    results = {}
+    for symbol, (keys, data) in aggregated.items():
+        df = frames[symbol]
+        index = pd.DatetimeIndex(keys).as_unit(df.index.unit)
+        if df.index.tz is not None:
+            index = index.tz_localize(df.index.tz)
+        index.name = df.index.name
+        resampled = pd.DataFrame(data, index=index, columns=list(data), copy=False)
+        # 始値のない足（全て欠損の期間）は除く
+        results[symbol] = resampled[resampled['Open'].notna().to_numpy()]
+    return results
+
+def resample_ohlcv_polars(df, rule, aggregation):
+    """
+    足を任意の期間に変換する（polars、1銘柄の場合）
+
+    price_store.resample_ohlcv と同じ結果（取引のない期間は除く）を返す。
+
+    Returns:
+    pd.DataFrame: 変換後のデータフレーム（polarsで変換できない指定の場合はNone）
+    """
+    results = resample_universe_polars({0: df}, rule, aggregation)
+    return None if results is None else results.get(0)
@@ -0,0 +1,283 @@
+import os
+import sys
+import hashlib
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog
+from market_calendar import EXCHANGES, get_exchange
+from price_store import read_prices
+from universe_analytics import ANALYTICS_DIR_NAME, get_data_key, load_cache_meta
+from file_lock import file_lock, atomic_path, write_json
+
+# 取引所ごとの通貨（設定ファイルの銘柄に "currency" を書けばそちらを優先する）
+EXCHANGE_CURRENCIES = {
+    "TSE": "JPY",
+    "NYSE": "USD",
+    "NASDAQ": "USD"
+}
+
+# 換算の経由に優先して使う通貨（直接の為替レートがない場合に使う）
+CROSS_CURRENCY = "USD"
+
+# 共通カレンダーの時点より古い値を使う最大日数（それより古い場合は欠損にする）
+MAX_STALE_DAYS = 7
+
+# 一度に結合する銘柄の数
+CHUNK_SIZE = 256
+
+def parse_fx_symbol(symbol):
+    """
+    為替のティッカーシンボルから通貨の組を返す
+
+    Yahoo Financeの表記では「JPY=X」は1米ドルあたりの円、「EURJPY=X」は1ユーロあたりの円を表す。
+
+    Returns:
+    tuple: (基準通貨, 決済通貨)（為替でない場合はNone）
+    """
+    if not symbol.upper().endswith("=X"):
+        return None
+    code = symbol.upper()[:-2]
+    if len(code) == 3:
+        return "USD", code
+    if len(code) == 6:
+        return code[:3], code[3:]
+    return None
+
+def get_currency(symbol, configured=None):
+    """銘柄の通貨を返す（為替は換算しないためNone）"""
+    if configured:
+        return configured.upper()
+    if parse_fx_symbol(symbol) is not None:
+        return None
+    return EXCHANGE_CURRENCIES.get(get_exchange(symbol), CROSS_CURRENCY)
+
+def find_fx_route(currency, target, pairs):
+    """
+    通貨を換算するための為替レートの組み合わせを探す
+
+    Parameters:
+    currency (str): 換算元の通貨
+    target (str): 換算先の通貨
+    pairs (dict): 為替のシンボル → (基準通貨, 決済通貨)
+
+    Returns:
+    list: [(為替のシンボル, 逆数にするかどうか)]（同じ通貨なら空、換算できない場合はNone）
+    """
+    if currency == target:
+        return []
+
+    def direct(source, dest):
+        for symbol, (base, quote) in pairs.items():
+            if (base, quote) == (source, dest):
+                return [(symbol, False)]
+            if (base, quote) == (dest, source):
+                return [(symbol, True)]
+        return None
+
+    route = direct(currency, target)
+    if route is not None:
+        return route
+
+    # 直接のレートがない場合は1つの通貨を経由する（米ドルを優先する）
+    currencies = {c for pair in pairs.values() for c in pair} - {currency, target}
+    for middle in sorted(currencies, key=lambda c: (c != CROSS_CURRENCY, c)):
+        first, second = direct(currency, middle), direct(middle, target)
+        if first is not None and second is not None:
+            return first + second
+    return None
+
+def get_session_close_times(index, exchange):
+    """
+    日足の日時インデックスを取引終了時刻（UTCのナノ秒）に変換する
+
+    日足は取引日の0時付近（為替はロンドン時間の0時）に記録されているため、
+    取引所のタイムゾーンで12時間進めてから日付を取り出して取引日とする。
+    """
+    tz = EXCHANGES[exchange]["timezone"]
+    close = EXCHANGES[exchange]["close"]
+    local = index.tz_convert(tz) if index.tz is not None else index.tz_localize(tz)
+    session_dates = (local.tz_localize(None) + pd.Timedelta(hours=12)).normalize()
+    offset = pd.Timedelta(hours=close.hour, minutes=close.minute)
+    closes = (session_dates + offset).tz_localize(tz, nonexistent='shift_forward', ambiguous=False)
+    return closes.tz_convert("UTC").as_unit('ns').asi8, session_dates
+
+def load_observations(output_dir, catalog, symbols, column):
+    """
+    全銘柄の値を（銘柄, 取引終了時刻, 値）の縦長の表にまとめる
+
+    Returns:
+    tuple: (観測値のデータフレーム, 銘柄 → 取引日のDatetimeIndex)
+    """
+    frames = []
+    sessions = {}
+    for symbol in symbols:
+        df = read_prices(output_dir, symbol, "日足", catalog)
+        if df is None or df.empty or column not in df.columns:
+            print(f"警告: {symbol} の日足データがありません。スキップします。")
+            continue
+        times, session_dates = get_session_close_times(df.index, get_exchange(symbol))
+        frames.append(pd.DataFrame({"time": times, "symbol": symbol, "value": df[column].to_numpy(dtype=float)}))
+        sessions[symbol] = session_dates
+    if not frames:
+        return pd.DataFrame({"time": [], "symbol": [], "value": []}), sessions
+    observations = pd.concat(frames, ignore_index=True)
+    observations = observations.dropna(subset=["value"]).sort_values("time", kind='stable')
+    return observations.reset_index(drop=True), sessions
+
+def build_calendar(sessions, calendar_exchange):
+    """
+    共通カレンダー（基準の取引所の取引日と、その取引終了時刻）を作る
+
+    基準の取引所の銘柄がない場合は全銘柄の取引日の和集合を使う。
+
+    Returns:
+    tuple: (取引日のDatetimeIndex, 取引終了時刻のUTCのナノ秒)
+    """
+    dates = [d for s, d in sessions.items() if get_exchange(s) == calendar_exchange] or list(sessions.values())
+    calendar = pd.DatetimeIndex([])
+    for session_dates in dates:
+        calendar = calendar.union(session_dates)
+    tz = EXCHANGES[calendar_exchange]["timezone"]
+    close = EXCHANGES[calendar_exchange]["close"]
+    closes = (calendar + pd.Timedelta(hours=close.hour, minutes=close.minute)).tz_localize(
+        tz, nonexistent='shift_forward', ambiguous=False)
+    return calendar.rename('Date'), closes.tz_convert("UTC").as_unit('ns').asi8
+
+def asof_align(observations, calendar_times, symbols):
+    """
+    共通カレンダーの各時点で、その時点までに確定した最新の値を全銘柄まとめて取り出す
+
+    銘柄ごとの as-of 結合を merge_asof の by 指定で1回にまとめ、銘柄を CHUNK_SIZE ずつ処理する。
+
+    Returns:
+    np.ndarray: 行=共通カレンダー・列=銘柄の行列
+    """
+    matrix = np.full((len(calendar_times), len(symbols)), np.nan)
+    tolerance = pd.Timedelta(days=MAX_STALE_DAYS).value
+    for start in range(0, len(symbols), CHUNK_SIZE):
+        chunk = symbols[start:start + CHUNK_SIZE]
+        left = pd.DataFrame({"time": np.repeat(calendar_times, len(chunk)),
+                             "symbol": np.tile(np.array(chunk, dtype=object), len(calendar_times))})
+        right = observations[observations["symbol"].isin(chunk)]
+        merged = pd.merge_asof(left, right, on="time", by="symbol", direction="backward", tolerance=tolerance)
+        matrix[:, start:start + len(chunk)] = merged["value"].to_numpy().reshape(len(calendar_times), len(chunk))
+    return matrix
+
+def get_cache_key(symbols, target_currency, calendar_exchange, column, currencies):
+    """
+    銘柄と条件から計算結果の保存先のキーを作成する
+
+    データバージョンはキーに含めず meta.json に記録し、データが更新された場合は同じフォルダの結果を置き換える。
+    """
+    parts = [f"{s}:{currencies.get(s)}" for s in sorted(symbols)]
+    parts += [f"target={target_currency}", f"calendar={calendar_exchange}", f"column={column}",
+              f"stale={MAX_STALE_DAYS}"]
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def align_universe(output_dir, tickers, target_currency="JPY", calendar_exchange="TSE", column="Close",
+                   currencies=None):
+    """
+    全銘柄を指定した通貨に換算し、共通カレンダーに揃える（データバージョンが同じなら前回の結果を使う）
+
+    米国市場の終値は日本時間の翌朝に確定するため、東京の取引終了時刻を基準にすると前日の終値が並ぶ
+    （先の時点の値を使わない）。為替レートも同じ時点までに確定した値で換算する。
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書（為替のシンボルも含める）
+    target_currency (str): 換算先の通貨
+    calendar_exchange (str): 共通カレンダーの基準にする取引所
+    column (str): 揃える列
+    currencies (dict): 銘柄 → 通貨（設定ファイルで指定された通貨）
+
+    Returns:
+    pd.DataFrame: 行=取引日・列=銘柄の換算済みの値
+    """
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    symbols = list(tickers)
+    currencies = {s: get_currency(s, (currencies or {}).get(s)) for s in symbols}
+    pairs = {s: parse_fx_symbol(s) for s in symbols if parse_fx_symbol(s) is not None}
+
+    cache_dir = os.path.join(output_dir, ANALYTICS_DIR_NAME,
+                             "aligned_" + get_cache_key(symbols, target_currency, calendar_exchange, column, currencies))
+    meta_path = os.path.join(cache_dir, "meta.json")
+    values_path = os.path.join(cache_dir, "values.npy")
+    dates_path = os.path.join(cache_dir, "dates.npy")
+    data_key = get_data_key(catalog, symbols)
+    meta = load_cache_meta(meta_path, data_key)
+    if meta is not None:
+        print(f"データが更新されていないため前回の結果を使用します: {cache_dir}")
+        index = pd.DatetimeIndex(np.load(dates_path).view('datetime64[ns]'), name='Date')
+        return pd.DataFrame(np.load(values_path), index=index, columns=meta["symbols"])
+
+    observations, sessions = load_observations(output_dir, catalog, symbols, column)
+    loaded = [s for s in symbols if s in sessions]
+    calendar, calendar_times = build_calendar(sessions, calendar_exchange)
+    print(f"共通カレンダー: {calendar_exchange}の取引日 {len(calendar)}日 × {len(loaded)}銘柄")
+
+    values = asof_align(observations, calendar_times, loaded)
+
+    # 為替レートは同じ時点の値を使って列ごとに掛ける（または割る）
+    fx_columns = {s: values[:, i] for i, s in enumerate(loaded) if s in pairs}
+    for i, symbol in enumerate(loaded):
+        currency = currencies[symbol]
+        if currency is None:
+            continue
+        route = find_fx_route(currency, target_currency, {s: pairs[s] for s in fx_columns})
+        if route is None:
+            print(f"警告: {symbol} を{currency}から{target_currency}に換算する為替データがありません。")
+            values[:, i] = np.nan
+            continue
+        for fx_symbol, invert in route:
+            values[:, i] = values[:, i] / fx_columns[fx_symbol] if invert else values[:, i] * fx_columns[fx_symbol]
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # 前回のメタ情報を先に削除し、各ファイルは一時ファイルに書いてから置き換える
+    with file_lock(meta_path, timeout=None):
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        with atomic_path(values_path) as tmp_path:
+            np.save(tmp_path, values)
+        with atomic_path(dates_path) as tmp_path:
+            np.save(tmp_path, calendar.as_unit('ns').asi8)
+        # メタ情報は最後に書き込む（途中で失敗した結果をキャッシュとして使わないため）
+        write_json(meta_path, {"symbols": loaded, "target_currency": target_currency, "calendar": calendar_exchange,
+                               "column": column, "currencies": {s: currencies[s] for s in loaded},
+                               "data_key": data_key, "created": datetime.now().isoformat(timespec='seconds')})
+    return pd.DataFrame(values, index=calendar.as_unit('ns'), columns=loaded)
+
+def main():
+    """
+    メイン関数：設定ファイルの全銘柄を通貨換算・共通カレンダーに揃えてCSVに保存する
+
+    使い方: python fx_alignment.py [-currency JPY] [-calendar TSE] [-column Close]
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+    currencies = {item["symbol"]: item["currency"] for item in config.get("tickers", []) if item.get("currency")}
+
+    args = sys.argv[1:]
+    target_currency = args[args.index("-currency") + 1].upper() if "-currency" in args[:-1] else "JPY"
+    calendar_exchange = args[args.index("-calendar") + 1].upper() if "-calendar" in args[:-1] else "TSE"
+    column = args[args.index("-column") + 1] if "-column" in args[:-1] else "Close"
+    if calendar_exchange not in EXCHANGES:
+        print(f"エラー: 不明な取引所です: {calendar_exchange}（{', '.join(EXCHANGES)}）")
+        return
+
+    print("===== 通貨換算・カレンダー調整 =====")
+    print(f"対象銘柄数: {len(tickers)}  換算先: {target_currency}  基準カレンダー: {calendar_exchange}")
+    aligned = align_universe(output_dir, tickers, target_currency, calendar_exchange, column, currencies)
+
+    csv_path = os.path.join(output_dir, f"通貨換算_{column}_{target_currency}.csv")
+    with file_lock(csv_path), atomic_path(csv_path) as tmp_path:
+        aligned.to_csv(tmp_path, encoding='utf-8-sig')
+    print(f"結果を保存しました: {csv_path}")
+    print(aligned.tail())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import os
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+import yfinance as yf
+
+from artifact_catalog import make_safe_ticker, lookup_entry, register_artifact, get_symbol_exchange
+from market_calendar import EXCHANGES, get_exchange
+from file_lock import file_lock, atomic_path
+
+# 分足の保存先（出力ディレクトリ内のサブフォルダ）
+INTRADAY_DIR_NAME = "intraday"
+
+# Yahoo Financeの分足の取得制限（1回のリクエストで取得できる日数, さかのぼれる日数）
+INTRADAY_LIMITS = {
+    "1m": (7, 29),
+    "5m": (59, 59),
+    "15m": (59, 59),
+    "60m": (729, 729)
+}
+
+# 追記時に前回の最後の足から重ねて取得する時間（未確定だった足を取り直すため）
+OVERLAP = timedelta(hours=1)
+
+def get_partition_dir(output_dir, symbol, interval):
+    """銘柄・期間の分足を保存するフォルダのパスを返す"""
+    return os.path.join(output_dir, INTRADAY_DIR_NAME, make_safe_ticker(symbol), interval)
+
+def get_partition_path(output_dir, symbol, interval, month):
+    """月（YYYY-MM）ごとのパーティションファイルのパスを返す"""
+    return os.path.join(get_partition_dir(output_dir, symbol, interval), f"{month}.csv")
+
+def get_timezone(symbol, catalog=None):
+    """銘柄の取引所のタイムゾーン名を返す（カタログに設定ファイルの取引所があればそれを使う）"""
+    configured = get_symbol_exchange(catalog, symbol) if catalog is not None else None
+    return EXCHANGES[get_exchange(symbol, configured)]["timezone"]
+
+def read_partition(path, tz):
+    """パーティションファイルを読み込み、取引所のタイムゾーンの日時インデックスにする"""
+    df = pd.read_csv(path, index_col=0)
+    df.index = pd.to_datetime(df.index, utc=True).tz_convert(tz)
+    df.index.name = 'Datetime'
+    return df
+
+def append_bars(df, output_dir, symbol, interval, catalog):
+    """
+    分足データを月ごとのパーティションに追記する
+
+    新しい足が含まれる月のファイルだけを読み書きし、それより古いパーティションには触れない。
+    同じ時刻の足は新しいデータで上書きする。
+
+    Parameters:
+    df (pd.DataFrame): 追記する分足データ（日時インデックス）
+    output_dir (str): 出力ディレクトリ
+    symbol (str): ティッカーシンボル
+    interval (str): 期間コード（1m、5m、15m、60m）
+    catalog (dict): 成果物カタログ
+
+    Returns:
+    int: 書き込んだパーティションの数
+    """
+    if df.empty:
+        return 0
+
+    tz = get_timezone(symbol, catalog)
+    df = df.copy()
+    df.index = pd.to_datetime(df.index, utc=True).tz_convert(tz)
+    df.index.name = 'Datetime'
+
+    partition_dir = get_partition_dir(output_dir, symbol, interval)
+    os.makedirs(partition_dir, exist_ok=True)
+
+    artifact = lookup_entry(catalog, symbol, interval) or {}
+    partitions = dict(artifact.get("partitions", {}))
+
+    months = df.index.strftime('%Y-%m')
+    for month, new_rows in df.groupby(months):
+        path = get_partition_path(output_dir, symbol, interval, month)
+        # 読み込み→結合→書き込みの間は他の処理が同じ月を書き込まないようにロックする
+        with file_lock(path):
+            if os.path.exists(path):
+                merged = pd.concat([read_partition(path, tz), new_rows])
+                merged = merged[~merged.index.duplicated(keep='last')].sort_index()
+            else:
+                merged = new_rows.sort_index()
+
+            # 一時ファイルに書き込んでから置き換える（読み込み中のプロセスが壊れたファイルを見ないように）
+            with atomic_path(path) as tmp_path:
+                merged.to_csv(tmp_path, encoding='utf-8-sig')
+
+        partitions[month] = {
+            "rows": len(merged),
+            "start": merged.index[0].isoformat(),
+            "end": merged.index[-1].isoformat()
+        }
+
+    # カタログにはフォルダと月ごとの行数・期間を登録する
+    ordered = dict(sorted(partitions.items()))
+    first, last = next(iter(ordered.values())), ordered[next(reversed(ordered))]
+    entry = register_artifact(catalog, symbol, interval, partition_dir, output_dir,
+                              rows=sum(p["rows"] for p in ordered.values()),
+                              start=first["start"], end=last["end"])
+    entry["partitions"] = ordered
+    return len(set(months))
+
+def read_intraday(output_dir, symbol, interval, catalog, start=None, end=None):
+    """
+    指定した期間の分足データを読み込む（期間に重なるパーティションだけを開く）
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    symbol (str): ティッカーシンボル
+    interval (str): 期間コード
+    catalog (dict): 成果物カタログ
+    start (str or datetime): 開始日時（省略時は最初から）
+    end (str or datetime): 終了日時（省略時は最後まで）
+
+    Returns:
+    pd.DataFrame: 分足データ
+    """
+    artifact = lookup_entry(catalog, symbol, interval)
+    if artifact is None:
+        return pd.DataFrame()
+
+    tz = get_timezone(symbol, catalog)
+    start_ts = pd.Timestamp(start) if start is not None else None
+    end_ts = pd.Timestamp(end) if end is not None else None
+    if start_ts is not None and start_ts.tzinfo is None:
+        start_ts = start_ts.tz_localize(tz)
+    if end_ts is not None and end_ts.tzinfo is None:
+        end_ts = end_ts.tz_localize(tz)
+
+    frames = []
+    for month, info in sorted(artifact.get("partitions", {}).items()):
+        # 期間に重ならないパーティションは開かない
+        if start_ts is not None and pd.Timestamp(info["end"]) < start_ts:
+            continue
+        if end_ts is not None and pd.Timestamp(info["start"]) > end_ts:
+            continue
+        path = get_partition_path(output_dir, symbol, interval, month)
+        if os.path.exists(path):
+            frames.append(read_partition(path, tz))
+
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames)
+    if start_ts is not None:
+        df = df[df.index >= start_ts]
+    if end_ts is not None:
+        df = df[df.index <= end_ts]
+    return df
+
+def collect_intraday(symbol, interval, output_dir, catalog, now=None):
+    """
+    Yahoo Financeの取得制限の範囲で分足データを取得して追記する
+
+    前回保存した最後の足から（初回はさかのぼれる最大日数から）現在までを、
+    1回のリクエストで取得できる日数ごとに区切って取得する。
+
+    Parameters:
+    symbol (str): ティッカーシンボル
+    interval (str): 期間コード（1m、5m、15m、60m）
+    output_dir (str): 出力ディレクトリ
+    catalog (dict): 成果物カタログ
+    now (datetime): 現在時刻（省略時は現在）
+
+    Returns:
+    int: 取得した足の数
+    """
+    if interval not in INTRADAY_LIMITS:
+        raise ValueError(f"対応していない分足の期間です: {interval}")
+
+    chunk_days, lookback_days = INTRADAY_LIMITS[interval]
+    now = now or datetime.now().astimezone()
+    earliest = now - timedelta(days=lookback_days)
+
+    artifact = lookup_entry(catalog, symbol, interval)
+    if artifact and artifact.get("end"):
+        start = max(datetime.fromisoformat(artifact["end"]) - OVERLAP, earliest)
+    else:
+        start = earliest
+
+    stock = yf.Ticker(symbol)
+    total = 0
+    while start < now:
+        end = min(start + timedelta(days=chunk_days), now)
+        print(f"{symbol}の{interval}データを取得中: {start:%Y-%m-%d %H:%M}から{end:%Y-%m-%d %H:%M}まで")
+        data = stock.history(start=start, end=end, interval=interval)
+        if not data.empty:
+            append_bars(data, output_dir, symbol, interval, catalog)
+            total += len(data)
+        start = end
+        # 連続リクエストによるAPIの制限を避けるため少し待つ
+        time.sleep(0.5)
+
+    print(f"{symbol}の{interval}データ: {total}本を保存しました。")
+    return total
@@ -0,0 +1,354 @@
+from datetime import datetime, date, time, timedelta
+from zoneinfo import ZoneInfo
+
+# 取引所ごとのタイムゾーン・取引開始/終了時刻・休日の種類
+# FXは24時間取引（月〜金）のため開始時刻はなく、ニューヨーク17時を1日の区切りとする
+EXCHANGES = {
+    "TSE": {"timezone": "Asia/Tokyo", "open": time(9, 0), "close": time(15, 30), "holidays": "JP"},
+    "NYSE": {"timezone": "America/New_York", "open": time(9, 30), "close": time(16, 0), "holidays": "US"},
+    "NASDAQ": {"timezone": "America/New_York", "open": time(9, 30), "close": time(16, 0), "holidays": "US"},
+    "FX": {"timezone": "America/New_York", "open": None, "close": time(17, 0), "holidays": None}
+}
+
+# ティッカーシンボルの末尾と取引所の対応
+SUFFIX_EXCHANGES = {
+    ".T": "TSE",
+    ".JP": "TSE",
+    "=X": "FX"
+}
+
+# 株価指数と算出元の取引所の対応
+INDEX_EXCHANGES = {
+    "^N225": "TSE",
+    "^TPX": "TSE",
+    "TPX.I": "TSE",
+    "^DJI": "NYSE",
+    "^GSPC": "NYSE",
+    "^SOX": "NASDAQ",
+    "^IXIC": "NASDAQ"
+}
+
+# 対応していない取引所を警告した銘柄（同じ警告を繰り返さないため）
+_warned_exchanges = set()
+
+# 取引終了からYahoo Financeにデータが反映されるまでの待ち時間
+SETTLE_MINUTES = 30
+
+# 祝日計算の特例（東京オリンピックによる移動など）
+JP_HOLIDAY_OVERRIDES = {
+    2019: {"add": [date(2019, 4, 30), date(2019, 5, 1), date(2019, 5, 2), date(2019, 10, 22)]},
+    2020: {"add": [date(2020, 7, 23), date(2020, 7, 24), date(2020, 8, 10)],
+           "remove": [date(2020, 7, 20), date(2020, 10, 12), date(2020, 8, 11)]},
+    2021: {"add": [date(2021, 7, 22), date(2021, 7, 23), date(2021, 8, 9)],
+           "remove": [date(2021, 7, 19), date(2021, 10, 11), date(2021, 8, 11)]}
+}
+
+def get_exchange(symbol, configured=None):
+    """
+    ティッカーシンボルから取引所を判定する
+
+    Parameters:
+    symbol (str): ティッカーシンボル
+    configured (str): 設定ファイルで指定された取引所（対応している取引所であれば優先）
+
+    Returns:
+    str: 取引所コード（TSE、NYSE、NASDAQ、FX）
+    """
+    if configured:
+        exchange = str(configured).upper()
+        if exchange in EXCHANGES:
+            return exchange
+        if (symbol, exchange) not in _warned_exchanges:
+            _warned_exchanges.add((symbol, exchange))
+            print(f"警告: {symbol}の取引所 {configured} には対応していません（{', '.join(EXCHANGES)}）。"
+                  "ティッカーシンボルから判定します。")
+    if symbol in INDEX_EXCHANGES:
+        return INDEX_EXCHANGES[symbol]
+    for suffix, exchange in SUFFIX_EXCHANGES.items():
+        if symbol.upper().endswith(suffix):
+            return exchange
+    # 末尾がない銘柄・不明な指数は米国市場として扱う
+    return "NYSE"
+
+def nth_weekday(year, month, weekday, n):
+    """指定した月の第n週の曜日の日付を返す（n=-1で最終週）"""
+    if n > 0:
+        first = date(year, month, 1)
+        offset = (weekday - first.weekday()) % 7
+        return first + timedelta(days=offset + 7 * (n - 1))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last = next_month - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+def easter_sunday(year):
+    """復活祭（グレゴリオ暦）の日付を返す"""
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+def jp_holidays(year):
+    """東京証券取引所の休業日（土日を除く）を返す"""
+    holidays = {
+        date(year, 1, 1),
+        nth_weekday(year, 1, 0, 2),   # 成人の日
+        date(year, 2, 11),            # 建国記念の日
+        date(year, 4, 29),            # 昭和の日
+        date(year, 5, 3),
+        date(year, 5, 4),
+        date(year, 5, 5),
+        nth_weekday(year, 7, 0, 3),   # 海の日
+        nth_weekday(year, 9, 0, 3),   # 敬老の日
+        nth_weekday(year, 10, 0, 2),  # スポーツの日
+        date(year, 11, 3),
+        date(year, 11, 23)
+    }
+    if year >= 2020:
+        holidays.add(date(year, 2, 23))  # 天皇誕生日
+    elif 1989 <= year <= 2018:
+        holidays.add(date(year, 12, 23))
+    if year >= 2016:
+        holidays.add(date(year, 8, 11))  # 山の日
+
+    # 春分の日・秋分の日（1980〜2099年の近似式）
+    leap_shift = (year - 1980) // 4
+    holidays.add(date(year, 3, int(20.8431 + 0.242194 * (year - 1980)) - leap_shift))
+    holidays.add(date(year, 9, int(23.2488 + 0.242194 * (year - 1980)) - leap_shift))
+
+    override = JP_HOLIDAY_OVERRIDES.get(year, {})
+    holidays.update(override.get("add", []))
+    holidays.difference_update(override.get("remove", []))
+
+    # 国民の休日（祝日に挟まれた平日）
+    for d in sorted(holidays):
+        if d + timedelta(days=2) in holidays and d + timedelta(days=1) not in holidays \
+                and (d + timedelta(days=1)).weekday() != 6:
+            holidays.add(d + timedelta(days=1))
+
+    # 振替休日（日曜日の祝日は次の平日が休み）
+    for d in sorted(holidays):
+        if d.weekday() == 6:
+            substitute = d + timedelta(days=1)
+            while substitute in holidays:
+                substitute += timedelta(days=1)
+            holidays.add(substitute)
+
+    # 年末年始の休業日
+    holidays.update({date(year, 1, 2), date(year, 1, 3), date(year, 12, 31)})
+    return holidays
+
+def us_holidays(year):
+    """ニューヨーク証券取引所の休業日（土日を除く）を返す"""
+    def observed(d):
+        # 土曜日は前日の金曜日、日曜日は翌日の月曜日に振り替え
+        if d.weekday() == 5:
+            return d - timedelta(days=1)
+        if d.weekday() == 6:
+            return d + timedelta(days=1)
+        return d
+
+    holidays = {
+        nth_weekday(year, 1, 0, 3),   # キング牧師記念日
+        nth_weekday(year, 2, 0, 3),   # 大統領の日
+        easter_sunday(year) - timedelta(days=2),  # 聖金曜日
+        nth_weekday(year, 5, 0, -1),  # 戦没将兵追悼記念日
+        observed(date(year, 7, 4)),
+        nth_weekday(year, 9, 0, 1),   # レイバーデー
+        nth_weekday(year, 11, 3, 4),  # 感謝祭
+        observed(date(year, 12, 25))
+    }
+    # 元日が土曜日の場合は前年の大晦日に振り替えない（NYSEの規則）
+    if date(year, 1, 1).weekday() != 5:
+        holidays.add(observed(date(year, 1, 1)))
+    if year >= 2022:
+        holidays.add(observed(date(year, 6, 19)))  # ジューンティーンス
+    return holidays
+
+_holiday_cache = {}
+
+def is_trading_day(exchange, d, extra_holidays=()):
+    """
+    指定した日が取引日かどうかを判定する
+
+    Parameters:
+    exchange (str): 取引所コード
+    d (date): 判定する日付（取引所の現地日付）
+    extra_holidays (iterable): 設定ファイルで追加された休業日
+
+    Returns:
+    bool: 取引日であればTrue
+    """
+    if d.weekday() >= 5 or d in extra_holidays:
+        return False
+    kind = EXCHANGES[exchange]["holidays"]
+    if kind is None:
+        return True
+    key = (kind, d.year)
+    if key not in _holiday_cache:
+        _holiday_cache[key] = jp_holidays(d.year) if kind == "JP" else us_holidays(d.year)
+    return d not in _holiday_cache[key]
+
+def is_market_open(exchange, now=None, extra_holidays=()):
+    """
+    取引時間中かどうかを判定する（昼休みは区別しない）
+
+    Parameters:
+    exchange (str): 取引所コード
+    now (datetime): 現在時刻（タイムゾーン付き、省略時は現在）
+    extra_holidays (iterable): 設定ファイルで追加された休業日
+
+    Returns:
+    bool: 取引時間中であればTrue（FXは取引日であれば終日True）
+    """
+    info = EXCHANGES[exchange]
+    tz = ZoneInfo(info["timezone"])
+    now = (now or datetime.now(tz)).astimezone(tz)
+    if not is_trading_day(exchange, now.date(), extra_holidays):
+        return False
+    if info.get("open") is None:
+        return True
+    return info["open"] <= now.time() <= info["close"]
+
+def latest_session_close(exchange, now=None, extra_holidays=()):
+    """
+    現在時刻までにデータが確定した直近の取引セッションの終了時刻を返す
+
+    Parameters:
+    exchange (str): 取引所コード
+    now (datetime): 現在時刻（タイムゾーン付き、省略時は現在）
+    extra_holidays (iterable): 設定ファイルで追加された休業日
+
+    Returns:
+    datetime: 取引終了時刻＋反映待ち時間（タイムゾーン付き）
+    """
+    info = EXCHANGES[exchange]
+    tz = ZoneInfo(info["timezone"])
+    now = (now or datetime.now(tz)).astimezone(tz)
+    settle = timedelta(minutes=SETTLE_MINUTES)
+
+    d = now.date()
+    # 最大で2週間さかのぼれば必ず取引日が見つかる
+    for _ in range(15):
+        if is_trading_day(exchange, d, extra_holidays):
+            closed_at = datetime.combine(d, info["close"], tzinfo=tz) + settle
+            if closed_at <= now:
+                return closed_at
+        d -= timedelta(days=1)
+    return None
+
+def next_session_close(exchange, now=None, extra_holidays=()):
+    """
+    次にデータが確定する取引セッションの終了時刻を返す
+
+    Parameters:
+    exchange (str): 取引所コード
+    now (datetime): 現在時刻（タイムゾーン付き、省略時は現在）
+    extra_holidays (iterable): 設定ファイルで追加された休業日
+
+    Returns:
+    datetime: 取引終了時刻＋反映待ち時間（タイムゾーン付き）
+    """
+    info = EXCHANGES[exchange]
+    tz = ZoneInfo(info["timezone"])
+    now = (now or datetime.now(tz)).astimezone(tz)
+    settle = timedelta(minutes=SETTLE_MINUTES)
+
+    d = now.date()
+    for _ in range(15):
+        if is_trading_day(exchange, d, extra_holidays):
+            closed_at = datetime.combine(d, info["close"], tzinfo=tz) + settle
+            if closed_at > now:
+                return closed_at
+        d += timedelta(days=1)
+    return None
+
+def needs_refresh(symbol, last_bar, now=None, exchange=None, extra_holidays=(), fetched_at=None):
+    """
+    保存済みの最後の足より後に、新しく確定した取引セッションがあるかどうかを判定する
+
+    カタログの更新日時ではなく最後の足の日付で判定するため、カタログの作り直しや圧縮・隔離などで
+    エントリだけが書き換わった場合や、前回の取得でデータの反映が遅れていた場合も再取得の対象になる。
+    最後の足が確定したセッションの日付でも、取引時間中に取得した途中の足であれば再取得の対象にする。
+
+    Parameters:
+    symbol (str): ティッカーシンボル
+    last_bar (str or datetime): 保存済みの最後の足の日時（取引所の現地時間の日付をセッションの日付とする）
+    now (datetime): 現在時刻（省略時は現在）
+    exchange (str): 設定ファイルで指定された取引所
+    extra_holidays (iterable): 設定ファイルで追加された休業日
+    fetched_at (str or datetime): 最後の足を取得した日時（タイムゾーンなしはローカル時刻）
+
+    Returns:
+    bool: 再取得が必要であればTrue
+    """
+    if not last_bar:
+        return True
+    if isinstance(last_bar, str):
+        try:
+            last_bar = datetime.fromisoformat(last_bar)
+        except ValueError:
+            return True
+    last_session = last_bar.date() if isinstance(last_bar, datetime) else last_bar
+
+    closed_at = latest_session_close(get_exchange(symbol, exchange), now, extra_holidays)
+    if closed_at is None:
+        return True
+    if last_session < closed_at.date():
+        return True
+    if last_session > closed_at.date():
+        return False
+
+    # 最後の足が確定したセッションの日付の場合は、取引終了前に取得した途中の足かどうかを確認する
+    if not fetched_at:
+        return True
+    if isinstance(fetched_at, str):
+        try:
+            fetched_at = datetime.fromisoformat(fetched_at)
+        except ValueError:
+            return True
+    # タイムゾーンなしの日時はローカル時刻として扱う
+    return fetched_at.astimezone() < closed_at
+
+def load_extra_holidays(config):
+    """設定ファイルの market_holidays（取引所コード→日付文字列のリスト）を読み込む"""
+    extra = {}
+    for exchange, days in config.get("market_holidays", {}).items():
+        extra[exchange.upper()] = {date.fromisoformat(d) for d in days}
+    return extra
+
+def select_tickers_to_refresh(tickers, catalog, config, now=None, interval="日足"):
+    """
+    新しい取引セッションが確定した銘柄だけを選び出す
+
+    Parameters:
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    catalog (dict): 成果物カタログ（保存済みの最後の足の日付と取得日時を参照）
+    config (dict): 設定（銘柄ごとの exchange と market_holidays を参照）
+    now (datetime): 現在時刻（省略時は現在）
+    interval (str): 最後の足の日付を参照する期間名
+
+    Returns:
+    tuple: (再取得する銘柄の辞書, スキップする銘柄のリスト)
+    """
+    configured = {item["symbol"]: item.get("exchange") for item in config.get("tickers", [])}
+    extra_holidays = load_extra_holidays(config)
+
+    selected = {}
+    skipped = []
+    for symbol, name in tickers.items():
+        exchange = get_exchange(symbol, configured.get(symbol))
+        artifact = catalog["symbols"].get(symbol, {}).get("artifacts", {}).get(interval)
+        last_bar = artifact.get("end") if artifact else None
+        fetched_at = artifact.get("fetched") if artifact else None
+        if needs_refresh(symbol, last_bar, now, exchange, extra_holidays.get(exchange, ()), fetched_at):
+            selected[symbol] = name
+        else:
+            skipped.append(symbol)
+    return selected, skipped
@@ -0,0 +1,228 @@
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog, lookup_entry, lookup_artifact, save_catalog, get_symbol_exchange
+from market_calendar import EXCHANGES, get_exchange
+from columnar_store import (get_store_dir, write_arrays, verify_store, register_store, lookup_store, column_values,
+                            DATE_COLUMN)
+from price_store import JAPANESE_COLUMNS, ENGLISH_COLUMNS, CSV_FLOAT_PRECISION, parse_dates
+from csv_compression import read_csv_bytes
+
+# 移行する期間
+MIGRATE_INTERVALS = ["日足", "週足", "月足"]
+
+# 日時の固定形式（例: 2001-01-04 00:00:00+09:00）と日付のみの形式（例: 2001-12-31）の文字数
+TIMESTAMP_LENGTH = 25
+DATE_LENGTH = 10
+
+def detect_language(columns):
+    """
+    カラム名が日本語か英語かを判定する
+
+    Returns:
+    str: "ja"（日本語）、"en"（英語）、判定できない場合はNone
+    """
+    columns = set(columns)
+    if set(JAPANESE_COLUMNS.values()) & columns:
+        return "ja"
+    if set(JAPANESE_COLUMNS) & columns:
+        return "en"
+    return None
+
+def parse_digits(chars, first, last):
+    """文字の配列（行 × 文字）の first〜last-1 文字目を整数として読む"""
+    value = np.zeros(len(chars), dtype=np.int64)
+    for k in range(first, last):
+        value = value * 10 + (chars[:, k].astype(np.int64) - 48)
+    return value
+
+def parse_timestamps_fast(values):
+    """
+    固定形式の日時文字列をUTCのナノ秒に変換する
+
+    すべての行が「YYYY-MM-DD HH:MM:SS+09:00」または「YYYY-MM-DD」の形式の場合だけ、
+    文字の位置から数字を直接読み取って変換する（pandasの汎用の日時変換より数倍速い）。
+
+    Returns:
+    np.ndarray: UTCの1970年からのナノ秒（形式が合わない場合はNone）
+    """
+    try:
+        raw = np.asarray(values).astype(f"S{TIMESTAMP_LENGTH}")
+    except (UnicodeEncodeError, ValueError):
+        return None
+    if len(raw) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    lengths = np.char.str_len(raw)
+    length = int(lengths[0])
+    if length not in (TIMESTAMP_LENGTH, DATE_LENGTH) or not (lengths == length).all():
+        return None
+    chars = raw.view(np.uint8).reshape(-1, TIMESTAMP_LENGTH)
+
+    # 区切り文字の位置を確認する
+    separators = {4: b'-', 7: b'-'}
+    if length == TIMESTAMP_LENGTH:
+        separators.update({10: b' ', 13: b':', 16: b':', 22: b':'})
+    for position, char in separators.items():
+        if not (chars[:, position] == ord(char)).all():
+            return None
+
+    months = (parse_digits(chars, 0, 4) - 1970) * 12 + parse_digits(chars, 5, 7) - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + parse_digits(chars, 8, 10) - 1
+    seconds = days * 86400
+    if length == TIMESTAMP_LENGTH:
+        signs = np.where(chars[:, 19] == ord('-'), -1, 1)
+        if not np.isin(chars[:, 19], [ord('+'), ord('-')]).all():
+            return None
+        seconds += parse_digits(chars, 11, 13) * 3600 + parse_digits(chars, 14, 16) * 60 + parse_digits(chars, 17, 19)
+        seconds -= signs * (parse_digits(chars, 20, 22) * 3600 + parse_digits(chars, 23, 25) * 60)
+    return seconds * 1_000_000_000
+
+def migrate_file(csv_path, store_dir, timezone, source):
+    """
+    1つのCSVファイルを列ファイルに変換する（別プロセスで実行する）
+
+    Returns:
+    dict: 変換結果（行数・チェックサム・所要時間・エラーメッセージ）
+    """
+    started = time.time()
+    result = {"csv_path": csv_path, "store_dir": store_dir, "ok": False}
+    try:
+        result["bytes"] = os.path.getsize(csv_path)
+        data = read_csv_bytes(csv_path)
+        # CSVのデータ行数（ヘッダーを除く改行の数）を検証に使う
+        csv_rows = data.count(b'\n') - 1 + (0 if data.endswith(b'\n') else 1)
+
+        df = pd.read_csv(io.BytesIO(data), index_col=0, encoding='utf-8-sig', float_precision=CSV_FLOAT_PRECISION)
+        language = detect_language(df.columns)
+        if language is None:
+            result["message"] = f"カラム名を判定できません: {list(df.columns)}"
+            return result
+        if language == "ja":
+            df = df.rename(columns=ENGLISH_COLUMNS)
+
+        dates = parse_timestamps_fast(df.index.to_numpy(dtype=object))
+        result["fast_dates"] = dates is not None
+        if dates is None:
+            index = parse_dates(df.index)
+            if index.tz is not None:
+                index = index.tz_convert("UTC").tz_localize(None)
+            dates = index.as_unit('ns').asi8
+
+        arrays = [(DATE_COLUMN, dates.astype(np.int64))]
+        for col in df.columns:
+            arrays.append((col, column_values(df[col])))
+        source = dict(source, language=language)
+        # 日付のみのデータ（年足など）はタイムゾーンを持たない
+        meta = write_arrays(store_dir, arrays, timezone if len(df) and len(str(df.index[0])) > DATE_LENGTH else None,
+                            source)
+
+        ok, message = verify_store(store_dir)
+        if ok and meta["rows"] != csv_rows:
+            ok, message = False, f"CSVの行数（{csv_rows}）と保存データの行数（{meta['rows']}）が一致しません"
+        result.update(ok=ok, message=message, rows=meta["rows"], meta=meta)
+    except Exception as e:
+        result["message"] = f"{type(e).__name__}: {e}"
+    result["seconds"] = time.time() - started
+    return result
+
+def collect_tasks(catalog, output_dir, tickers, force=False):
+    """
+    移行するCSVファイルの一覧を作る（最新の保存データがある場合は除く）
+
+    Returns:
+    list: [(シンボル, 期間名, CSVのパス, 保存先のフォルダ, タイムゾーン, 元データの情報)]
+    """
+    tasks = []
+    for symbol in tickers:
+        for interval in MIGRATE_INTERVALS:
+            csv_path = lookup_artifact(catalog, symbol, interval, output_dir)
+            if csv_path is None:
+                continue
+            if not force and lookup_store(catalog, symbol, interval, output_dir) is not None:
+                continue
+            entry = lookup_entry(catalog, symbol, interval)
+            timezone = EXCHANGES[get_exchange(symbol, get_symbol_exchange(catalog, symbol))]["timezone"]
+            source = {"path": entry["path"], "version": entry.get("version")}
+            tasks.append((symbol, interval, csv_path, get_store_dir(output_dir, symbol, interval), timezone, source))
+    return tasks
+
+def migrate_archive(output_dir, tickers, workers=None, force=False):
+    """
+    出力ディレクトリのCSVファイルを並列に列ファイルへ移行し、カタログに登録する
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    workers (int): 並列に処理するプロセスの数（省略時はCPUの数）
+    force (bool): Trueの場合は移行済みのファイルも作り直す
+
+    Returns:
+    list: ファイルごとの変換結果
+    """
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    tasks = collect_tasks(catalog, output_dir, tickers, force)
+    if not tasks:
+        print("移行が必要なファイルはありません。")
+        return []
+
+    workers = workers or os.cpu_count() or 1
+    print(f"{len(tasks)}個のファイルを{workers}プロセスで移行します...")
+    started = time.time()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(migrate_file, csv_path, store_dir, timezone, source): (symbol, interval)
+                   for symbol, interval, csv_path, store_dir, timezone, source in tasks}
+        for future in as_completed(futures):
+            symbol, interval = futures[future]
+            result = future.result()
+            result.update(symbol=symbol, interval=interval)
+            results.append(result)
+            if result["ok"]:
+                register_store(catalog, symbol, interval, result["store_dir"], output_dir, result["meta"])
+                print(f"  {symbol} {interval}: {result['message']}（{result['seconds']:.2f}秒）")
+            else:
+                print(f"  エラー: {symbol} {interval}: {result.get('message')}")
+
+    save_catalog(catalog, output_dir)
+
+    elapsed = time.time() - started
+    succeeded = [r for r in results if r["ok"]]
+    total_bytes = sum(r.get("bytes", 0) for r in succeeded)
+    total_rows = sum(r.get("rows", 0) for r in succeeded)
+    print(f"\n移行完了: {len(succeeded)}/{len(results)}ファイル、{total_rows:,}行、"
+          f"{total_bytes / 1024 / 1024:.1f}MB を{elapsed:.1f}秒で処理しました"
+          f"（{total_bytes / 1024 / 1024 / max(elapsed, 1e-9):.1f}MB/秒）")
+    slow = [r for r in succeeded if not r.get("fast_dates")]
+    if slow:
+        print(f"固定形式でない日時を含むファイル（汎用の変換を使用）: {len(slow)}個")
+    return results
+
+def main():
+    """
+    メイン関数：既存のCSVファイルを列ファイルに移行する
+
+    使い方: python migrate_archive.py [-workers 8] [-force]
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    args = sys.argv[1:]
+    workers = int(args[args.index("-workers") + 1]) if "-workers" in args[:-1] else None
+
+    print("===== 株価データの移行 =====")
+    print(f"出力ディレクトリ: {output_dir}")
+    results = migrate_archive(output_dir, tickers, workers, force="-force" in args)
+    if any(not r["ok"] for r in results):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import os
+import sys
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import make_safe_name
+from fx_alignment import align_universe, parse_fx_symbol, get_currency, find_fx_route
+from universe_analytics import ANALYTICS_DIR_NAME
+from file_lock import file_lock, atomic_path, read_json, write_json
+
+# ポートフォリオの計算結果の状態ファイル（出力ディレクトリの analytics フォルダ内）
+PORTFOLIO_STATE_FILE = os.path.join(ANALYTICS_DIR_NAME, "portfolio_state.json")
+
+# 既定の評価通貨
+DEFAULT_BASE_CURRENCY = "JPY"
+
+# 評価通貨ごとの共通カレンダーの基準の取引所（設定の "calendar" で変更できる）
+BASE_CALENDARS = {
+    "JPY": "TSE",
+    "USD": "NYSE"
+}
+
+# 追記時に計算し直す直近の行数（後から確定した他市場の終値・為替レートを反映するため）
+INCREMENTAL_OVERLAP_ROWS = 5
+
+# 計算結果の列（通貨ごとのエクスポージャーは Exposure_<通貨> として後ろに追加する）
+VALUATION_COLUMNS = ["NAV", "MarketValue", "Cash", "Cost", "PnL", "DailyPnL", "Return", "GrossExposure"]
+
+def load_portfolios(config):
+    """
+    設定ファイルの portfolios を読み込む
+
+    設定の形式:
+    "portfolios": [
+        {"name": "メイン", "currency": "JPY", "cash": 100000,
+         "holdings": [{"symbol": "7974.T", "quantity": 100, "cost": 6500, "currency": "JPY", "date": "2024-01-04"}]}
+    ]
+    holdings の cost は1株あたりの取得単価（保有銘柄の通貨）、date は取得日（省略時はデータの最初から保有）。
+    同じ銘柄を複数回に分けて取得した場合は別の行として書く。
+
+    Returns:
+    list: ポートフォリオの辞書のリスト（不正な行は警告して除く）
+    """
+    ticker_currencies = {item["symbol"]: item.get("currency") for item in config.get("tickers", [])}
+    portfolios = []
+    for number, item in enumerate(config.get("portfolios", []), 1):
+        name = str(item.get("name") or f"ポートフォリオ{number}")
+        currency = str(item.get("currency") or DEFAULT_BASE_CURRENCY).upper()
+        lots = []
+        for holding in item.get("holdings", []):
+            symbol = holding.get("symbol")
+            try:
+                quantity = float(holding["quantity"])
+                cost = float(holding["cost"]) if holding.get("cost") is not None else None
+                date = pd.Timestamp(holding["date"]).normalize() if holding.get("date") else None
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"警告: {name} の保有銘柄 {symbol} の設定が正しくないためスキップします: {e}")
+                continue
+            if not symbol:
+                continue
+            lot_currency = holding.get("currency") or get_currency(symbol, ticker_currencies.get(symbol))
+            lots.append({"symbol": symbol, "quantity": quantity, "cost": cost,
+                         "currency": (lot_currency or currency).upper(), "date": date})
+        portfolios.append({"name": name, "currency": currency,
+                           "calendar": str(item.get("calendar") or BASE_CALENDARS.get(currency, "TSE")).upper(),
+                           "cash": float(item.get("cash") or 0.0), "lots": lots})
+    return portfolios
+
+def get_definition_hash(portfolio):
+    """ポートフォリオの定義のハッシュ（保有銘柄などが変わった場合は全期間を計算し直す）"""
+    definition = dict(portfolio, lots=[dict(lot, date=str(lot["date"]) if lot["date"] is not None else None)
+                                       for lot in portfolio["lots"]])
+    return hashlib.sha1(json.dumps(definition, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+def get_fx_factors(aligned, currency, target, pairs):
+    """
+    通貨を換算する倍率の時系列を返す（共通カレンダーに揃えた為替レートから求める）
+
+    Returns:
+    np.ndarray: 日ごとの倍率（換算できない場合はNone）
+    """
+    route = find_fx_route(currency, target, pairs)
+    if route is None:
+        return None
+    factors = np.ones(len(aligned))
+    for fx_symbol, invert in route:
+        rates = aligned[fx_symbol].to_numpy(dtype=float)
+        factors = factors / rates if invert else factors * rates
+    return factors
+
+def build_lots(portfolios, aligned, pairs, target):
+    """
+    全ポートフォリオの保有銘柄（取得単位）を配列にまとめる
+
+    Returns:
+    dict: 取得単位ごとの列番号・数量・保有開始行・評価通貨での取得額・通貨と、取得単位→ポートフォリオの対応行列
+    """
+    prices = aligned.to_numpy(dtype=float)
+    dates = aligned.index
+    columns, quantities, starts, costs, currencies, owners = [], [], [], [], [], []
+    fx_cache = {}
+    for owner, portfolio in enumerate(portfolios):
+        for lot in portfolio["lots"]:
+            symbol = lot["symbol"]
+            if symbol not in aligned.columns:
+                print(f"警告: {portfolio['name']} の {symbol} は価格データがないため評価に含めません。")
+                continue
+            currency = lot["currency"]
+            if currency not in fx_cache:
+                fx_cache[currency] = get_fx_factors(aligned, currency, target, pairs)
+            factors = fx_cache[currency]
+            column = aligned.columns.get_loc(symbol)
+            valid = np.isfinite(prices[:, column])
+            if lot["date"] is not None:
+                valid &= dates >= lot["date"]
+            if factors is None or not valid.any():
+                print(f"警告: {portfolio['name']} の {symbol} は評価できる日がないため評価に含めません。")
+                continue
+            start = int(np.argmax(valid))
+            # 取得額は取得日（省略時は最初に評価できる日）の為替レートで換算する（単価がない場合は時価）
+            if lot["cost"] is None:
+                cost = lot["quantity"] * prices[start, column]
+            else:
+                cost = lot["quantity"] * lot["cost"] * factors[start]
+            columns.append(column)
+            quantities.append(lot["quantity"])
+            starts.append(start)
+            costs.append(cost)
+            currencies.append(currency)
+            owners.append(owner)
+
+    membership = np.zeros((len(columns), len(portfolios)))
+    membership[np.arange(len(columns)), owners] = 1.0
+    return {"column": np.array(columns, dtype=int), "quantity": np.array(quantities, dtype=float),
+            "start": np.array(starts, dtype=int), "cost": np.array(costs, dtype=float),
+            "currency": np.array(currencies, dtype=object), "membership": membership}
+
+def compute_valuation(prices, row_numbers, lots, cash):
+    """
+    指定した行の全ポートフォリオの時価・取得額・エクスポージャーを1回の行列計算で求める
+
+    取得単位ごとの時価（行=日付・列=取得単位）を作り、対応行列を掛けてポートフォリオごとに合計する。
+
+    Parameters:
+    prices (np.ndarray): 評価通貨に換算した価格の行列（行=日付・列=銘柄）
+    row_numbers (np.ndarray): 計算する行の番号
+    lots (dict): build_lots の結果
+    cash (np.ndarray): ポートフォリオごとの現金
+
+    Returns:
+    dict: 列名 → 行列（行=日付・列=ポートフォリオ）
+    """
+    active = row_numbers[:, None] >= lots["start"][None, :]
+    values = np.where(active, prices[np.ix_(row_numbers, lots["column"])] * lots["quantity"], 0.0)
+    membership = lots["membership"]
+
+    market_value = values @ membership
+    nav = market_value + cash
+    result = {
+        "NAV": nav,
+        "MarketValue": market_value,
+        "Cash": np.broadcast_to(cash, nav.shape).copy(),
+        "Cost": (active * lots["cost"]) @ membership,
+    }
+    result["PnL"] = market_value - result["Cost"]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        result["GrossExposure"] = (np.abs(values) @ membership) / nav
+        for currency in sorted(set(lots["currency"])):
+            result[f"Exposure_{currency}"] = (values @ (membership * (lots["currency"] == currency)[:, None])) / nav
+    return result
+
+def get_output_path(output_dir, name):
+    """ポートフォリオの評価結果のCSVファイルのパス"""
+    return os.path.join(output_dir, f"ポートフォリオ_{make_safe_name(name)}.csv")
+
+def get_prices_hash(aligned, rows):
+    """共通カレンダーに揃えた価格の先頭 rows 行（日付・銘柄・値）のハッシュ"""
+    digest = hashlib.sha1()
+    digest.update(json.dumps(list(aligned.columns)).encode('utf-8'))
+    digest.update(aligned.index[:rows].as_unit('ns').asi8.tobytes())
+    digest.update(np.ascontiguousarray(aligned.to_numpy(dtype=float)[:rows]).tobytes())
+    return digest.hexdigest()[:16]
+
+def load_previous(output_dir, portfolio, state, symbols):
+    """
+    前回の評価結果を読み込む（定義・銘柄が変わった場合や読めない場合はNone）
+    """
+    previous = state.get(portfolio["name"])
+    path = get_output_path(output_dir, portfolio["name"])
+    if previous is None or previous.get("definition") != get_definition_hash(portfolio) or \
+            previous.get("symbols") != symbols or not os.path.exists(path):
+        return None
+    try:
+        return pd.read_csv(path, index_col=0, parse_dates=True, encoding='utf-8-sig')
+    except Exception as e:
+        print(f"警告: {portfolio['name']} の前回の評価結果を読み込めません（全期間を計算し直します）: {e}")
+        return None
+
+def value_portfolios(output_dir, tickers, portfolios, full=False):
+    """
+    全ポートフォリオの日々の評価額（NAV）・損益・エクスポージャーを計算してCSVに保存する
+
+    評価通貨・基準カレンダーが同じポートフォリオはまとめて1回で計算する。前回の結果があれば、
+    最後の数行（INCREMENTAL_OVERLAP_ROWS）以降だけを計算し直して追記する。それより前の価格が
+    前回と変わった場合（ハッシュで判定する）は全期間を計算し直す。
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書（為替のシンボルを含める）
+    portfolios (list): load_portfolios の結果
+    full (bool): Trueの場合は前回の結果を使わずに全期間を計算する
+
+    Returns:
+    dict: ポートフォリオ名 → 評価結果のデータフレーム
+    """
+    state_path = os.path.join(output_dir, PORTFOLIO_STATE_FILE)
+    state = {}
+    if not full and os.path.exists(state_path):
+        try:
+            state = read_json(state_path)
+        except (OSError, ValueError) as e:
+            print(f"ポートフォリオの状態ファイルを読み込めません（全期間を計算し直します）: {e}")
+
+    fx_symbols = [s for s in tickers if parse_fx_symbol(s) is not None]
+    groups = {}
+    for portfolio in portfolios:
+        groups.setdefault((portfolio["currency"], portfolio["calendar"]), []).append(portfolio)
+
+    results = {}
+    for (currency, calendar), members in groups.items():
+        symbols = sorted({lot["symbol"] for p in members for lot in p["lots"]})
+        if not symbols:
+            continue
+        universe = {s: tickers.get(s, s) for s in symbols + fx_symbols}
+        lot_currencies = {}
+        for lot in (lot for p in members for lot in p["lots"]):
+            lot_currencies.setdefault(lot["symbol"], lot["currency"])
+        aligned = align_universe(output_dir, universe, currency, calendar, "Close", lot_currencies)
+        pairs = {s: parse_fx_symbol(s) for s in aligned.columns if parse_fx_symbol(s) is not None}
+        lots = build_lots(members, aligned, pairs, currency)
+
+        # 前回の結果がある場合は、全員に共通する最初の再計算行から計算する
+        previous = {p["name"]: load_previous(output_dir, p, state, symbols) for p in members}
+        for df in previous.values():
+            if df is not None:
+                df.index = pd.DatetimeIndex(df.index).as_unit(aligned.index.unit)
+        first_row = 0
+        if all(df is not None and len(df) for df in previous.values()):
+            last_rows = [aligned.index.searchsorted(df.index[-1]) for df in previous.values()]
+            prefix_rows = min(state[p["name"]].get("prefix_rows", 0) for p in members)
+            first_row = min(max(min(last_rows) - INCREMENTAL_OVERLAP_ROWS, 0), prefix_rows)
+            # 前回から過去の日付・価格が変わった場合（分割・配当の調整、データの取り直しなど）は全期間を計算し直す
+            prices_hash = get_prices_hash(aligned, prefix_rows)
+            if any(state[p["name"]].get("prices_hash") != prices_hash for p in members) or \
+                    any(not df.index[:first_row].equals(aligned.index[:first_row]) for df in previous.values()):
+                first_row = 0
+        row_numbers = np.arange(first_row, len(aligned))
+        cash = np.array([p["cash"] for p in members])
+        valuation = compute_valuation(aligned.to_numpy(dtype=float), row_numbers, lots, cash)
+
+        # 次回に再利用できる行（最後の数行より前）の価格のハッシュを記録する
+        prefix_rows = max(len(aligned) - INCREMENTAL_OVERLAP_ROWS, 0)
+        prices_hash = get_prices_hash(aligned, prefix_rows)
+        for i, portfolio in enumerate(members):
+            columns = {name: matrix[:, i] for name, matrix in valuation.items()}
+            df = pd.DataFrame(columns, index=aligned.index[first_row:])
+            if first_row:
+                df = pd.concat([previous[portfolio["name"]].loc[lambda d: d.index < df.index[0]], df])
+            df = finish_valuation(df)
+            results[portfolio["name"]] = df
+
+            path = get_output_path(output_dir, portfolio["name"])
+            with file_lock(path), atomic_path(path) as tmp_path:
+                df.to_csv(tmp_path, encoding='utf-8-sig')
+            state[portfolio["name"]] = {"definition": get_definition_hash(portfolio), "symbols": symbols,
+                                        "prefix_rows": prefix_rows, "prices_hash": prices_hash,
+                                        "rows": len(df), "end": str(df.index[-1].date()) if len(df) else None}
+        print(f"{currency}建て（{calendar}の取引日）: {len(members)}ポートフォリオ・{len(lots['column'])}件の保有を"
+              f"{len(row_numbers)}日分計算しました（全{len(aligned)}日）")
+
+    os.makedirs(os.path.dirname(state_path), exist_ok=True)
+    write_json(state_path, state)
+    return results
+
+def finish_valuation(df):
+    """日次損益・日次リターンを計算し、列の順序を揃える"""
+    df = df.copy()
+    df.index.name = 'Date'
+    # 取得額の変化（買い増し）は損益に含めないため、累計損益の差分を日次損益とする
+    df["DailyPnL"] = df["PnL"].diff()
+    df["Return"] = df["DailyPnL"] / df["NAV"].shift(1)
+    exposure_columns = sorted(col for col in df.columns if col.startswith("Exposure_"))
+    return df[VALUATION_COLUMNS + exposure_columns]
+
+def summarize(results):
+    """ポートフォリオごとの最新の評価額・損益をまとめる"""
+    rows = []
+    for name, df in results.items():
+        valid = df.dropna(subset=["NAV"])
+        if valid.empty:
+            continue
+        last = valid.iloc[-1]
+        row = {"Date": valid.index[-1].strftime('%Y-%m-%d'), "NAV": last["NAV"], "Cost": last["Cost"],
+               "PnL": last["PnL"], "PnL_Rate": last["PnL"] / last["Cost"] if last["Cost"] else np.nan,
+               "DailyPnL": last["DailyPnL"], "Return": last["Return"], "GrossExposure": last["GrossExposure"]}
+        row.update({col: last[col] for col in df.columns if col.startswith("Exposure_")})
+        rows.append(pd.Series(row, name=name))
+    summary = pd.DataFrame(rows)
+    summary.index.name = "Portfolio"
+    return summary
+
+def main():
+    """
+    メイン関数：設定ファイルの全ポートフォリオを評価してCSVに保存する
+    "-full" で前回の結果を使わずに全期間を計算し直す
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+    portfolios = load_portfolios(config)
+    if not portfolios:
+        print("設定ファイルに portfolios がありません。stock_config_manager.py で保有銘柄を登録してください。")
+        return
+
+    print("===== ポートフォリオ評価 =====")
+    print(f"ポートフォリオ数: {len(portfolios)}  保有: {sum(len(p['lots']) for p in portfolios)}件")
+    results = value_portfolios(output_dir, tickers, portfolios, full="-full" in sys.argv)
+
+    summary = summarize(results)
+    summary_path = os.path.join(output_dir, "ポートフォリオ_サマリー.csv")
+    with file_lock(summary_path), atomic_path(summary_path) as tmp_path:
+        summary.to_csv(tmp_path, encoding='utf-8-sig')
+    print(f"結果を保存しました: {summary_path}")
+    with pd.option_context('display.width', 200, 'display.float_format', '{:,.2f}'.format):
+        print(summary)
+
+if __name__ == "__main__":
+    main()
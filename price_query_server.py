@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+import stock_data_all_new
+from artifact_catalog import load_catalog, get_catalog_path
+from price_store import read_prices, get_data_version, resample_ohlcv, slice_dates
+from aggregate_cache import get_aggregate
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# 参照用HTTPサーバーの既定ポート（localhostのみで待ち受ける）
+DEFAULT_PORT = 8766
+
+# メモリに保持するデータフレームの最大数
+HOT_CACHE_SIZE = 64
+
+# 1回に書き出す行数（大きな結果を少しずつ送信するため）
+STREAM_CHUNK_ROWS = 5000
+
+# 出力形式とContent-Type
+CONTENT_TYPES = {
+    "json": "application/json; charset=utf-8",
+    "csv": "text/csv; charset=utf-8",
+    "arrow": "application/vnd.apache.arrow.stream"
+}
+
+class HotCache:
+    """
+    読み込んだデータフレームを保持するLRUキャッシュ
+
+    キーにデータバージョンを含めるため、パイプラインが書き換えたデータは自動的に読み直される。
+    """
+
+    def __init__(self, max_items=HOT_CACHE_SIZE):
+        self.max_items = max_items
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader):
+        """キャッシュからデータを取得し、なければloaderで読み込んで保持する"""
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+
+        # ファイルの読み込み中はロックを持たない（他の読み込みを止めないため）
+        value = loader()
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_items:
+                self.items.popitem(last=False)
+        return value
+
+class PriceStoreReader:
+    """カタログの変更を検知しながら株価データを読み込む読み取り専用のアクセス層"""
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.cache = HotCache()
+        self.catalog = load_catalog(output_dir)
+        self.catalog_mtime = self.get_catalog_mtime()
+        self.lock = threading.Lock()
+
+    def get_catalog_mtime(self):
+        path = get_catalog_path(self.output_dir)
+        return os.path.getmtime(path) if os.path.exists(path) else None
+
+    def get_catalog(self):
+        """カタログファイルが更新されていれば読み直す"""
+        mtime = self.get_catalog_mtime()
+        if mtime != self.catalog_mtime:
+            with self.lock:
+                if mtime != self.catalog_mtime:
+                    self.catalog = load_catalog(self.output_dir)
+                    self.catalog_mtime = mtime
+        return self.catalog
+
+    def get_prices(self, symbol, interval):
+        """
+        銘柄・期間の全データをキャッシュ経由で取得する
+
+        Returns:
+        tuple: (データフレーム, データバージョン)（未登録の場合は (None, None)）
+        """
+        catalog = self.get_catalog()
+        version = get_data_version(catalog, symbol, interval)
+        if version is None:
+            return None, None
+        df = self.cache.get((symbol, interval, version),
+                            lambda: read_prices(self.output_dir, symbol, interval, catalog))
+        return df, version
+
+    def get_resampled(self, symbol, interval, rule):
+        """銘柄・期間の全データを変換した結果を集計結果のキャッシュ経由で取得する"""
+        catalog = self.get_catalog()
+        return get_aggregate(self.output_dir, catalog, symbol, interval, rule,
+                             load=lambda: self.get_prices(symbol, interval)[0])
+
+def make_etag(*parts):
+    """データバージョンと問い合わせ条件からETagを作成する"""
+    return '"' + hashlib.sha1("|".join(str(p) for p in parts).encode('utf-8')).hexdigest() + '"'
+
+def make_handler(reader):
+    """株価データを返すHTTPリクエストハンドラを作成する"""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def send_error_json(self, code, message):
+            data = json.dumps({"error": message}, ensure_ascii=False).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", CONTENT_TYPES["json"])
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            parts = [unquote(p) for p in url.path.strip("/").split("/")]
+
+            try:
+                if len(parts) == 2 and parts[0] == "prices":
+                    self.handle_prices(parts[1], query, rule=None)
+                elif parts == ["ohlc", "resample"]:
+                    if "symbol" not in query or "rule" not in query:
+                        self.send_error_json(400, "symbol と rule を指定してください")
+                        return
+                    self.handle_prices(query["symbol"], query, rule=query["rule"])
+                elif parts == ["symbols"]:
+                    catalog = reader.get_catalog()
+                    body = {symbol: sorted(entry.get("artifacts", {}))
+                            for symbol, entry in catalog["symbols"].items()}
+                    self.send_stream("json", None, [json.dumps(body, ensure_ascii=False)])
+                elif parts == ["status"]:
+                    body = {"cache_items": len(reader.cache.items),
+                            "cache_hits": reader.cache.hits,
+                            "cache_misses": reader.cache.misses}
+                    self.send_stream("json", None, [json.dumps(body)])
+                else:
+                    self.send_error_json(404, "見つかりません")
+            except (ValueError, KeyError) as e:
+                self.send_error_json(400, str(e))
+
+        def handle_prices(self, symbol, query, rule):
+            interval = query.get("interval", "1d")
+            fmt = query.get("format", "json")
+            if fmt not in CONTENT_TYPES:
+                self.send_error_json(400, f"対応していない形式です: {fmt}")
+                return
+            if fmt == "arrow" and pa is None:
+                self.send_error_json(501, "Arrow形式にはpyarrowが必要です")
+                return
+
+            df, version = reader.get_prices(symbol, interval)
+            if df is None:
+                self.send_error_json(404, f"{symbol}の{interval}データが見つかりません")
+                return
+
+            # データバージョンが同じなら本文を返さない
+            etag = make_etag(symbol, interval, version, query.get("start"), query.get("end"), rule, fmt)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+
+            if rule and not query.get("start") and not query.get("end"):
+                # 全期間の変換結果は銘柄・期間・変換の指定ごとにキャッシュする
+                df = reader.get_resampled(symbol, interval, rule)
+            else:
+                df = slice_dates(df, query.get("start"), query.get("end"))
+                if rule:
+                    df = resample_ohlcv(df, rule)
+            self.send_stream(fmt, etag, iter_body(df, fmt))
+
+        def send_stream(self, fmt, etag, chunks):
+            """本文を少しずつ送信する（接続を閉じて終端を示す）"""
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt])
+            if etag:
+                self.send_header("ETag", etag)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for chunk in chunks:
+                self.wfile.write(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+
+        def log_message(self, format, *args):
+            print(f"[参照] {self.address_string()} {format % args}")
+
+    return QueryHandler
+
+def iter_body(df, fmt):
+    """データフレームを出力形式に合わせて分割して返す"""
+    if fmt == "arrow":
+        sink = pa.BufferOutputStream()
+        table = pa.Table.from_pandas(df.reset_index(), preserve_index=False)
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            for batch in table.to_batches(max_chunksize=STREAM_CHUNK_ROWS):
+                writer.write_batch(batch)
+        yield sink.getvalue().to_pybytes()
+        return
+
+    rows = df.reset_index()
+    if fmt == "csv":
+        for i in range(0, len(rows), STREAM_CHUNK_ROWS):
+            yield rows.iloc[i:i + STREAM_CHUNK_ROWS].to_csv(index=False, header=(i == 0))
+        if len(rows) == 0:
+            yield rows.to_csv(index=False)
+        return
+
+    # JSON形式は行の配列として少しずつ書き出す
+    yield "["
+    for i in range(0, len(rows), STREAM_CHUNK_ROWS):
+        chunk = rows.iloc[i:i + STREAM_CHUNK_ROWS].to_json(orient='records', date_format='iso', force_ascii=False)
+        yield ("," if i > 0 else "") + chunk[1:-1]
+    yield "]"
+
+def main():
+    """
+    メイン関数：株価データの参照用HTTPサーバーを起動する
+    ポート番号は設定ファイルの query_port またはコマンドライン引数で指定できる
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else int(config.get("query_port", DEFAULT_PORT))
+
+    reader = PriceStoreReader(output_dir)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(reader))
+    print("===== 株価データ参照サーバー =====")
+    print(f"データディレクトリ: {output_dir}")
+    print(f"例: http://127.0.0.1:{port}/prices/7974.T?interval=1d&start=2024-01-01&format=csv")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nサーバーを停止します。")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
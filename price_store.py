@@ -0,0 +1,190 @@
+import pandas as pd
+
+from artifact_catalog import INTERVAL_NAMES, lookup_entry, lookup_artifact, get_symbol_exchange
+from market_calendar import EXCHANGES, get_exchange
+from intraday_store import INTRADAY_LIMITS, read_intraday
+from columnar_store import lookup_store, read_frame
+from frame_backend import use_polars, read_price_csv_polars, resample_ohlcv_polars, resample_universe_polars
+
+# カラム名を日本語に変更
+JAPANESE_COLUMNS = {
+    'Open': '始値',
+    'High': '高値',
+    'Low': '安値',
+    'Close': '終値',
+    'Volume': '出来高',
+    'Dividends': '配当',
+    'Stock Splits': '株式分割'
+}
+
+# 日本語カラム名を英語に戻す対応
+ENGLISH_COLUMNS = {jp: en for en, jp in JAPANESE_COLUMNS.items()}
+
+# CSVの数値の読み込み精度（書き出した値と同じ値に戻す。polarsで読んだ場合と同じ値になる）
+CSV_FLOAT_PRECISION = 'round_trip'
+
+# 足の集計方法（足の変換で共通に使う）
+OHLCV_AGGREGATION = {
+    'Open': 'first',
+    'High': 'max',
+    'Low': 'min',
+    'Close': 'last',
+    'Volume': 'sum',
+    'Dividends': 'sum',
+    'Stock Splits': 'max'
+}
+
+def resolve_interval(interval):
+    """期間コード（1d など）または期間名（日足 など）をカタログのキーに変換する"""
+    return INTERVAL_NAMES.get(interval, interval)
+
+def parse_dates(values, tz=None):
+    """
+    日付の列をDatetimeIndexに変換する
+
+    タイムゾーンのオフセットが混在する場合（夏時間など）はUTCを経由して
+    取引所のタイムゾーンに揃える。タイムゾーンのない日付（年足など）はそのまま残す。
+    """
+    try:
+        index = pd.to_datetime(values)
+    except ValueError:
+        # pandasのバージョンによってはオフセットが混在すると例外になる
+        index = None
+    if not isinstance(index, pd.DatetimeIndex):
+        index = pd.DatetimeIndex(pd.to_datetime(values, utc=True))
+    if index.tz is not None and tz is not None:
+        index = index.tz_convert(tz)
+    return index
+
+def normalize_columns(df):
+    """日本語カラム名を英語に揃え、インデックス名をDateにする"""
+    df = df.rename(columns=ENGLISH_COLUMNS)
+    df.index.name = 'Date'
+    return df
+
+def read_price_csv(path, tz=None, skip_rows=0):
+    """
+    パイプラインが出力したCSVファイルを読み込む（英語・日本語カラムの両方に対応）
+
+    Parameters:
+    path (str): CSVファイルのパス
+    tz (str): 変換先のタイムゾーン（省略時は変換しない）
+    skip_rows (int): 読み飛ばすデータ行の数（追記された行だけを読む場合に使う）
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックスのデータフレーム
+    """
+    if use_polars():
+        df = read_price_csv_polars(path, parse_dates, tz, skip_rows)
+        if df is not None:
+            return normalize_columns(df)
+
+    df = pd.read_csv(path, index_col=0, skiprows=range(1, skip_rows + 1) if skip_rows > 0 else None,
+                     float_precision=CSV_FLOAT_PRECISION)
+    df.index = parse_dates(df.index, tz)
+    return normalize_columns(df)
+
+def get_data_version(catalog, symbol, interval):
+    """
+    成果物のデータバージョンを表す文字列を返す（キャッシュやETagのキーに使う）
+
+    Returns:
+    str: バージョン文字列（未登録の場合はNone）
+    """
+    artifact = lookup_entry(catalog, symbol, resolve_interval(interval))
+    if artifact is None:
+        return None
+    return f"{artifact.get('version')}-{artifact.get('rows')}-{artifact.get('end')}-{artifact.get('updated')}"
+
+def read_prices(output_dir, symbol, interval, catalog, start=None, end=None):
+    """
+    カタログから銘柄・期間のデータを探して読み込む
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    symbol (str): ティッカーシンボル
+    interval (str): 期間コードまたは期間名
+    catalog (dict): 成果物カタログ
+    start (str): 開始日（省略時は最初から）
+    end (str): 終了日（省略時は最後まで）
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックスのデータフレーム（未登録の場合はNone）
+    """
+    # 分足は月ごとのパーティションから読み込む
+    if interval in INTRADAY_LIMITS:
+        df = read_intraday(output_dir, symbol, interval, catalog, start, end)
+        return normalize_columns(df) if not df.empty else None
+
+    # CSVから移行した列ファイルがあればそちらを読む（CSVより古い場合は使わない）
+    store_dir = lookup_store(catalog, symbol, resolve_interval(interval), output_dir)
+    if store_dir is not None:
+        try:
+            return read_frame(store_dir, start=start, end=end)
+        except (OSError, ValueError) as e:
+            # 他の処理が削除・書き込み中などで読めない場合はCSVを読む
+            print(f"警告: {symbol}の列ファイルを読み込めませんでした（CSVを読みます）: {e}")
+
+    path = lookup_artifact(catalog, symbol, resolve_interval(interval), output_dir)
+    if path is None:
+        return None
+
+    tz = EXCHANGES[get_exchange(symbol, get_symbol_exchange(catalog, symbol))]["timezone"]
+    df = read_price_csv(path, tz)
+    return slice_dates(df, start, end)
+
+def slice_dates(df, start=None, end=None):
+    """日時インデックスのデータフレームを開始日・終了日で絞り込む"""
+    if start:
+        start_ts = pd.Timestamp(start)
+        if df.index.tz is not None and start_ts.tzinfo is None:
+            start_ts = start_ts.tz_localize(df.index.tz)
+        df = df[df.index >= start_ts]
+    if end:
+        end_ts = pd.Timestamp(end)
+        if df.index.tz is not None and end_ts.tzinfo is None:
+            end_ts = end_ts.tz_localize(df.index.tz)
+        # 終了日はその日の終わりまでを含める
+        if end_ts == end_ts.normalize():
+            end_ts = end_ts + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+        df = df[df.index <= end_ts]
+    return df
+
+def resample_ohlcv(df, rule):
+    """
+    足を任意の期間（2W、6MEなど）に変換する
+
+    Parameters:
+    df (pd.DataFrame): 英語カラム名・日時インデックスのデータフレーム
+    rule (str): pandasの期間指定
+
+    Returns:
+    pd.DataFrame: 変換後のデータフレーム（取引のない期間は除く）
+    """
+    if use_polars():
+        resampled = resample_ohlcv_polars(df, rule, OHLCV_AGGREGATION)
+        if resampled is not None:
+            return resampled
+
+    aggregation = {col: how for col, how in OHLCV_AGGREGATION.items() if col in df.columns}
+    resampled = df.resample(rule).agg(aggregation)
+    if 'Open' in resampled.columns:
+        resampled = resampled.dropna(subset=['Open'])
+    return resampled
+
+def resample_universe(frames, rule):
+    """
+    複数銘柄の足をまとめて任意の期間に変換する
+
+    polarsで処理する設定の場合は全銘柄を1回の集計で変換する（polarsで変換できない銘柄はpandasで変換する）。
+
+    Parameters:
+    frames (dict): 銘柄 → 英語カラム名・日時インデックスのデータフレーム
+    rule (str): pandasの期間指定
+
+    Returns:
+    dict: 銘柄 → 変換後のデータフレーム
+    """
+    resampled = (resample_universe_polars(frames, rule, OHLCV_AGGREGATION) if use_polars() else None) or {}
+    return {symbol: resampled[symbol] if symbol in resampled else resample_ohlcv(df, rule)
+            for symbol, df in frames.items()}
@@ -0,0 +1,417 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+import stock_data_all_new
+from artifact_catalog import load_catalog, save_catalog
+from intraday_store import append_bars
+from market_calendar import get_exchange, is_market_open, load_extra_holidays
+
+# 銘柄ごとに保持する直近のティック数・1分足の本数
+TICK_CAPACITY = 10000
+BAR_CAPACITY = 1440
+
+# 確定した1分足をまとめて保存する間隔（秒）と本数（どちらかに達したら保存する）
+FLUSH_SECONDS = 60
+FLUSH_BARS = 500
+
+# 実時間の場合、1分が終わってから足を確定するまで遅れて届くティックを待つ時間（秒）
+BAR_CLOSE_DELAY = 2
+
+# Yahoo Financeから価格を取得する間隔（秒）
+POLL_SECONDS = 15
+
+# 1分足を保存する期間コード（intraday_store と共有）
+BAR_INTERVAL = "1m"
+
+MINUTE_NS = 60 * 10 ** 9
+
+# ティックのリングバッファの列（時刻はUTCのナノ秒）
+TICK_FIELDS = {"time": np.int64, "price": np.float64, "size": np.float64}
+
+# 1分足のリングバッファの列（時刻は足の開始時刻）
+BAR_FIELDS = {"time": np.int64, "Open": np.float64, "High": np.float64, "Low": np.float64, "Close": np.float64,
+              "Volume": np.float64}
+
+class RingBuffer:
+    """
+    固定長の配列に直近のデータを保持するリングバッファ
+
+    列ごとにNumPy配列を確保し、古いデータから上書きする（追加でメモリを確保しない）。
+    """
+
+    def __init__(self, capacity, fields):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in fields.items()}
+        self.head = 0
+        self.count = 0
+
+    def append(self, *values):
+        """1行を追加する（値は列の順）"""
+        head = self.head
+        for column, value in zip(self.columns.values(), values):
+            column[head] = value
+        self.head = (head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def latest(self, n=None):
+        """
+        直近のn行を古い順に返す
+
+        Returns:
+        dict: 列名 → 配列（コピー）
+        """
+        n = self.count if n is None else min(n, self.count)
+        positions = (np.arange(self.head - n, self.head)) % self.capacity
+        return {name: column[positions] for name, column in self.columns.items()}
+
+    def last(self, field):
+        """最後に追加した行の値を返す（空の場合はNone）"""
+        if self.count == 0:
+            return None
+        return self.columns[field][(self.head - 1) % self.capacity]
+
+    def __len__(self):
+        return self.count
+
+class QuoteFeed:
+    """
+    価格の配信元の基底クラス
+
+    poll() は届いたティック（シンボル, UTCのナノ秒, 価格, 数量）のリストを返し、
+    配信が終わった場合はNoneを返す。live がTrueの配信元は実時間で足を確定する。
+    """
+    live = True
+
+    def poll(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+def bar_to_ticks(symbol, time_ns, open_, high, low, close, volume):
+    """1本の足を始値→高値→安値→終値のティックに分解する（出来高は終値のティックに載せる）"""
+    return [(symbol, time_ns, open_, 0.0), (symbol, time_ns, high, 0.0),
+            (symbol, time_ns, low, 0.0), (symbol, time_ns, close, volume)]
+
+class ReplayFeed(QuoteFeed):
+    """
+    保存したティックを再生する配信元（テスト・検証用）
+
+    speed を指定した場合はティックの時刻の間隔を speed 倍速で再現し、省略した場合は待たずに再生する。
+    """
+    live = False
+
+    def __init__(self, ticks, batch_size=1000, speed=None):
+        """
+        Parameters:
+        ticks (pd.DataFrame): Symbol・Datetime・Price・Volume 列のデータフレーム（時刻順）
+        batch_size (int): 1回の poll() で返すティックの数
+        speed (float): 再生速度の倍率（省略時は待たない）
+        """
+        times = pd.to_datetime(ticks["Datetime"], utc=True).dt.as_unit('ns')
+        self.symbols = ticks["Symbol"].astype(str).to_numpy()
+        self.times = times.astype('int64').to_numpy()
+        self.prices = ticks["Price"].to_numpy(dtype=float)
+        self.sizes = ticks["Volume"].fillna(0).to_numpy(dtype=float) if "Volume" in ticks.columns \
+            else np.zeros(len(ticks))
+        self.batch_size = batch_size
+        self.speed = speed
+        self.position = 0
+        self.started = None
+
+    @classmethod
+    def from_csv(cls, path, **kwargs):
+        """ティックのCSVファイル（Symbol, Datetime, Price, Volume）から作成する"""
+        return cls(pd.read_csv(path, encoding='utf-8-sig'), **kwargs)
+
+    @classmethod
+    def from_bars(cls, bars, **kwargs):
+        """
+        足のデータ（{シンボル: 日時インデックスのデータフレーム}）を始値→高値→安値→終値のティックにして作成する
+        """
+        frames = []
+        for symbol, df in bars.items():
+            index = pd.DatetimeIndex(df.index)
+            for order, (col, volume) in enumerate([("Open", 0), ("High", 0), ("Low", 0), ("Close", 1)]):
+                frames.append(pd.DataFrame({
+                    "Symbol": symbol, "Datetime": index, "Order": order, "Price": df[col].to_numpy(),
+                    "Volume": df["Volume"].to_numpy() * volume if "Volume" in df.columns else 0.0}))
+        ticks = pd.concat(frames, ignore_index=True)
+        ticks["Datetime"] = pd.to_datetime(ticks["Datetime"], utc=True)
+        ticks = ticks.sort_values(["Datetime", "Order"], kind='stable').reset_index(drop=True)
+        return cls(ticks, **kwargs)
+
+    def poll(self):
+        if self.position >= len(self.times):
+            return None
+        start, end = self.position, min(self.position + self.batch_size, len(self.times))
+        if self.speed:
+            # 最初のティックからの経過時間を speed 倍速で再現する
+            if self.started is None:
+                self.started = (time.monotonic(), self.times[0])
+            elapsed = (self.times[end - 1] - self.started[1]) / 1e9 / self.speed
+            wait = self.started[0] + elapsed - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self.position = end
+        return list(zip(self.symbols[start:end].tolist(), self.times[start:end].tolist(),
+                        self.prices[start:end].tolist(), self.sizes[start:end].tolist()))
+
+class YahooPollingFeed(QuoteFeed):
+    """
+    Yahoo Financeの1分足を定期的に取得して配信する（取引時間中の銘柄のみ）
+
+    確定した1分足を始値→高値→安値→終値のティックに分解して返すため、価格は最大1分程度遅れる。
+    """
+    live = True
+
+    def __init__(self, symbols, poll_seconds=POLL_SECONDS, exchanges=None, extra_holidays=None):
+        self.symbols = list(symbols)
+        self.poll_seconds = poll_seconds
+        self.exchanges = {symbol: get_exchange(symbol, (exchanges or {}).get(symbol)) for symbol in self.symbols}
+        self.extra_holidays = extra_holidays or {}
+        self.last_sent = {}
+        self.last_poll = None
+
+    def poll(self):
+        if self.last_poll is not None:
+            wait = self.last_poll + self.poll_seconds - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        self.last_poll = time.monotonic()
+
+        ticks = []
+        for symbol in self.symbols:
+            exchange = self.exchanges[symbol]
+            if not is_market_open(exchange, extra_holidays=self.extra_holidays.get(exchange, ())):
+                continue
+            try:
+                data = yf.Ticker(symbol).history(period="1d", interval=BAR_INTERVAL)
+            except Exception as e:
+                print(f"{symbol}の価格の取得中にエラーが発生しました: {e}")
+                continue
+            if len(data) < 2:
+                continue
+            # 最後の足はまだ確定していないため送らない
+            data = data.iloc[:-1]
+            times = pd.DatetimeIndex(data.index).tz_convert('UTC').as_unit('ns').asi8
+            new = times > self.last_sent.get(symbol, -1)
+            for time_ns, row in zip(times[new], data[new].itertuples()):
+                ticks.extend(bar_to_ticks(symbol, int(time_ns), row.Open, row.High, row.Low, row.Close, row.Volume))
+            if new.any():
+                self.last_sent[symbol] = int(times[new][-1])
+        return ticks
+
+class RealtimeIngestor:
+    """
+    ティックを銘柄ごとのリングバッファに保持し、1分足を作って分足の保存先にまとめて書き込む
+
+    確定した足は BAR_INTERVAL の分足として intraday_store に追記する（同じ時刻の足は上書きされるため、
+    後で collect_intraday が取得した足で置き換わる）。
+    """
+
+    def __init__(self, output_dir, catalog, tick_capacity=TICK_CAPACITY, bar_capacity=BAR_CAPACITY,
+                 flush_seconds=FLUSH_SECONDS, flush_bars=FLUSH_BARS):
+        self.output_dir = output_dir
+        self.catalog = catalog
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self.flush_seconds = flush_seconds
+        self.flush_bars = flush_bars
+        self.ticks = {}
+        self.bars = {}
+        # 作成中の1分足（シンボル → [開始時刻, 始値, 高値, 安値, 終値, 出来高]）
+        self.open_bars = {}
+        # 保存待ちの確定した足（シンボル → 行のリスト）
+        self.pending = {}
+        self.pending_count = 0
+        self.watermark = None
+        self.last_flush = time.monotonic()
+        self.counts = {"ticks": 0, "late": 0, "bars": 0, "saved": 0, "flushes": 0}
+
+    def get_buffers(self, symbol):
+        if symbol not in self.ticks:
+            self.ticks[symbol] = RingBuffer(self.tick_capacity, TICK_FIELDS)
+            self.bars[symbol] = RingBuffer(self.bar_capacity, BAR_FIELDS)
+        return self.ticks[symbol]
+
+    def process(self, symbol, time_ns, price, size=0.0):
+        """1つのティックを処理する（リングバッファへの追加と1分足の更新）"""
+        self.get_buffers(symbol).append(time_ns, price, size)
+        self.counts["ticks"] += 1
+        if self.watermark is None or time_ns > self.watermark:
+            self.watermark = time_ns
+
+        minute = time_ns - time_ns % MINUTE_NS
+        bar = self.open_bars.get(symbol)
+        if bar is not None and minute > bar[0]:
+            self.close_bar(symbol)
+            bar = None
+        if bar is None:
+            last_closed = self.bars[symbol].last("time")
+            if last_closed is not None and minute <= last_closed:
+                # 確定済みの足の時刻のティック（遅れて届いたもの）は足に反映しない
+                self.counts["late"] += 1
+                return
+            self.open_bars[symbol] = [minute, price, price, price, price, size]
+            return
+        if minute < bar[0]:
+            self.counts["late"] += 1
+            return
+        if price > bar[2]:
+            bar[2] = price
+        if price < bar[3]:
+            bar[3] = price
+        bar[4] = price
+        bar[5] += size
+
+    def close_bar(self, symbol):
+        """作成中の足を確定してリングバッファと保存待ちに移す"""
+        bar = self.open_bars.pop(symbol)
+        self.bars[symbol].append(*bar)
+        self.pending.setdefault(symbol, []).append(bar)
+        self.pending_count += 1
+        self.counts["bars"] += 1
+
+    def close_bars(self, clock_ns):
+        """clock_ns の時点で終わっている1分の足を全て確定する"""
+        for symbol in [symbol for symbol, bar in self.open_bars.items() if bar[0] + MINUTE_NS <= clock_ns]:
+            self.close_bar(symbol)
+
+    def flush(self):
+        """
+        保存待ちの足を銘柄ごとにまとめて分足の保存先に追記し、カタログを保存する
+
+        Returns:
+        int: 保存した足の数
+        """
+        pending, self.pending, self.pending_count = self.pending, {}, 0
+        self.last_flush = time.monotonic()
+        saved = 0
+        for symbol, rows in pending.items():
+            index = pd.DatetimeIndex(np.array([row[0] for row in rows], dtype=np.int64), tz='UTC', name='Datetime')
+            df = pd.DataFrame([row[1:] for row in rows], index=index, columns=["Open", "High", "Low", "Close", "Volume"],
+                              dtype=float)
+            df["Dividends"] = 0.0
+            df["Stock Splits"] = 0.0
+            try:
+                append_bars(df, self.output_dir, symbol, BAR_INTERVAL, self.catalog)
+                saved += len(df)
+            except Exception as e:
+                print(f"{symbol}の1分足の保存中にエラーが発生しました: {e}")
+        if saved:
+            save_catalog(self.catalog, self.output_dir)
+        self.counts["saved"] += saved
+        self.counts["flushes"] += 1
+        return saved
+
+    def run(self, feed, duration=None):
+        """
+        配信元のティックを処理し続ける（配信が終わるか duration 秒が経過するまで）
+
+        実時間の配信元は現在時刻、再生の配信元は最新のティックの時刻で1分足を確定する。
+        終了時には作成中の足を確定し、保存待ちの足を全て保存する。
+
+        Returns:
+        dict: 処理したティック数・作成した足の数などの集計
+        """
+        started = time.monotonic()
+        try:
+            while duration is None or time.monotonic() - started < duration:
+                ticks = feed.poll()
+                if ticks is None:
+                    break
+                for symbol, time_ns, price, size in ticks:
+                    self.process(symbol, time_ns, price, size)
+
+                if feed.live:
+                    self.close_bars(time.time_ns() - BAR_CLOSE_DELAY * 10 ** 9)
+                elif self.watermark is not None:
+                    self.close_bars(self.watermark - self.watermark % MINUTE_NS)
+                if self.pending_count >= self.flush_bars or \
+                        (self.pending_count and time.monotonic() - self.last_flush >= self.flush_seconds):
+                    self.flush()
+        except KeyboardInterrupt:
+            print("\n中断しました。作成中の足を保存します...")
+        finally:
+            feed.close()
+            for symbol in list(self.open_bars):
+                self.close_bar(symbol)
+            if self.pending_count:
+                self.flush()
+        return dict(self.counts, seconds=time.monotonic() - started)
+
+    def latest_ticks(self, symbol, n=None):
+        """直近のティックをデータフレームで返す"""
+        return self.to_frame(self.ticks.get(symbol), n, "time")
+
+    def latest_bars(self, symbol, n=None, include_open=True):
+        """直近の1分足をデータフレームで返す（include_open がTrueの場合は作成中の足を含める）"""
+        df = self.to_frame(self.bars.get(symbol), n, "time")
+        if include_open and symbol in self.open_bars:
+            bar = self.open_bars[symbol]
+            current = pd.DataFrame([bar[1:]], columns=df.columns,
+                                   index=pd.DatetimeIndex([bar[0]], tz='UTC', name='Datetime'))
+            df = pd.concat([df, current]) if len(df) else current
+        return df
+
+    @staticmethod
+    def to_frame(buffer, n, time_field):
+        if buffer is None:
+            return pd.DataFrame()
+        data = buffer.latest(n)
+        index = pd.DatetimeIndex(data.pop(time_field), tz='UTC', name='Datetime')
+        return pd.DataFrame(data, index=index)
+
+def main():
+    """
+    メイン関数：設定ファイルの銘柄の価格を取引時間中に取り込み、1分足を保存する
+
+    使い方: python realtime_ingest.py [-replay ticks.csv] [-speed 倍率] [-minutes 分]
+    （-replay を指定した場合はCSVファイルのティックを再生する）
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    ticker_config = config.get("tickers", [])
+
+    args = sys.argv[1:]
+    replay_path = args[args.index("-replay") + 1] if "-replay" in args[:-1] else None
+    speed = float(args[args.index("-speed") + 1]) if "-speed" in args[:-1] else None
+    minutes = float(args[args.index("-minutes") + 1]) if "-minutes" in args[:-1] else None
+
+    if replay_path:
+        feed = ReplayFeed.from_csv(replay_path, speed=speed)
+        source = f"再生: {replay_path}"
+    else:
+        feed = YahooPollingFeed([item["symbol"] for item in ticker_config],
+                                exchanges={item["symbol"]: item.get("exchange") for item in ticker_config},
+                                extra_holidays=load_extra_holidays(config))
+        source = f"Yahoo Finance（{POLL_SECONDS}秒ごと）"
+
+    os.makedirs(output_dir, exist_ok=True)
+    catalog = load_catalog(output_dir)
+    ingestor = RealtimeIngestor(output_dir, catalog)
+
+    print("===== リアルタイム取り込み =====")
+    print(f"出力ディレクトリ: {output_dir}")
+    print(f"配信元: {source}")
+    print(f"開始: {datetime.now():%Y-%m-%d %H:%M:%S}（Ctrl+Cで終了）")
+    result = ingestor.run(feed, duration=minutes * 60 if minutes else None)
+
+    rate = result["ticks"] / max(result["seconds"], 1e-9)
+    print(f"\nティック{result['ticks']}件（{rate:,.0f}件/秒、遅延{result['late']}件）から1分足{result['bars']}本を作成し、"
+          f"{result['saved']}本を{result['flushes']}回に分けて保存しました。")
+    for symbol in ingestor.bars:
+        bars = ingestor.latest_bars(symbol, 1)
+        if len(bars):
+            print(f"  {symbol}: {bars.index[-1]:%Y-%m-%d %H:%M} 終値 {bars['Close'].iloc[-1]}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba = None
+    prange = range
+
+# Numbaがインストールされていれば逐次処理のカーネルをJITコンパイルして使う
+USE_NUMBA = numba is not None
+
+def as_columns(x):
+    """入力を (時系列 × 銘柄) の連続したfloat64配列にする（1次元の場合は1列にする）"""
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim == 1:
+        return np.ascontiguousarray(x[:, None]), True
+    return np.ascontiguousarray(x), False
+
+def restore_shape(out, was_1d):
+    return out[:, 0] if was_1d else out
+
+def resolve_use_numba(use_numba):
+    return USE_NUMBA if use_numba is None else use_numba
+
+# ===== 逐次処理のカーネル（Numbaでコンパイルする。Numbaがない場合は使わない） =====
+# カーネルは列ごとに連続した配列（Fortran順）を受け取り、銘柄の列を並列に処理する。
+# 行ごとに連続した配列のまま列を順に読むと、1要素ごとに銘柄数×8バイト離れた位置を読むことになり遅い。
+
+def deque_extreme_kernel(x, window, sign, out):
+    """
+    単調キュー（両端キュー）による移動最大値（sign=1）・移動最小値（sign=-1）
+
+    キューには窓の中で「これより後ろに自分以上の値がない」位置だけを残すため、
+    各要素の出し入れは1回ずつで、窓の長さによらず全体でO(n)になる。
+    窓に欠損値が含まれる場合はNaNを出力する（pandasのrollingと同じ）。
+    """
+    n_rows, n_cols = x.shape
+    for j in prange(n_cols):
+        col = x[:, j]
+        queue = np.empty(window, dtype=np.int64)
+        head = 0
+        size = 0
+        last_nan = -window - 1
+        for t in range(n_rows):
+            # 窓から外れた位置を先頭から取り除く
+            if size > 0 and queue[head] <= t - window:
+                head = head + 1 if head + 1 < window else 0
+                size -= 1
+            v = col[t]
+            if v != v:
+                last_nan = t
+            else:
+                # 新しい値以下の値は今後最大値にならないので末尾から取り除く
+                while size > 0:
+                    tail = head + size - 1
+                    if tail >= window:
+                        tail -= window
+                    if sign * col[queue[tail]] > sign * v:
+                        break
+                    size -= 1
+                tail = head + size
+                if tail >= window:
+                    tail -= window
+                queue[tail] = t
+                size += 1
+            if t < window - 1 or last_nan > t - window or size == 0:
+                out[t, j] = np.nan
+            else:
+                out[t, j] = col[queue[head]]
+
+def running_sum_kernel(x, window, out):
+    """
+    補正付きの累計（Kahanの加算）による移動合計
+
+    窓に入る値を加え、窓から出る値を引くたびに丸め誤差を補正するため、
+    長い系列でも累計の誤差が積み重ならない（pandasのrolling().sum()と同じ方法）。
+    """
+    n_rows, n_cols = x.shape
+    for j in prange(n_cols):
+        total = 0.0
+        compensation = 0.0
+        nan_count = 0
+        for t in range(n_rows):
+            v = x[t, j]
+            if v != v:
+                nan_count += 1
+            else:
+                y = v - compensation
+                new_total = total + y
+                compensation = (new_total - total) - y
+                total = new_total
+            if t >= window:
+                old = x[t - window, j]
+                if old != old:
+                    nan_count -= 1
+                else:
+                    y = -old - compensation
+                    new_total = total + y
+                    compensation = (new_total - total) - y
+                    total = new_total
+            if t < window - 1 or nan_count > 0:
+                out[t, j] = np.nan
+            else:
+                out[t, j] = total
+
+def welford_kernel(x, window, ddof, mean_out, var_out):
+    """
+    Welford法による移動平均・移動分散
+
+    窓に入る値を加え、窓から出る値を取り除くたびに平均と偏差平方和を更新するため、
+    累積和の差を使う方法よりも桁落ちが起きにくい。
+    """
+    n_rows, n_cols = x.shape
+    for j in prange(n_cols):
+        count = 0
+        nan_count = 0
+        mean = 0.0
+        m2 = 0.0
+        for t in range(n_rows):
+            v = x[t, j]
+            if v != v:
+                nan_count += 1
+            else:
+                count += 1
+                delta = v - mean
+                mean += delta / count
+                m2 += delta * (v - mean)
+            if t >= window:
+                old = x[t - window, j]
+                if old != old:
+                    nan_count -= 1
+                else:
+                    count -= 1
+                    if count == 0:
+                        mean = 0.0
+                        m2 = 0.0
+                    else:
+                        delta = old - mean
+                        mean -= delta / count
+                        m2 -= delta * (old - mean)
+            if t < window - 1 or nan_count > 0:
+                mean_out[t, j] = np.nan
+                var_out[t, j] = np.nan
+            else:
+                mean_out[t, j] = mean
+                var_out[t, j] = max(m2, 0.0) / (count - ddof) if count > ddof else np.nan
+
+if USE_NUMBA:
+    deque_extreme_kernel = numba.njit(parallel=True, cache=True)(deque_extreme_kernel)
+    running_sum_kernel = numba.njit(parallel=True, cache=True)(running_sum_kernel)
+    welford_kernel = numba.njit(parallel=True, cache=True)(welford_kernel)
+
+def run_kernel(kernel, values, *args, n_out=1):
+    """列ごとに連続した配列に並べ替えてカーネルを実行する（出力も列ごとに連続した配列）"""
+    values = np.asfortranarray(values)
+    outs = [np.empty(values.shape, order='F') for _ in range(n_out)]
+    kernel(values, *args, *outs)
+    return outs[0] if n_out == 1 else outs
+
+# ===== NumPyだけで計算する実装（Numbaがない場合に使う） =====
+
+def numpy_rolling_extreme(x, window, ufunc):
+    """
+    van Herk/Gil-Werman法による移動最大値・移動最小値
+
+    系列を窓の長さのブロックに分け、ブロック内の前からの累積最大と後ろからの累積最大を
+    求めておくと、どの窓も「前のブロックの後ろからの累積」と「次のブロックの前からの累積」の
+    2つの値の最大になる。累積はNumPyでまとめて計算できるため、全体でO(n)になる。
+    """
+    n_rows, n_cols = x.shape
+    n_blocks = -(-n_rows // window)
+    padded = np.full((n_blocks * window, n_cols), np.nan)
+    padded[:n_rows] = x
+    blocks = padded.reshape(n_blocks, window, n_cols)
+    prefix = ufunc.accumulate(blocks, axis=1).reshape(-1, n_cols)
+    suffix = ufunc.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_cols)
+
+    out = np.full((n_rows, n_cols), np.nan)
+    # np.maximum / np.minimum は欠損値を伝播するため、窓に欠損値があればNaNになる
+    out[window - 1:] = ufunc(suffix[:n_rows - window + 1], prefix[window - 1:n_rows])
+    return out
+
+# 移動合計・移動平均・移動分散は、NumPyの累積和では配列を何度も読み書きするため
+# pandasの逐次計算より速くならない。Numbaがない場合はpandasのrollingで計算する。
+
+# ===== 公開する関数 =====
+
+def check_window(window):
+    if window < 1:
+        raise ValueError(f"窓の長さは1以上にしてください: {window}")
+
+def rolling_max(x, window, use_numba=None):
+    """
+    移動最大値（窓に欠損値がある場合・窓がそろわない先頭部分はNaN）
+
+    Parameters:
+    x (array-like): 時系列（1次元）または 時系列 × 銘柄 の2次元配列
+    window (int): 窓の長さ
+    use_numba (bool): Numbaのカーネルを使うかどうか（省略時はインストールされていれば使う）
+
+    Returns:
+    np.ndarray: 入力と同じ形の配列
+    """
+    return rolling_extreme(x, window, 1, use_numba)
+
+def rolling_min(x, window, use_numba=None):
+    """移動最小値（引数と戻り値は rolling_max と同じ）"""
+    return rolling_extreme(x, window, -1, use_numba)
+
+def rolling_extreme(x, window, sign, use_numba=None):
+    check_window(window)
+    values, was_1d = as_columns(x)
+    if window > len(values):
+        return restore_shape(np.full(values.shape, np.nan), was_1d)
+    if resolve_use_numba(use_numba):
+        out = run_kernel(deque_extreme_kernel, values, window, sign)
+    else:
+        out = numpy_rolling_extreme(values, window, np.maximum if sign > 0 else np.minimum)
+    return restore_shape(out, was_1d)
+
+def rolling_moment(x, window, how, use_numba=None, ddof=1):
+    """
+    移動合計（how="sum"）・移動平均（"mean"）・移動分散（"var"）を計算する
+
+    Numbaがある場合は列ごとのカーネル、ない場合はpandasのrollingで計算する。
+    """
+    check_window(window)
+    values, was_1d = as_columns(x)
+    if window > len(values):
+        return restore_shape(np.full(values.shape, np.nan), was_1d)
+    if resolve_use_numba(use_numba):
+        if how == "var":
+            out = run_kernel(welford_kernel, values, window, ddof, n_out=2)[1]
+        else:
+            out = run_kernel(running_sum_kernel, values, window)
+            if how == "mean":
+                out /= window
+    else:
+        rolling = pd.DataFrame(values, copy=False).rolling(window)
+        out = (rolling.var(ddof=ddof) if how == "var" else getattr(rolling, how)()).to_numpy()
+    return restore_shape(out, was_1d)
+
+def rolling_sum(x, window, use_numba=None):
+    """移動合計（出来高の合計など）"""
+    return rolling_moment(x, window, "sum", use_numba)
+
+def rolling_mean(x, window, use_numba=None):
+    """移動平均"""
+    return rolling_moment(x, window, "mean", use_numba)
+
+def rolling_var(x, window, ddof=1, use_numba=None):
+    """移動分散（既定は不偏分散）"""
+    return rolling_moment(x, window, "var", use_numba, ddof)
+
+def rolling_std(x, window, ddof=1, use_numba=None):
+    """移動標準偏差"""
+    return np.sqrt(rolling_var(x, window, ddof, use_numba))
+
+def drawdown(x):
+    """
+    各時点の直近最高値からの下落率（欠損値は最高値の計算から除く）
+
+    Returns:
+    np.ndarray: 入力と同じ形の配列（0以下の値）
+    """
+    values, was_1d = as_columns(x)
+    running_max = np.fmax.accumulate(values, axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        out = values / running_max - 1
+    return restore_shape(out, was_1d)
+
+def max_drawdown(x):
+    """
+    最大ドローダウン（期間中の最高値からの最大の下落率）
+
+    Returns:
+    float または np.ndarray: 1次元の入力ならfloat、2次元なら銘柄ごとの配列
+    """
+    dd = drawdown(x)
+    with np.errstate(invalid='ignore'):
+        if dd.ndim == 1:
+            return float(np.nanmin(dd)) if np.any(~np.isnan(dd)) else np.nan
+        out = np.full(dd.shape[1], np.nan)
+        has_values = ~np.all(np.isnan(dd), axis=0)
+        out[has_values] = np.nanmin(dd[:, has_values], axis=0)
+        return out
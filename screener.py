@@ -0,0 +1,269 @@
+import os
+import ast
+import sys
+import operator
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from summary_table import SUMMARY_CSV
+from file_lock import file_lock, atomic_path
+
+# 条件式で使える比較演算子
+COMPARE_OPERATORS = {
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne
+}
+
+# 条件式で使える算術演算子（列どうしの比較用）
+ARITHMETIC_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv
+}
+
+# 比較の向きを入れ替えたときの演算子（3 < Close → Close > 3）
+REVERSED_OPERATORS = {
+    ast.Gt: ast.Lt,
+    ast.GtE: ast.LtE,
+    ast.Lt: ast.Gt,
+    ast.LtE: ast.GtE,
+    ast.Eq: ast.Eq,
+    ast.NotEq: ast.NotEq
+}
+
+class Screener:
+    """
+    サマリー表に対するスクリーナー
+
+    列ごとの値を配列として保持し、数値列には値の昇順に並べた索引を作る。
+    「列 > 定数」の条件は索引の二分探索で、上位N件は索引の末尾から取り出すため、
+    銘柄数が数千でも全行を並べ替えずに絞り込める。
+
+    条件式の例:
+        Volume_Ratio > 2 and New_High_20D
+        Return_1M >= 0.1 and not (From_52W_High < -0.2)
+        Volume > 2 * Avg_Volume_20D or Name == "任天堂"
+    """
+
+    def __init__(self, summary):
+        self.symbols = summary.index.to_numpy()
+        self.columns = {}
+        for col in summary.columns:
+            values = summary[col]
+            if pd.api.types.is_bool_dtype(values):
+                self.columns[col] = values.to_numpy(dtype=bool)
+            elif pd.api.types.is_numeric_dtype(values):
+                self.columns[col] = values.to_numpy(dtype=float)
+            else:
+                self.columns[col] = values.to_numpy(dtype=object)
+        self.summary = summary
+        # 列名 → (欠損を除いた昇順の行番号, 並べ替えた値)
+        self.indexes = {}
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def get_column(self, name):
+        if name not in self.columns:
+            raise ValueError(f"列 {name} はありません（使える列: {', '.join(self.columns)}）")
+        return self.columns[name]
+
+    def get_index(self, name):
+        """数値列の索引を返す（初めて使うときに作成する）"""
+        if name not in self.indexes:
+            values = self.get_column(name).astype(float)
+            valid = np.flatnonzero(~np.isnan(values))
+            order = valid[np.argsort(values[valid], kind='stable')]
+            self.indexes[name] = (order, values[order])
+        return self.indexes[name]
+
+    def compare_indexed(self, name, op, value):
+        """「数値列 演算子 定数」の条件を索引の二分探索で評価する"""
+        order, sorted_values = self.get_index(name)
+        if op is ast.Gt:
+            rows = order[np.searchsorted(sorted_values, value, side='right'):]
+        elif op is ast.GtE:
+            rows = order[np.searchsorted(sorted_values, value, side='left'):]
+        elif op is ast.Lt:
+            rows = order[:np.searchsorted(sorted_values, value, side='left')]
+        elif op is ast.LtE:
+            rows = order[:np.searchsorted(sorted_values, value, side='right')]
+        elif op is ast.Eq:
+            rows = order[np.searchsorted(sorted_values, value, side='left'):
+                         np.searchsorted(sorted_values, value, side='right')]
+        else:
+            return ~self.compare_indexed(name, ast.Eq, value)
+        mask = np.zeros(len(self.symbols), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def is_indexable(self, node):
+        return isinstance(node, ast.Name) and self.get_column(node.id).dtype == float
+
+    def evaluate_node(self, node):
+        """条件式の構文木を評価する（許可した演算子・列名・定数だけを扱う）"""
+        if isinstance(node, ast.Expression):
+            return self.evaluate_node(node.body)
+        if isinstance(node, ast.BoolOp):
+            masks = [self.to_mask(self.evaluate_node(v)) for v in node.values]
+            combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+            return combine.reduce(masks)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            return ~self.to_mask(self.evaluate_node(node.operand))
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+            return -self.evaluate_node(node.operand)
+        if isinstance(node, ast.Compare):
+            mask = np.ones(len(self.symbols), dtype=bool)
+            left = node.left
+            for op_node, right in zip(node.ops, node.comparators):
+                op = type(op_node)
+                if op not in COMPARE_OPERATORS:
+                    raise ValueError("使えない比較演算子です")
+                if self.is_indexable(left) and isinstance(right, ast.Constant):
+                    mask &= self.compare_indexed(left.id, op, float(right.value))
+                elif isinstance(left, ast.Constant) and self.is_indexable(right):
+                    mask &= self.compare_indexed(right.id, REVERSED_OPERATORS[op], float(left.value))
+                else:
+                    with np.errstate(invalid='ignore'):
+                        mask &= self.to_mask(COMPARE_OPERATORS[op](self.evaluate_node(left), self.evaluate_node(right)))
+                left = right
+            return mask
+        if isinstance(node, ast.BinOp) and type(node.op) in ARITHMETIC_OPERATORS:
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return ARITHMETIC_OPERATORS[type(node.op)](self.evaluate_node(node.left), self.evaluate_node(node.right))
+        if isinstance(node, ast.Name):
+            return self.get_column(node.id)
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+            return node.value
+        raise ValueError(f"条件式に使えない書き方です: {ast.dump(node)[:60]}")
+
+    def to_mask(self, value):
+        """評価結果を行ごとの真偽値の配列にする（欠損値は偽）"""
+        if np.isscalar(value):
+            return np.full(len(self.symbols), bool(value))
+        if value.dtype == bool:
+            return value
+        if value.dtype == object:
+            return np.array([bool(v) and not pd.isna(v) for v in value], dtype=bool)
+        return np.nan_to_num(value, nan=0.0) != 0
+
+    def filter(self, expression):
+        """
+        条件式に合う行の真偽値の配列を返す
+
+        Parameters:
+        expression (str): 条件式（空の場合は全行）
+
+        Returns:
+        np.ndarray: 行ごとの真偽値
+        """
+        if not expression or not expression.strip():
+            return np.ones(len(self.symbols), dtype=bool)
+        try:
+            tree = ast.parse(expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"条件式を解釈できません: {e.msg}")
+        return self.to_mask(self.evaluate_node(tree))
+
+    def top(self, column, count, mask=None, ascending=False):
+        """
+        数値列の値の大きい順（ascending=Trueなら小さい順）に上位count件の行番号を返す
+
+        並べ替え済みの索引を端から見て条件に合う行を取り出すため、検索のたびに並べ替える必要がない。
+        """
+        order, _ = self.get_index(column)
+        if not ascending:
+            order = order[::-1]
+        if mask is not None:
+            order = order[mask[order]]
+        return order[:count] if count else order
+
+    def screen(self, expression=None, sort=None, count=None, ascending=False):
+        """
+        条件式で絞り込み、指定した列で並べ替えた結果を返す
+
+        Parameters:
+        expression (str): 条件式
+        sort (str): 並べ替える数値列（省略時はサマリーの順）
+        count (int): 返す件数（省略時は全件）
+        ascending (bool): 小さい順に並べるかどうか
+
+        Returns:
+        pd.DataFrame: 条件に合う銘柄のサマリー
+        """
+        mask = self.filter(expression)
+        if sort:
+            rows = self.top(sort, count, mask, ascending)
+        else:
+            rows = np.flatnonzero(mask)
+            rows = rows[:count] if count else rows
+        return self.summary.iloc[rows]
+
+# 出力ディレクトリ → (サマリーファイルの更新時刻, スクリーナー)
+_screeners = {}
+
+def load_screener(output_dir):
+    """
+    サマリーファイルからスクリーナーを作成する（ファイルが更新されていなければ前回のものを使う）
+
+    Returns:
+    Screener: スクリーナー（サマリーファイルがない場合はNone）
+    """
+    path = os.path.join(output_dir, SUMMARY_CSV)
+    if not os.path.exists(path):
+        return None
+    mtime = os.path.getmtime(path)
+    cached = _screeners.get(output_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    summary = pd.read_csv(path, index_col=0, encoding='utf-8-sig')
+    screener = Screener(summary)
+    _screeners[output_dir] = (mtime, screener)
+    return screener
+
+def main():
+    """
+    メイン関数：サマリーを条件式で絞り込んで表示する
+
+    使い方: python screener.py "Volume_Ratio > 2 and New_High_20D" [-sort Return_1M] [-top 20] [-asc] [-csv 出力先]
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+
+    args = sys.argv[1:]
+    expression = args[0] if args and not args[0].startswith("-") else ""
+    sort = args[args.index("-sort") + 1] if "-sort" in args[:-1] else None
+    count = int(args[args.index("-top") + 1]) if "-top" in args[:-1] else None
+
+    screener = load_screener(output_dir)
+    if screener is None:
+        print("エラー: サマリーファイルがありません。先に summary_table.py を実行してください。")
+        return
+
+    try:
+        result = screener.screen(expression, sort, count, ascending="-asc" in args)
+    except ValueError as e:
+        print(f"エラー: {e}")
+        return
+
+    print(f"===== スクリーニング結果: {len(result)}/{len(screener)}銘柄 =====")
+    if expression:
+        print(f"条件: {expression}")
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(result)
+
+    if "-csv" in args[:-1]:
+        csv_path = args[args.index("-csv") + 1]
+        with file_lock(csv_path), atomic_path(csv_path) as tmp_path:
+            result.to_csv(tmp_path, encoding='utf-8-sig')
+        print(f"結果を保存しました: {csv_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import os
+import sys
+
+from artifact_catalog import (load_or_rebuild_catalog, save_catalog, lookup_artifact, register_frame,
+                              symbols_with, get_base_name, make_safe_ticker, CONFIG_FILE)
+from columnar_store import write_frame, read_frame
+from price_store import JAPANESE_COLUMNS
+from file_lock import file_lock, atomic_path, read_json
+
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# ステージ間で受け渡すデータを置くフォルダ（出力ディレクトリ内）
+STAGE_DIR_NAME = "stages"
+
+# カタログでステージのデータを登録するキーの接頭辞（CSVの成果物と区別するため）
+STAGE_PREFIX = "stage:"
+
+# Arrow IPCファイルの拡張子
+ARROW_SUFFIX = ".arrow"
+
+def get_stage_key(stage):
+    """ステージ名（四半期足など）からカタログのキーを返す"""
+    return STAGE_PREFIX + stage
+
+def get_stage_path(output_dir, symbol, stage):
+    """
+    銘柄・ステージのデータの保存先を返す
+
+    pyarrowがある場合はArrow IPCファイル、ない場合は列ごとの.npyファイルを置くフォルダ
+    """
+    base = os.path.join(output_dir, STAGE_DIR_NAME, make_safe_ticker(symbol), stage)
+    return base + ARROW_SUFFIX if pa is not None else base
+
+def write_stage(output_dir, catalog, symbol, stage, df):
+    """
+    ステージの結果をメモリマップで読めるファイルに保存し、カタログに登録する
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    catalog (dict): 成果物カタログ
+    symbol (str): ティッカーシンボル
+    stage (str): ステージ名（四半期足など）
+    df (pd.DataFrame): 英語カラム名・日時インデックスのデータフレーム
+
+    Returns:
+    dict: 成果物のエントリ
+    """
+    path = get_stage_path(output_dir, symbol, stage)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    if pa is not None:
+        # 圧縮しないIPCファイルにすることで、読み込み側は変換なしでメモリマップできる
+        table = pa.Table.from_pandas(df, preserve_index=True)
+        tmp_path = path + ".tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, path)
+    else:
+        write_frame(path, df, source={"stage": stage})
+
+    return register_frame(catalog, symbol, get_stage_key(stage), path, output_dir, df)
+
+def read_stage_table(path):
+    """
+    Arrow IPCファイルをメモリマップで開く（データはコピーせずにファイルを参照する）
+
+    Returns:
+    pa.Table: ステージのデータ
+    """
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all()
+
+def read_stage(output_dir, catalog, symbol, stage):
+    """
+    前のステージが保存したデータを読み込む
+
+    Arrow IPCファイルは列ごとに別のブロックとして変換し、変換した列のArrowのバッファはすぐに解放する。
+    欠損値のない数値の列はメモリマップしたファイルをそのまま参照するが、日時のインデックスや
+    欠損値のある列は変換のときにコピーされる（参照した列は読み取り専用になる）。
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックスのデータフレーム（未登録の場合はNone）
+    """
+    path = lookup_artifact(catalog, symbol, get_stage_key(stage), output_dir)
+    if path is None:
+        return None
+    if path.endswith(ARROW_SUFFIX):
+        if pa is None:
+            print(f"エラー: {os.path.basename(path)}を読み込むにはpyarrowが必要です")
+            return None
+        return read_stage_table(path).to_pandas(split_blocks=True, self_destruct=True)
+    return read_frame(path)
+
+def symbols_with_stage(catalog, stage):
+    """指定したステージのデータが登録されている銘柄のリストを返す"""
+    return symbols_with(catalog, get_stage_key(stage))
+
+def load_use_japanese_columns():
+    """設定ファイルからカラム名を日本語にするかどうかを読み込む"""
+    if not os.path.exists(CONFIG_FILE):
+        return False
+    try:
+        return read_json(CONFIG_FILE).get("use_japanese_columns", False)
+    except Exception as e:
+        print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
+        return False
+
+def to_export_frame(df, use_japanese_columns=False):
+    """ステージのデータを書き出し用の形（Date列・設定に合わせたカラム名）にする"""
+    df = df.reset_index()
+    if use_japanese_columns:
+        df = df.rename(columns=JAPANESE_COLUMNS)
+    return df
+
+def export_stage_csv(output_dir, catalog, symbol, stage, use_japanese_columns=False):
+    """
+    ステージのデータをCSVファイルに書き出し、カタログに登録する
+
+    Returns:
+    str: 書き出したファイルのパス（ステージのデータがない場合はNone）
+    """
+    df = read_stage(output_dir, catalog, symbol, stage)
+    if df is None:
+        return None
+    export_df = to_export_frame(df, use_japanese_columns)
+    csv_path = os.path.join(output_dir, f"{get_base_name(catalog, symbol)}_{stage}.csv")
+    with file_lock(csv_path), atomic_path(csv_path) as tmp_path:
+        export_df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+    register_frame(catalog, symbol, stage, csv_path, output_dir, export_df)
+    return csv_path
+
+def main():
+    """
+    メイン関数：ステージのデータをCSVファイルに書き出す
+
+    使い方: python stage_exchange.py 四半期足
+    """
+    if len(sys.argv) < 2:
+        print("使い方: python stage_exchange.py ステージ名（例: 四半期足）")
+        return
+    stage = sys.argv[1]
+
+    # 株価データフォルダのパス
+    data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '株価データ')
+    catalog = load_or_rebuild_catalog(data_folder)
+    use_japanese_columns = load_use_japanese_columns()
+
+    symbols = symbols_with_stage(catalog, stage)
+    print(f"書き出し対象: {len(symbols)}銘柄")
+    for symbol in symbols:
+        csv_path = export_stage_csv(data_folder, catalog, symbol, stage, use_japanese_columns)
+        if csv_path is None:
+            print(f"警告: {symbol}の{stage}データが見つかりません。")
+        else:
+            print(f"CSVファイルを保存しました: {csv_path}")
+
+    save_catalog(catalog, data_folder)
+
+if __name__ == "__main__":
+    main()
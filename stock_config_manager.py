@@ -2,6 +2,7 @@ import json
 import os
 import yfinance as yf
 from time import sleep
+from file_lock import read_json, write_json
 
 # 設定ファイルのパス
 CONFIG_FILE = "stock_config.json"
@@ -44,10 +45,9 @@ def load_config():
     """設定ファイルを読み込む、存在しない場合はデフォルト設定を作成して返す"""
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
-                return config
+            config = read_json(CONFIG_FILE)
+            print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
+            return config
         except Exception as e:
             print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
             print("デフォルト設定を使用します。")
@@ -58,14 +58,101 @@ def load_config():
     return DEFAULT_CONFIG
 
 def save_config(config):
-    """設定ファイルを保存する"""
+    """設定ファイルを保存する（パイプラインが読み込み中でも壊れないよう、ロックして一時ファイルと置き換える）"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        write_json(CONFIG_FILE, config, indent=4)
         print(f"設定ファイル '{CONFIG_FILE}' を保存しました。")
     except Exception as e:
         print(f"設定ファイルの保存中にエラーが発生しました: {e}")
 
+def show_portfolios(config):
+    """ポートフォリオと保有銘柄の一覧を表示する"""
+    portfolios = config.get('portfolios', [])
+    if not portfolios:
+        print("ポートフォリオは登録されていません。")
+    for i, portfolio in enumerate(portfolios, 1):
+        print(f"{i}. {portfolio['name']} (評価通貨: {portfolio.get('currency', 'JPY')}  現金: {portfolio.get('cash', 0):,})")
+        for j, holding in enumerate(portfolio.get('holdings', []), 1):
+            cost = holding.get('cost')
+            print(f"   {j}) {holding['symbol']}  数量: {holding['quantity']:,}  "
+                  f"取得単価: {cost if cost is not None else '-'}  取得日: {holding.get('date') or '-'}")
+
+def edit_portfolios(config):
+    """対話形式でポートフォリオの保有銘柄を編集する（portfolio_engine.py で評価する）"""
+    portfolios = config.setdefault('portfolios', [])
+    print("\n===== 保有銘柄（ポートフォリオ）の編集 =====")
+    show_portfolios(config)
+    print("\na. ポートフォリオを追加  h. 保有銘柄を追加  r. 保有銘柄を削除  d. ポートフォリオを削除  (空白で戻る)")
+    action = input("操作を選択してください: ").strip().lower()
+
+    if action == 'a':
+        name = input("ポートフォリオ名を入力してください: ").strip()
+        if not name or any(p['name'] == name for p in portfolios):
+            print("ポートフォリオ名が空か、すでに存在します。操作をスキップします。")
+            return
+        currency = input("評価通貨を入力してください (デフォルト: JPY): ").strip().upper() or "JPY"
+        try:
+            cash = float(input("現金を入力してください (デフォルト: 0): ").strip() or 0)
+        except ValueError:
+            print("有効な数値を入力してください。")
+            return
+        portfolios.append({"name": name, "currency": currency, "cash": cash, "holdings": []})
+        print(f"ポートフォリオを追加しました: {name} ({currency})")
+        return
+    if action not in ('h', 'r', 'd'):
+        return
+
+    try:
+        idx = int(input("ポートフォリオの番号を入力してください: ").strip()) - 1
+    except ValueError:
+        print("有効な番号を入力してください。")
+        return
+    if not 0 <= idx < len(portfolios):
+        print("無効な番号です。")
+        return
+    portfolio = portfolios[idx]
+    holdings = portfolio.setdefault('holdings', [])
+
+    if action == 'h':
+        symbol = input("ティッカーシンボルを入力してください: ").strip()
+        if not symbol:
+            print("ティッカーシンボルが入力されていません。操作をスキップします。")
+            return
+        if not any(t['symbol'] == symbol for t in config['tickers']):
+            print(f"警告: '{symbol}' は銘柄リストにありません。価格データを取得するには銘柄を追加してください。")
+        try:
+            quantity = float(input("数量を入力してください: ").strip())
+            cost = input("1株あたりの取得単価を入力してください (空白の場合は時価): ").strip()
+            cost = float(cost) if cost else None
+        except ValueError:
+            print("有効な数値を入力してください。")
+            return
+        date = input("取得日を入力してください (例: 2024-01-04、空白の場合はデータの最初から): ").strip()
+        holding = {"symbol": symbol, "quantity": quantity}
+        if cost is not None:
+            holding["cost"] = cost
+        if date:
+            holding["date"] = date
+        holdings.append(holding)
+        print(f"保有銘柄を追加しました: {portfolio['name']} / {symbol} × {quantity:,}")
+
+    elif action == 'r':
+        try:
+            number = int(input("削除する保有銘柄の番号を入力してください: ").strip()) - 1
+        except ValueError:
+            print("有効な番号を入力してください。")
+            return
+        if 0 <= number < len(holdings):
+            removed = holdings.pop(number)
+            print(f"保有銘柄を削除しました: {portfolio['name']} / {removed['symbol']}")
+        else:
+            print("無効な番号です。")
+
+    elif action == 'd':
+        if input(f"ポートフォリオ '{portfolio['name']}' を削除しますか？ (y/n): ").strip().lower() == 'y':
+            portfolios.pop(idx)
+            print(f"ポートフォリオを削除しました: {portfolio['name']}")
+
 def edit_config():
     """対話形式で設定を編集する"""
     config = load_config()
@@ -78,9 +165,10 @@ def edit_config():
         print("4. カラム名の表示設定変更 (日本語/英語)")
         print("5. 出力ディレクトリの変更")
         print("6. 設定を保存して終了")
+        print("7. 保有銘柄（ポートフォリオ）の編集")
         print("0. 変更を破棄して終了")
         
-        choice = input("\n選択してください (0-6): ").strip()
+        choice = input("\n選択してください (0-7): ").strip()
         
         if choice == '1':
             print("\n===== 現在の銘柄リスト =====")
@@ -190,6 +278,9 @@ def edit_config():
             print("設定を保存して終了します。")
             return config
         
+        elif choice == '7':
+            edit_portfolios(config)
+        
         elif choice == '0':
             print("変更を破棄して終了します。")
             return load_config()  # 元の設定を読み込み直して返す
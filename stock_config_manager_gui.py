@@ -1,10 +1,16 @@
-import json
 import os
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import yfinance as yf
 from time import sleep
 import threading
+import numpy as np
+from ticker_list_model import TickerListModel
+from artifact_catalog import load_catalog
+from price_store import read_prices, get_data_version
+from downsample import lttb
+from screener import load_screener
+from file_lock import read_json, write_json
 
 # 設定ファイルのパス
 CONFIG_DIR = "C:\\Users\\rilak\\Desktop\\株価"
@@ -23,6 +29,15 @@ DEFAULT_CONFIG = {
     "output_dir": "C:\\Users\\rilak\\Desktop\\株価\\株価データ"
 }
 
+# 検索ボックスの入力が止まってから絞り込みを実行するまでの時間（ミリ秒）
+SEARCH_DEBOUNCE_MS = 250
+
+# 株価プレビューの高さ（ピクセル）
+PREVIEW_HEIGHT = 180
+
+# スクリーナーの結果に表示する列
+SCREENER_COLUMNS = ["Name", "Close", "Return_1M", "Return_YTD", "From_52W_High", "Volume_Ratio"]
+
 def get_stock_name(ticker_symbol):
     """ティッカーシンボルから銘柄名を自動取得する"""
     try:
@@ -48,10 +63,9 @@ def load_config():
     """設定ファイルを読み込む、存在しない場合はデフォルト設定を作成して返す"""
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
-                return config
+            config = read_json(CONFIG_FILE)
+            print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
+            return config
         except Exception as e:
             print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
             print("デフォルト設定を使用します。")
@@ -62,10 +76,9 @@ def load_config():
     return DEFAULT_CONFIG
 
 def save_config(config):
-    """設定ファイルを保存する"""
+    """設定ファイルを保存する（パイプラインが読み込み中でも壊れないよう、ロックして一時ファイルと置き換える）"""
     try:
-        with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
-            json.dump(config, f, ensure_ascii=False, indent=4)
+        write_json(CONFIG_FILE, config, indent=4)
         print(f"設定ファイル '{CONFIG_FILE}' を保存しました。")
         return True
     except Exception as e:
@@ -83,6 +96,17 @@ class StockConfigApp:
         # 設定の読み込み
         self.config = load_config()
         
+        # 銘柄リストの表示用モデル（表示中の先頭位置と選択中の銘柄を保持）
+        self.model = TickerListModel(self.config['tickers'])
+        self.list_offset = 0
+        self.page_size = 20
+        self.selected_symbols = set()
+        self.search_job = None
+        
+        # 株価プレビューの表示中の銘柄と、読み込み済みのデータ（シンボル → (データバージョン, X, Y)）
+        self.preview_symbol = None
+        self.preview_cache = {}
+        
         # メインフレーム
         main_frame = ttk.Frame(root, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
@@ -92,15 +116,20 @@ class StockConfigApp:
         
         # タブの作成
         self.stocks_tab = ttk.Frame(self.tab_control)
+        self.screener_tab = ttk.Frame(self.tab_control)
         self.settings_tab = ttk.Frame(self.tab_control)
         
         self.tab_control.add(self.stocks_tab, text="銘柄管理")
+        self.tab_control.add(self.screener_tab, text="スクリーナー")
         self.tab_control.add(self.settings_tab, text="一般設定")
         self.tab_control.pack(expand=True, fill=tk.BOTH)
         
         # 銘柄管理タブの設定
         self.setup_stocks_tab()
         
+        # スクリーナータブの設定
+        self.setup_screener_tab()
+        
         # 一般設定タブの設定
         self.setup_settings_tab()
         
@@ -118,13 +147,30 @@ class StockConfigApp:
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
     
     def setup_stocks_tab(self):
+        # 下部：株価プレビュー（選択した銘柄の日足終値）
+        preview_frame = ttk.LabelFrame(self.stocks_tab, text="株価プレビュー（日足終値）", padding="5")
+        preview_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=5, pady=5)
+        self.preview_canvas = tk.Canvas(preview_frame, height=PREVIEW_HEIGHT, background="white", highlightthickness=0)
+        self.preview_canvas.pack(fill=tk.X, expand=True)
+        self.preview_canvas.bind("<Configure>", lambda event: self.draw_preview())
+        
         # 左側：銘柄リスト
         list_frame = ttk.LabelFrame(self.stocks_tab, text="銘柄リスト", padding="10")
         list_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
         
-        # リストビューの作成
+        # 検索ボックス（入力が止まってから絞り込む）
+        search_frame = ttk.Frame(list_frame)
+        search_frame.pack(side=tk.TOP, fill=tk.X, pady=(0, 5))
+        ttk.Label(search_frame, text="検索:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        ttk.Entry(search_frame, textvariable=self.search_var).pack(side=tk.LEFT, fill=tk.X, expand=True, padx=5)
+        self.count_var = tk.StringVar()
+        ttk.Label(search_frame, textvariable=self.count_var).pack(side=tk.RIGHT)
+        
+        # リストビューの作成（見えている行だけを描画する）
         columns = ("シンボル", "銘柄名")
-        self.stock_list = ttk.Treeview(list_frame, columns=columns, show="headings")
+        self.stock_list = ttk.Treeview(list_frame, columns=columns, show="headings", selectmode="extended")
         
         # ヘッダーの設定
         for col in columns:
@@ -137,10 +183,15 @@ class StockConfigApp:
         # リストビューをグリッドに配置
         self.stock_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
-        # スクロールバーの追加
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.stock_list.yview)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
-        self.stock_list.configure(yscrollcommand=scrollbar.set)
+        # スクロールバーの追加（表示位置はモデルの先頭位置で管理する）
+        self.scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_scroll)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.stock_list.bind("<Configure>", self.on_list_resize)
+        self.stock_list.bind("<MouseWheel>", self.on_mouse_wheel)
+        self.stock_list.bind("<Button-4>", lambda event: self.scroll_rows(-3))
+        self.stock_list.bind("<Button-5>", lambda event: self.scroll_rows(3))
+        self.stock_list.bind("<<TreeviewSelect>>", self.on_select)
         
         # データの表示
         self.update_stock_list()
@@ -184,6 +235,73 @@ class StockConfigApp:
         help_label = ttk.Label(operation_frame, text=help_text, wraplength=200, justify=tk.LEFT)
         help_label.pack(side=tk.BOTTOM, fill=tk.X, pady=10)
     
+    def setup_screener_tab(self):
+        condition_frame = ttk.LabelFrame(self.screener_tab, text="条件", padding="10")
+        condition_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        ttk.Label(condition_frame, text="条件式:").grid(row=0, column=0, sticky=tk.W, pady=5)
+        self.screen_expr_var = tk.StringVar(value="Volume_Ratio > 2 and New_High_20D")
+        expr_entry = ttk.Entry(condition_frame, textvariable=self.screen_expr_var, width=60)
+        expr_entry.grid(row=0, column=1, columnspan=4, sticky=(tk.W, tk.E), pady=5)
+        expr_entry.bind("<Return>", lambda event: self.run_screen())
+        
+        ttk.Label(condition_frame, text="並べ替え:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.screen_sort_var = tk.StringVar(value="Return_1M")
+        self.screen_sort_combo = ttk.Combobox(condition_frame, textvariable=self.screen_sort_var, width=18)
+        self.screen_sort_combo.grid(row=1, column=1, sticky=tk.W, pady=5)
+        
+        self.screen_asc_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(condition_frame, text="小さい順", variable=self.screen_asc_var).grid(row=1, column=2, padx=5)
+        
+        ttk.Label(condition_frame, text="件数:").grid(row=1, column=3, sticky=tk.E, pady=5)
+        self.screen_count_var = tk.StringVar(value="50")
+        ttk.Spinbox(condition_frame, from_=1, to=10000, textvariable=self.screen_count_var, width=7).grid(
+            row=1, column=4, sticky=tk.W, pady=5)
+        
+        ttk.Button(condition_frame, text="検索", command=self.run_screen).grid(row=0, column=5, rowspan=2, padx=10)
+        condition_frame.columnconfigure(1, weight=1)
+        
+        self.screen_result_var = tk.StringVar(value="例: Return_1M > 0.1 and From_52W_High > -0.05")
+        ttk.Label(self.screener_tab, textvariable=self.screen_result_var).pack(fill=tk.X, padx=10)
+        
+        # 検索結果
+        result_frame = ttk.Frame(self.screener_tab)
+        result_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self.screen_tree = ttk.Treeview(result_frame, columns=SCREENER_COLUMNS, show="tree headings")
+        self.screen_tree.heading("#0", text="シンボル")
+        self.screen_tree.column("#0", width=90)
+        for col in SCREENER_COLUMNS:
+            self.screen_tree.heading(col, text=col)
+            self.screen_tree.column(col, width=200 if col == "Name" else 90, anchor=tk.W if col == "Name" else tk.E)
+        screen_scrollbar = ttk.Scrollbar(result_frame, orient=tk.VERTICAL, command=self.screen_tree.yview)
+        self.screen_tree.configure(yscrollcommand=screen_scrollbar.set)
+        self.screen_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        screen_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+    
+    def run_screen(self):
+        """サマリーを条件式で絞り込んで結果を表示する"""
+        screener = load_screener(self.config.get('output_dir', ""))
+        if screener is None:
+            messagebox.showwarning("警告", "サマリーファイルがありません。先に株価データを取得してください。")
+            return
+        self.screen_sort_combo['values'] = [c for c, v in screener.columns.items() if v.dtype == float]
+        
+        try:
+            count = int(self.screen_count_var.get())
+            result = screener.screen(self.screen_expr_var.get(), self.screen_sort_var.get() or None,
+                                     count, self.screen_asc_var.get())
+        except ValueError as e:
+            messagebox.showerror("エラー", f"条件式を実行できません:\n{e}")
+            return
+        
+        self.screen_tree.delete(*self.screen_tree.get_children())
+        for symbol, row in result.iterrows():
+            values = [row[col] if col == "Name" else
+                      (f"{row[col]:.2%}" if col.startswith("Return") or col == "From_52W_High" else f"{row[col]:,.2f}")
+                      for col in SCREENER_COLUMNS]
+            self.screen_tree.insert("", tk.END, text=symbol, values=values)
+        self.screen_result_var.set(f"{len(result)}件表示（全{len(screener)}銘柄）")
+    
     def setup_settings_tab(self):
         settings_frame = ttk.Frame(self.settings_tab, padding="10")
         settings_frame.pack(fill=tk.BOTH, expand=True)
@@ -230,13 +348,159 @@ class StockConfigApp:
             messagebox.showerror("エラー", f"フォルダを開けませんでした: {e}")
     
     def update_stock_list(self):
-        # 既存の項目をクリア
+        """見えている範囲の行だけを、変わった部分に限って描画し直す"""
+        # 表示位置を有効な範囲に収める
+        max_offset = max(0, len(self.model) - self.page_size)
+        self.list_offset = min(max(0, self.list_offset), max_offset)
+        
+        rows = self.model.page(self.list_offset, self.page_size)
+        wanted = {symbol for symbol, _ in rows}
+        
+        # 表示範囲から外れた行を削除
         for item in self.stock_list.get_children():
-            self.stock_list.delete(item)
+            if item not in wanted:
+                self.stock_list.delete(item)
+        
+        # 行の追加・更新・並べ替え（行IDはシンボル）
+        for position, (symbol, name) in enumerate(rows):
+            if self.stock_list.exists(symbol):
+                if tuple(self.stock_list.item(symbol, "values")) != (symbol, name):
+                    self.stock_list.item(symbol, values=(symbol, name))
+                if self.stock_list.index(symbol) != position:
+                    self.stock_list.move(symbol, "", position)
+            else:
+                self.stock_list.insert("", position, iid=symbol, values=(symbol, name))
         
-        # 新しい項目を追加
-        for ticker in self.config['tickers']:
-            self.stock_list.insert("", tk.END, values=(ticker['symbol'], ticker['name']))
+        # 表示範囲外に移動していた選択を復元
+        visible_selected = [symbol for symbol in wanted if symbol in self.selected_symbols]
+        if set(self.stock_list.selection()) != set(visible_selected):
+            self.stock_list.selection_set(visible_selected)
+        
+        # スクロールバーと件数表示の更新
+        total = len(self.model)
+        if total:
+            self.scrollbar.set(self.list_offset / total, min(1.0, (self.list_offset + self.page_size) / total))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+        self.count_var.set(f"{total} / {len(self.config['tickers'])} 件")
+    
+    def on_list_resize(self, event):
+        """リストの高さから一度に描画する行数を決める"""
+        row_height = int(ttk.Style().lookup("Treeview", "rowheight") or 20)
+        page_size = max(1, event.height // row_height - 1)
+        if page_size != self.page_size:
+            self.page_size = page_size
+            self.update_stock_list()
+    
+    def on_scroll(self, *args):
+        """スクロールバーの操作を表示位置に反映する"""
+        if args[0] == "moveto":
+            self.list_offset = int(float(args[1]) * len(self.model))
+        elif args[0] == "scroll":
+            step = self.page_size if args[2] == "pages" else 1
+            self.list_offset += int(args[1]) * step
+        self.update_stock_list()
+    
+    def scroll_rows(self, rows):
+        self.list_offset += rows
+        self.update_stock_list()
+    
+    def on_mouse_wheel(self, event):
+        self.scroll_rows(-3 if event.delta > 0 else 3)
+    
+    def on_select(self, event):
+        """見えている行の選択状態を、表示範囲外の選択と合わせて保持する"""
+        visible = set(self.stock_list.get_children())
+        self.selected_symbols = (self.selected_symbols - visible) | set(self.stock_list.selection())
+        
+        # 1銘柄だけ選択されている場合は株価プレビューを表示
+        selection = self.stock_list.selection()
+        if len(selection) == 1 and selection[0] != self.preview_symbol:
+            self.show_preview(selection[0])
+    
+    def show_preview(self, symbol):
+        """選択した銘柄の株価プレビューを表示する（データの読み込みは別スレッドで行う）"""
+        self.preview_symbol = symbol
+        # 読み込み済みなら先に表示し、データが更新されていれば読み込み後に描き直す
+        self.draw_preview()
+        threading.Thread(target=self.load_preview, args=(symbol,), daemon=True).start()
+    
+    def load_preview(self, symbol):
+        """保存済みの日足データを読み込む（UIスレッド以外で実行）"""
+        try:
+            output_dir = self.config.get('output_dir', "")
+            # カタログは読み込むだけにする（作り直しと保存はパイプライン側で行う）
+            catalog = load_catalog(output_dir)
+            version = get_data_version(catalog, symbol, "日足")
+            
+            cached = self.preview_cache.get(symbol)
+            if cached is not None and cached[0] == version:
+                return
+            
+            df = read_prices(output_dir, symbol, "日足", catalog)
+            if df is None or df.empty or 'Close' not in df.columns:
+                self.preview_cache[symbol] = (version, None, None)
+            else:
+                # 日付は1970年からの日数にして描画に使う
+                dates = df.index.tz_localize(None) if df.index.tz is not None else df.index
+                x = dates.values.astype('datetime64[D]').astype(float)
+                self.preview_cache[symbol] = (version, x, df['Close'].to_numpy(dtype=float))
+        except Exception as e:
+            print(f"警告: {symbol} の株価データを読み込めませんでした: {e}")
+            self.preview_cache[symbol] = (None, None, None)
+        
+        # UIスレッドで描画（その間に別の銘柄が選択された場合は描画しない）
+        self.root.after(0, lambda: self.draw_preview() if self.preview_symbol == symbol else None)
+    
+    def draw_preview(self):
+        """株価プレビューを描画する（点の数は横幅のピクセル数まで間引く）"""
+        canvas = self.preview_canvas
+        canvas.delete("all")
+        if self.preview_symbol is None:
+            return
+        
+        width, height = canvas.winfo_width(), canvas.winfo_height()
+        cached = self.preview_cache.get(self.preview_symbol)
+        if cached is None:
+            canvas.create_text(width // 2, height // 2, text=f"{self.preview_symbol} を読み込み中...")
+            return
+        _, x, y = cached
+        if x is None or len(x) < 2:
+            canvas.create_text(width // 2, height // 2, text=f"{self.preview_symbol} の保存済み日足データがありません")
+            return
+        
+        left, right, top, bottom = 70, 10, 20, 20
+        plot_width = max(3, width - left - right)
+        plot_height = max(1, height - top - bottom)
+        
+        xs, ys = lttb(x, y, plot_width)
+        x_min, x_max = x[0], x[-1]
+        y_min, y_max = np.nanmin(y), np.nanmax(y)
+        px = left + (xs - x_min) / max(x_max - x_min, 1) * plot_width
+        py = top + (1 - (ys - y_min) / max(y_max - y_min, 1e-9)) * plot_height
+        canvas.create_line(*np.column_stack([px, py]).ravel().tolist(), fill="#1f5fa8")
+        
+        # 目盛りと説明
+        first_date = np.datetime64(int(x_min), 'D')
+        last_date = np.datetime64(int(x_max), 'D')
+        canvas.create_text(left - 5, top, anchor=tk.NE, text=f"{y_max:,.1f}")
+        canvas.create_text(left - 5, top + plot_height, anchor=tk.E, text=f"{y_min:,.1f}")
+        canvas.create_text(left, height - 2, anchor=tk.SW, text=str(first_date))
+        canvas.create_text(width - right, height - 2, anchor=tk.SE, text=str(last_date))
+        canvas.create_text(left, 2, anchor=tk.NW,
+                           text=f"{self.preview_symbol}  {len(x):,}本 → {len(xs):,}点  終値 {y[-1]:,.1f}")
+    
+    def schedule_search(self):
+        """検索ボックスの入力が止まってから絞り込む"""
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.apply_search)
+    
+    def apply_search(self):
+        self.search_job = None
+        self.model.apply_filter(self.search_var.get())
+        self.list_offset = 0
+        self.update_stock_list()
     
     def add_stock(self):
         symbol = self.symbol_entry.get().strip()
@@ -247,11 +511,7 @@ class StockConfigApp:
             return
         
         # 既に存在するかチェック
-        existing = False
-        for ticker in self.config['tickers']:
-            if ticker['symbol'] == symbol:
-                existing = True
-                break
+        existing = symbol in self.model.names
         
         if existing:
             response = messagebox.askyesno("確認", 
@@ -293,12 +553,19 @@ class StockConfigApp:
                 if ticker['symbol'] == symbol:
                     ticker['name'] = name
                     break
+            self.model.upsert(symbol, name)
             messagebox.showinfo("成功", f"銘柄情報を更新しました: {symbol} ({name})")
         else:
             # 新しいエントリを追加
             self.config['tickers'].append({"symbol": symbol, "name": name})
+            self.model.upsert(symbol, name)
             messagebox.showinfo("成功", f"銘柄を追加しました: {symbol} ({name})")
         
+        # 追加・更新した行が見えるように表示位置を移動
+        position = self.model.index_of(symbol)
+        if position >= 0 and not (self.list_offset <= position < self.list_offset + self.page_size):
+            self.list_offset = position - self.page_size // 2
+        
         # リストの更新
         self.update_stock_list()
         
@@ -355,26 +622,26 @@ class StockConfigApp:
                 self.complete_add_stock(symbol, manual_name, False)
     
     def delete_stock(self):
-        selected_items = self.stock_list.selection()
+        selected_items = list(self.selected_symbols)
         
         if not selected_items:
             messagebox.showinfo("情報", "削除する銘柄を選択してください。")
             return
         
-        confirmation = messagebox.askyesno("確認", "選択した銘柄を削除しますか？")
+        confirmation = messagebox.askyesno("確認", f"選択した{len(selected_items)}件の銘柄を削除しますか？")
         if confirmation:
-            # 削除する項目の取得
-            for item in selected_items:
-                symbol = self.stock_list.item(item, "values")[0]
-                # 設定から削除
-                self.config['tickers'] = [t for t in self.config['tickers'] if t['symbol'] != symbol]
+            # 設定から削除（行IDはシンボル）
+            removed = set(selected_items)
+            self.config['tickers'] = [t for t in self.config['tickers'] if t['symbol'] not in removed]
+            self.model.remove(removed)
+            self.selected_symbols.clear()
             
             # リストの更新
             self.update_stock_list()
             messagebox.showinfo("成功", "選択した銘柄を削除しました。")
     
     def refresh_stock_names(self):
-        selected_items = self.stock_list.selection()
+        selected_items = list(self.selected_symbols)
         
         if not selected_items:
             messagebox.showinfo("情報", "銘柄名を再取得する銘柄を選択してください。")
@@ -387,9 +654,7 @@ class StockConfigApp:
             
             def refresh_names():
                 # 選択した項目の銘柄名を再取得
-                for item in selected_items:
-                    symbol = self.stock_list.item(item, "values")[0]
-                    
+                for symbol in selected_items:
                     try:
                         # 銘柄名の再取得
                         name = get_stock_name(symbol)
@@ -409,6 +674,10 @@ class StockConfigApp:
             threading.Thread(target=refresh_names).start()
     
     def complete_refresh(self):
+        # 名前を再取得した銘柄だけをモデルに反映
+        for ticker in self.config['tickers']:
+            if ticker['symbol'] in self.selected_symbols:
+                self.model.upsert(ticker['symbol'], ticker['name'])
         self.update_stock_list()
         messagebox.showinfo("成功", "銘柄名の再取得が完了しました。")
         self.status_var.set(f"設定ファイル保存先: {CONFIG_FILE}")
@@ -0,0 +1,285 @@
+import sys
+import json
+import time
+import heapq
+import queue
+import threading
+import traceback
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import stock_data_all_new
+import create_quarterly_data
+import create_yearly_data_fixed
+import add_quarterly_to_excel
+import add_yearly_data_to_excel
+from artifact_catalog import load_catalog, save_catalog
+from frame_backend import set_backend
+from intraday_store import collect_intraday
+import summary_table
+import data_validator
+import versioned_store
+from market_calendar import get_exchange, next_session_close, select_tickers_to_refresh, load_extra_holidays
+
+# 操作用HTTPサーバーの既定ポート（localhostのみで待ち受ける）
+DEFAULT_PORT = 8765
+
+# 実行できるジョブと、完了後に続けて実行するジョブ
+JOB_CHAIN = {
+    "fetch": "resample",
+    "resample": "export",
+    "export": None
+}
+
+class RefreshDaemon:
+    """
+    プロセスを常駐させて株価データの取得・変換・Excel出力を実行するデーモン
+
+    市場ごとの取引終了時刻にジョブを予約し、ジョブは1つずつ順番に実行する。
+    インタプリタやyfinanceのキャッシュを使い回すため、繰り返し実行しても起動コストがかからない。
+    """
+
+    def __init__(self, config_loader=stock_data_all_new.load_config):
+        self.config_loader = config_loader
+        self.config = config_loader()
+        self.output_dir = self.config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+        self.catalog = load_catalog(self.output_dir)
+
+        # 予約済みジョブ（実行時刻, 連番, ジョブ名, 引数）のヒープ
+        self.schedule = []
+        self.schedule_lock = threading.Lock()
+        self.sequence = 0
+
+        # 実行待ちのジョブ
+        self.jobs = queue.Queue()
+        self.running = None
+        self.last_runs = {}
+        self.stop_event = threading.Event()
+
+    def schedule_job(self, run_at, job, args=None):
+        """ジョブを指定した時刻に予約する"""
+        with self.schedule_lock:
+            self.sequence += 1
+            heapq.heappush(self.schedule, (run_at.timestamp(), self.sequence, job, args or {}))
+        print(f"ジョブを予約しました: {job} ({run_at.astimezone().strftime('%Y-%m-%d %H:%M')})")
+
+    def enqueue(self, job, args=None):
+        """ジョブを実行待ちに追加する"""
+        if job not in JOB_CHAIN:
+            raise ValueError(f"不明なジョブです: {job}")
+        self.jobs.put((job, args or {}))
+
+    def schedule_market_closes(self):
+        """設定された銘柄の取引所ごとに、次の取引終了時刻に取得ジョブを予約する"""
+        configured = {item["symbol"]: item.get("exchange") for item in self.config.get("tickers", [])}
+        extra_holidays = load_extra_holidays(self.config)
+
+        exchanges = {}
+        for symbol, exchange in configured.items():
+            exchanges.setdefault(get_exchange(symbol, exchange), []).append(symbol)
+
+        for exchange, symbols in exchanges.items():
+            closed_at = next_session_close(exchange, extra_holidays=extra_holidays.get(exchange, ()))
+            if closed_at is not None:
+                self.schedule_job(closed_at, "fetch", {"exchange": exchange, "symbols": symbols})
+
+    def scheduler_loop(self):
+        """予約時刻になったジョブを実行待ちに移す"""
+        while not self.stop_event.is_set():
+            now = time.time()
+            due = []
+            with self.schedule_lock:
+                while self.schedule and self.schedule[0][0] <= now:
+                    due.append(heapq.heappop(self.schedule))
+            for _, _, job, args in due:
+                self.enqueue(job, args)
+                # 取引所ごとの取得ジョブは次の取引終了時刻に再予約する
+                if job == "fetch" and "exchange" in args:
+                    closed_at = next_session_close(args["exchange"],
+                                                   extra_holidays=load_extra_holidays(self.config).get(args["exchange"], ()))
+                    if closed_at is not None:
+                        self.schedule_job(closed_at, job, args)
+            self.stop_event.wait(1)
+
+    def worker_loop(self):
+        """実行待ちのジョブを1つずつ実行する"""
+        while not self.stop_event.is_set():
+            try:
+                job, args = self.jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            self.running = job
+            started = time.perf_counter()
+            started_at = datetime.now().isoformat(timespec='seconds')
+            try:
+                detail = getattr(self, f"run_{job}")(**args)
+                status = "成功"
+            except Exception as e:
+                print(f"ジョブ {job} の実行中にエラーが発生しました: {e}")
+                traceback.print_exc()
+                detail = str(e)
+                status = "エラー"
+            finally:
+                self.running = None
+
+            self.last_runs[job] = {
+                "started_at": started_at,
+                "duration_sec": round(time.perf_counter() - started, 3),
+                "status": status,
+                "detail": detail
+            }
+
+            # 成功したら後続のジョブを実行待ちに追加（取得ジョブで新しいデータがなければ後続は実行しない）
+            nothing_fetched = job == "fetch" and isinstance(detail, dict) and not detail.get("fetched")
+            if status == "成功" and JOB_CHAIN[job] and not nothing_fetched:
+                self.enqueue(JOB_CHAIN[job])
+
+    def run_fetch(self, symbols=None, exchange=None, force=False):
+        """株価データの取得ジョブ（新しい取引セッションが確定した銘柄のみ）"""
+        # 設定ファイルは実行のたびに読み直す（GUIでの変更を反映するため）
+        self.config = self.config_loader()
+        use_japanese_columns = self.config.get("use_japanese_columns", False)
+        tickers = {item["symbol"]: item["name"] for item in self.config.get("tickers", [])}
+        if symbols:
+            tickers = {s: n for s, n in tickers.items() if s in symbols}
+        if not force:
+            tickers, _ = select_tickers_to_refresh(tickers, self.catalog, self.config)
+
+        fetched = 0
+        for ticker, name in tickers.items():
+            print(f"\n{ticker}（{name}）の株価データを取得中...")
+            if stock_data_all_new.fetch_ticker_data(ticker, name, self.catalog, self.output_dir, use_japanese_columns,
+                                                    self.config.get("export_formats"), self.config):
+                fetched += 1
+            for interval in self.config.get("intraday_intervals", []):
+                try:
+                    collect_intraday(ticker, interval, self.output_dir, self.catalog)
+                except Exception as e:
+                    print(f"{interval}データの取得中にエラーが発生しました: {e}")
+            save_catalog(self.catalog, self.output_dir)
+            # 連続リクエストによるAPIの制限を避けるため少し待つ
+            time.sleep(1)
+        if fetched:
+            all_tickers = {item["symbol"]: item["name"] for item in self.config.get("tickers", [])}
+            if self.config.get("validate", True):
+                try:
+                    data_validator.validate_universe(self.output_dir, self.catalog, all_tickers, self.config,
+                                                     quarantine=self.config.get("quarantine_bad_bars", False))
+                except Exception as e:
+                    print(f"データの検証中にエラーが発生しました: {e}")
+            try:
+                summary_table.update_summary(self.output_dir, self.catalog, all_tickers)
+            except Exception as e:
+                print(f"サマリーの更新中にエラーが発生しました: {e}")
+        return {"requested": len(tickers), "fetched": fetched}
+
+    def run_resample(self):
+        """四半期足・年足データの作成ジョブ（取得ジョブと同じ出力ディレクトリ・カタログを使う）"""
+        set_backend(self.config.get("backend"))
+        use_japanese_columns = self.config.get("use_japanese_columns", False)
+        quarterly = create_quarterly_data.create_quarterly_stage(self.output_dir, self.catalog,
+                                                                 use_japanese_columns=use_japanese_columns)
+        yearly = create_yearly_data_fixed.create_yearly_data(self.output_dir, self.catalog,
+                                                             use_japanese_columns=use_japanese_columns)
+        return {"quarterly": quarterly, "yearly": yearly}
+
+    def run_export(self):
+        """四半期足・年足データのExcel追加ジョブ"""
+        use_japanese_columns = self.config.get("use_japanese_columns", False)
+        quarterly = add_quarterly_to_excel.add_all_quarterly(self.output_dir, self.catalog, use_japanese_columns)
+        yearly = add_yearly_data_to_excel.add_all_yearly(self.output_dir, self.catalog, use_japanese_columns)
+        # 取得から書き出しまでの一連のジョブが終わった時点のファイルを履歴に記録する
+        versioned_store.snapshot_after_fetch(self.output_dir, self.catalog, self.config)
+        return {"quarterly": quarterly, "yearly": yearly}
+
+    def status(self):
+        """キューの状態と直近の実行結果を返す"""
+        with self.schedule_lock:
+            scheduled = [
+                {"run_at": datetime.fromtimestamp(run_at).isoformat(timespec='seconds'), "job": job, "args": args}
+                for run_at, _, job, args in sorted(self.schedule)
+            ]
+        return {
+            "queue_depth": self.jobs.qsize(),
+            "running": self.running,
+            "scheduled": scheduled,
+            "last_runs": self.last_runs
+        }
+
+    def start(self, port=DEFAULT_PORT):
+        """スケジューラ・ワーカー・操作用HTTPサーバーを起動する"""
+        self.schedule_market_closes()
+        threading.Thread(target=self.scheduler_loop, daemon=True).start()
+        threading.Thread(target=self.worker_loop, daemon=True).start()
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(self))
+        print(f"操作用サーバーを起動しました: http://127.0.0.1:{port}/status")
+        try:
+            server.serve_forever()
+        finally:
+            self.stop_event.set()
+            server.server_close()
+
+def make_handler(daemon):
+    """デーモンを操作するHTTPリクエストハンドラを作成する"""
+
+    class ControlHandler(BaseHTTPRequestHandler):
+        def send_json(self, code, body):
+            data = json.dumps(body, ensure_ascii=False, indent=2).encode('utf-8')
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if urlparse(self.path).path == "/status":
+                self.send_json(200, daemon.status())
+            else:
+                self.send_json(404, {"error": "見つかりません"})
+
+        def do_POST(self):
+            # POST /run/<ジョブ名>?symbols=7974.T,AAPL&force=1
+            url = urlparse(self.path)
+            parts = url.path.strip("/").split("/")
+            if len(parts) != 2 or parts[0] != "run":
+                self.send_json(404, {"error": "見つかりません"})
+                return
+
+            query = parse_qs(url.query)
+            args = {}
+            if parts[1] == "fetch":
+                if "symbols" in query:
+                    args["symbols"] = [s for s in query["symbols"][0].split(",") if s]
+                args["force"] = query.get("force", ["0"])[0] == "1"
+            try:
+                daemon.enqueue(parts[1], args)
+            except ValueError as e:
+                self.send_json(400, {"error": str(e)})
+                return
+            self.send_json(202, {"queued": parts[1], "queue_depth": daemon.jobs.qsize()})
+
+        def log_message(self, format, *args):
+            print(f"[操作] {self.address_string()} {format % args}")
+
+    return ControlHandler
+
+def main():
+    """
+    メイン関数：デーモンとして常駐する
+    "-now"フラグがある場合は起動直後に取得ジョブを実行する
+    """
+    daemon = RefreshDaemon()
+    port = int(daemon.config.get("daemon_port", DEFAULT_PORT))
+    if "-now" in sys.argv:
+        daemon.enqueue("fetch")
+    print("===== 株価データ更新デーモン =====")
+    daemon.start(port)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n\nユーザーによって処理が中断されました。")
@@ -1,10 +1,17 @@
 import yfinance as yf
-import pandas as pd
 from datetime import datetime
 import os
 import time
-import json
 import sys
+from artifact_catalog import load_catalog, save_catalog, register_symbol
+from market_calendar import select_tickers_to_refresh
+from intraday_store import collect_intraday
+from exporter import export_ticker, DEFAULT_FORMATS
+from file_lock import read_json
+from frame_backend import set_backend
+import summary_table
+import data_validator
+import versioned_store
 
 # 現在の日付を取得（ファイル名用）
 today = datetime.now().strftime("%Y%m%d")
@@ -12,6 +19,14 @@ today = datetime.now().strftime("%Y%m%d")
 # 設定ファイルのパス
 CONFIG_FILE = "stock_config.json"
 
+# 期間タイプの定義
+FREQUENCY_TYPES = {
+    "日足": "1d",
+    "週足": "1wk",
+    "月足": "1mo",
+    "年足": "1y"
+}
+
 def load_config():
     """設定ファイルを読み込む、存在しない場合はデフォルト設定を返す"""
     default_config = {
@@ -26,10 +41,9 @@ def load_config():
     
     if os.path.exists(CONFIG_FILE):
         try:
-            with open(CONFIG_FILE, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-                print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
-                return config
+            config = read_json(CONFIG_FILE)
+            print(f"設定ファイル '{CONFIG_FILE}' を読み込みました。")
+            return config
         except Exception as e:
             print(f"設定ファイルの読み込み中にエラーが発生しました: {e}")
             print("デフォルト設定を使用します。")
@@ -39,6 +53,73 @@ def load_config():
     
     return default_config
 
+def fetch_ticker_data(ticker, name, catalog, output_dir, use_japanese_columns, export_formats=None,
+                      export_options=None, exchange=None):
+    """
+    1銘柄の株価データを取得してCSV・Excelファイルなどに保存し、カタログに登録する
+    
+    Parameters:
+    ticker (str): ティッカーシンボル
+    name (str): 銘柄名
+    catalog (dict): 成果物カタログ
+    output_dir (str): 出力ディレクトリ
+    use_japanese_columns (bool): カラム名を日本語にするかどうか
+    export_formats (list): 書き出す形式（省略時は exporter.DEFAULT_FORMATS）
+    export_options (dict): 書き出しの設定（CSVの圧縮形式・小数の有効桁数）
+    exchange (str): 設定ファイルで指定された取引所（カタログに記録する）
+    
+    Returns:
+    bool: 処理が成功したかどうか
+    """
+    try:
+        # yfinanceで銘柄オブジェクトを取得
+        stock = yf.Ticker(ticker)
+        
+        # 各期間タイプのデータを取得（取得を始めた日時を再取得の判定に使う）
+        fetched = datetime.now().isoformat(timespec='seconds')
+        period_data = {}
+        for period_name, period_code in FREQUENCY_TYPES.items():
+            print(f"{period_name}データを取得中...")
+            data = stock.history(period="max", interval=period_code)
+            
+            # データが空でないか確認
+            if data.empty:
+                print(f"{period_name}のデータがありません: {ticker}")
+                continue
+            
+            # データの行数と期間を表示
+            start_date = data.index[0].strftime('%Y-%m-%d')
+            end_date = data.index[-1].strftime('%Y-%m-%d')
+            print(f"{period_name}の取得期間: {start_date}から{end_date}まで")
+            print(f"{period_name}のデータ点数: {len(data)}日分")
+            
+            # 期間データを保存
+            period_data[period_name] = data
+        
+        register_symbol(catalog, ticker, name, exchange)
+        
+        for period_name, data in period_data.items():
+            # データの最初と最後の5行を表示
+            print(f"{period_name}の最初の5日分のデータ:")
+            print(data.head())
+            
+            print(f"{period_name}の最新の5日分のデータ:")
+            print(data.tail())
+            print("\n" + "-"*50 + "\n")  # 区切り線
+        
+        # CSV・Excelなどの各形式に並列に書き出してカタログに登録
+        print(f"ファイルを書き出し中（カラム名: {'日本語' if use_japanese_columns else '英語'}）...")
+        results = export_ticker(ticker, name, period_data, catalog, output_dir, use_japanese_columns, export_formats,
+                                export_options, fetched)
+        if any(result["error"] for result in results):
+            return False
+        
+    except Exception as e:
+        print(f"エラーが発生しました: {e}")
+        return False
+    
+    return True
+
 def main():
     # 設定ファイルを読み込む
     config = load_config()
@@ -47,14 +128,24 @@ def main():
     ticker_config = config.get("tickers", [])
     use_japanese_columns = config.get("use_japanese_columns", False)
     output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    intraday_intervals = config.get("intraday_intervals", [])
+    export_formats = config.get("export_formats")
+    backend = set_backend(config.get("backend"))
     
     # ティッカー情報をディクショナリに変換
     tickers = {item["symbol"]: item["name"] for item in ticker_config}
+    configured_exchanges = {item["symbol"]: item.get("exchange") for item in ticker_config}
     
     # 設定情報を表示
     print("\n===== 株価データ取得ツール =====")
     print(f"出力ディレクトリ: {output_dir}")
     print(f"カラム名: {'日本語' if use_japanese_columns else '英語'}")
+    print(f"書き出し形式: {', '.join(export_formats or DEFAULT_FORMATS)}")
+    if config.get("csv_compression"):
+        print(f"CSVの圧縮: {config['csv_compression']}")
+    if intraday_intervals:
+        print(f"分足: {', '.join(intraday_intervals)}")
+    print(f"計算処理: {backend}")
     print("\n取得対象の銘柄:")
     for symbol, name in tickers.items():
         print(f"- {symbol} ({name})")
@@ -133,120 +224,62 @@ def main():
     else:
         print("カラム名は英語表記を使用します。")
     
-    # 期間タイプの定義
-    frequency_types = {
-        "日足": "1d",
-        "週足": "1wk",
-        "月足": "1mo",
-        "年足": "1y"
-    }
+    # 成果物カタログを読み込む（後続の処理はカタログからファイルを探す）
+    catalog = load_catalog(output_dir)
+    
+    # サマリーは取得しなかった銘柄も含めて全銘柄分を作る
+    all_tickers = dict(tickers)
+    
+    # 前回の取得以降に取引セッションが確定した銘柄だけを取得する
+    # "-force"フラグがある場合は全銘柄を取得
+    if "-force" not in sys.argv:
+        tickers, skipped = select_tickers_to_refresh(tickers, catalog, config)
+        for symbol in skipped:
+            print(f"{symbol}: 前回の取得以降に確定した取引セッションがないためスキップします。")
+        if not tickers:
+            print("\n更新が必要な銘柄はありません。")
     
     # 各銘柄について株価データを取得
     for ticker, name in tickers.items():
         print(f"\n{ticker}（{name}）の株価データを取得中...")
         
-        try:
-            # yfinanceで銘柄オブジェクトを取得
-            stock = yf.Ticker(ticker)
-            
-            # 各期間タイプのデータを取得
-            period_data = {}
-            for period_name, period_code in frequency_types.items():
-                print(f"{period_name}データを取得中...")
-                data = stock.history(period="max", interval=period_code)
-                
-                # データが空でないか確認
-                if data.empty:
-                    print(f"{period_name}のデータがありません: {ticker}")
-                    continue
-                
-                # データの行数と期間を表示
-                start_date = data.index[0].strftime('%Y-%m-%d')
-                end_date = data.index[-1].strftime('%Y-%m-%d')
-                print(f"{period_name}の取得期間: {start_date}から{end_date}まで")
-                print(f"{period_name}のデータ点数: {len(data)}日分")
-                
-                # 期間データを保存
-                period_data[period_name] = data
-            
-            # 安全なファイル名を生成（ティッカー記号からピリオドを除去）
-            safe_ticker = ticker.replace('.', '_')
-            
-            # カラム名を日本語に変更
-            japanese_columns = {
-                'Open': '始値',
-                'High': '高値',
-                'Low': '安値',
-                'Close': '終値',
-                'Volume': '出来高',
-                'Dividends': '配当',
-                'Stock Splits': '株式分割'
-            }
-            
-            # CSVファイルとして各期間データを保存
-            for period_name, data in period_data.items():
-                # データのコピーを作成
-                processed_data = data.copy()
-                
-                # ユーザー選択に基づいてカラム名を変更
-                if use_japanese_columns:
-                    processed_data.rename(columns=japanese_columns, inplace=True)
-                    print(f"{period_name}のカラム名を日本語に変換しました。")
-                else:
-                    print(f"{period_name}のカラム名は英語のままです。")
-                
-                # 銘柄名からファイル名に使えない文字を削除
-                safe_name = name.replace('/', '').replace('\\', '').replace(':', '').replace('*', '').replace('?', '').replace('"', '').replace('<', '').replace('>', '').replace('|', '')
-                
-                # CSVファイルとして保存（エンコーディングを明示的に指定）
-                csv_path = os.path.join(output_dir, f"{safe_ticker}_{safe_name}_{period_name}.csv")
-                processed_data.to_csv(csv_path, encoding='utf-8-sig')
-                print(f"{period_name}のCSVファイルを保存しました: {csv_path}")
-                
-                # データの最初と最後の5行を表示
-                print(f"{period_name}の最初の5日分のデータ:")
-                print(processed_data.head())
-                
-                print(f"{period_name}の最新の5日分のデータ:")
-                print(processed_data.tail())
-                print("\n" + "-"*50 + "\n")  # 区切り線
-            
-            # 銘柄名からファイル名に使えない文字を削除
-            safe_name = name.replace('/', '').replace('\\', '').replace(':', '').replace('*', '').replace('?', '').replace('"', '').replace('<', '').replace('>', '').replace('|', '')
-            
-            # Excelファイルとして全期間データを1つのファイルに保存
-            excel_path = os.path.join(output_dir, f"{safe_ticker}_{safe_name}.xlsx")
-            with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
-                for period_name, data in period_data.items():
-                    # データのコピーを作成
-                    excel_data = data.copy()
-                    
-                    # ユーザー選択に基づいてカラム名を変更
-                    if use_japanese_columns:
-                        excel_data.rename(columns=japanese_columns, inplace=True)
-                    
-                    # タイムゾーン情報を削除
-                    excel_data.index = excel_data.index.tz_localize(None)
-                    
-                    # インデックスの名前を変更
-                    excel_data.index.name = '日付' if use_japanese_columns else 'Date'
-                    
-                    # シート名（31文字以内に制限）
-                    sheet_name = f"{safe_name[:15]}_{period_name}" if len(safe_name) > 15 else f"{safe_name}_{period_name}"
-                    sheet_name = sheet_name[:31]  # シート名の制限のため31文字まで
-                    
-                    # シートにデータを書き込み
-                    excel_data.to_excel(writer, sheet_name=sheet_name)
-                    
-                print(f"Excelファイルを保存しました（全期間データ）: {excel_path}")
-            
-        except Exception as e:
-            print(f"エラーが発生しました: {e}")
+        fetch_ticker_data(ticker, name, catalog, output_dir, use_japanese_columns, export_formats, config,
+                          configured_exchanges.get(ticker))
+        
+        # 分足データは月ごとのパーティションに追記する（設定の intraday_intervals で指定）
+        for interval in intraday_intervals:
+            try:
+                collect_intraday(ticker, interval, output_dir, catalog)
+            except Exception as e:
+                print(f"{interval}データの取得中にエラーが発生しました: {e}")
+        
+        # 銘柄ごとにカタログを保存（途中で失敗しても登録済みの成果物は残す）
+        save_catalog(catalog, output_dir)
         
         # 連続リクエストによるAPIの制限を避けるため少し待つ
         time.sleep(1)
         
         print("\n" + "="*80 + "\n")  # 区切り線
+    
+    # 追記された足を検証する（設定の quarantine_bad_bars が true の場合は問題のある足を隔離する）
+    if config.get("validate", True):
+        try:
+            data_validator.validate_universe(output_dir, catalog, all_tickers, config,
+                                             quarantine=config.get("quarantine_bad_bars", False))
+        except Exception as e:
+            print(f"データの検証中にエラーが発生しました: {e}")
+    
+    # 追記された日足からダッシュボード用のサマリーを更新する
+    try:
+        summary_table.update_summary(output_dir, catalog, all_tickers)
+    except Exception as e:
+        print(f"サマリーの更新中にエラーが発生しました: {e}")
+    
+    # 今回の実行の時点のファイルを履歴に記録する（設定の history が false の場合は記録しない）
+    try:
+        versioned_store.snapshot_after_fetch(output_dir, catalog, config)
+    except Exception as e:
+        print(f"履歴の記録中にエラーが発生しました: {e}")
     print("処理が完了しました。全てのデータをローカルフォルダに保存しました。")
 
 if __name__ == "__main__":
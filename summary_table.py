@@ -0,0 +1,238 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog, lookup_entry, lookup_artifact, get_symbol_exchange
+from market_calendar import EXCHANGES, get_exchange
+from price_store import read_price_csv, get_data_version
+from file_lock import file_lock, atomic_path, read_json, write_json
+
+# サマリーの状態ファイル（銘柄ごとに直近の足と読み込み済みの行数を保持する）
+SUMMARY_STATE_FILE = "summary_state.json"
+
+# ダッシュボード用のサマリーファイル
+SUMMARY_CSV = "サマリー.csv"
+
+# 状態として保持する直近の期間（1年リターン・年初来リターンの計算に足りる日数）
+WINDOW_DAYS = 400
+
+# 平均出来高・高値更新の判定に使う足の数
+AVERAGE_VOLUME_BARS = 20
+HIGH_LOOKBACK_BARS = 20
+
+# リターンの期間（列名 → 基準日までの期間）
+RETURN_PERIODS = {
+    "Return_1W": pd.DateOffset(weeks=1),
+    "Return_1M": pd.DateOffset(months=1),
+    "Return_3M": pd.DateOffset(months=3),
+    "Return_1Y": pd.DateOffset(years=1)
+}
+
+SUMMARY_COLUMNS = ["Name", "Date", "Close", "Return_1W", "Return_1M", "Return_3M", "Return_YTD", "Return_1Y",
+                   "High_52W", "Low_52W", "From_52W_High", "High_20D", "New_High_20D",
+                   "Volume", "Avg_Volume_20D", "Volume_Ratio"]
+
+def get_state_path(output_dir):
+    return os.path.join(output_dir, SUMMARY_STATE_FILE)
+
+def load_state(output_dir):
+    """サマリーの状態を読み込む（存在しない・壊れている場合は空の状態）"""
+    path = get_state_path(output_dir)
+    if os.path.exists(path):
+        try:
+            return read_json(path)
+        except (OSError, ValueError) as e:
+            print(f"サマリーの状態ファイルを読み込めません（全銘柄を作り直します）: {e}")
+    return {"symbols": {}}
+
+def save_state(state, output_dir):
+    """サマリーの状態を保存する（一時ファイルに書き込んでから置き換える）"""
+    write_json(get_state_path(output_dir), state, indent=None)
+
+def frame_to_bars(df):
+    """日足データフレームを状態に保存する形式（日付と終値・高値・安値・出来高の配列）に変換する"""
+    index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    bars = {"Date": [d.strftime('%Y-%m-%d') for d in index]}
+    for col in ["Close", "High", "Low", "Volume"]:
+        source = df[col] if col in df.columns else df["Close"]
+        bars[col] = [None if pd.isna(v) else float(v) for v in source]
+    return bars
+
+def bars_to_frame(bars):
+    df = pd.DataFrame({col: bars[col] for col in ["Close", "High", "Low", "Volume"]},
+                      index=pd.DatetimeIndex(bars["Date"]), dtype=float)
+    return df
+
+def same_overlap_bar(old_bars, new_bars):
+    """
+    読み直した最初の足（前回読み込んだ最後の足）が保持している足と同じかどうか
+
+    Returns:
+    bool: 日付と終値・高値・安値・出来高が一致する場合はTrue
+    """
+    if not new_bars["Date"]:
+        return True
+    date = new_bars["Date"][0]
+    position = int(np.searchsorted(np.array(old_bars["Date"]), date))
+    if position >= len(old_bars["Date"]) or old_bars["Date"][position] != date:
+        return False
+    old = np.array([old_bars[col][position] for col in ["Close", "High", "Low", "Volume"]], dtype=float)
+    new = np.array([new_bars[col][0] for col in ["Close", "High", "Low", "Volume"]], dtype=float)
+    return bool(np.allclose(old, new, rtol=1e-12, atol=0.0, equal_nan=True))
+
+def update_symbol_state(output_dir, catalog, symbol, symbol_state):
+    """
+    1銘柄の状態を日足CSVの追記分で更新する
+
+    前回読み込んだ行数より後ろ（と、値が確定していなかった可能性のある最後の1行）だけを読み込む。
+    データの開始日が変わった場合や行数が減った場合は全体を読み直す。また、読み直した最後の1行が
+    保持している足と異なる場合も、分割・配当の調整で過去の価格全体が書き換わった可能性があるため
+    全体を読み直す（調整前と調整後の価格が混ざらないようにする）。
+
+    Returns:
+    dict: 更新後の状態（日足データがない場合はNone）
+    """
+    entry = lookup_entry(catalog, symbol, "日足")
+    path = lookup_artifact(catalog, symbol, "日足", output_dir)
+    if entry is None or path is None:
+        return None
+
+    version = get_data_version(catalog, symbol, "日足")
+    if symbol_state and symbol_state.get("version") == version:
+        return symbol_state
+
+    tz = EXCHANGES[get_exchange(symbol, get_symbol_exchange(catalog, symbol))]["timezone"]
+    rows = entry.get("rows") or 0
+    incremental = (symbol_state and symbol_state.get("start") == entry.get("start")
+                   and 0 < symbol_state.get("rows", 0) <= rows)
+
+    if incremental:
+        skip = symbol_state["rows"] - 1
+        new_bars = frame_to_bars(read_price_csv(path, tz, skip_rows=skip))
+        old_bars = symbol_state["bars"]
+        if not same_overlap_bar(old_bars, new_bars):
+            incremental = False
+
+    if incremental:
+        # 新しく読んだ足の最初の日付以降は古い値を捨てて置き換える
+        first_new = new_bars["Date"][0] if new_bars["Date"] else None
+        keep = len(old_bars["Date"]) if first_new is None else \
+            int(np.searchsorted(np.array(old_bars["Date"]), first_new))
+        bars = {col: old_bars[col][:keep] + new_bars[col] for col in old_bars}
+    else:
+        bars = frame_to_bars(read_price_csv(path, tz))
+
+    # 保持する期間を直近に絞る
+    if bars["Date"]:
+        cutoff = (pd.Timestamp(bars["Date"][-1]) - pd.Timedelta(days=WINDOW_DAYS)).strftime('%Y-%m-%d')
+        first = int(np.searchsorted(np.array(bars["Date"]), cutoff))
+        bars = {col: values[first:] for col, values in bars.items()}
+
+    return {"version": version, "start": entry.get("start"), "rows": rows, "bars": bars}
+
+def compute_summary_row(bars):
+    """直近の足からサマリーの1行分（終値・各期間のリターン・52週高値/安値・20日高値・出来高）を計算する"""
+    df = bars_to_frame(bars).dropna(subset=["Close"])
+    if df.empty:
+        return {}
+
+    dates = df.index.values
+    closes = df["Close"].to_numpy()
+    last_date = df.index[-1]
+    last_close = closes[-1]
+
+    def close_asof(date):
+        position = np.searchsorted(dates, np.datetime64(date), side='right') - 1
+        return closes[position] if position >= 0 else np.nan
+
+    row = {"Date": last_date.strftime('%Y-%m-%d'), "Close": last_close}
+    for column, offset in RETURN_PERIODS.items():
+        row[column] = last_close / close_asof(last_date - offset) - 1
+    row["Return_YTD"] = last_close / close_asof(pd.Timestamp(year=last_date.year - 1, month=12, day=31)) - 1
+
+    year = df[df.index > last_date - pd.DateOffset(weeks=52)]
+    row["High_52W"] = year["High"].max()
+    row["Low_52W"] = year["Low"].min()
+    row["From_52W_High"] = last_close / row["High_52W"] - 1
+
+    # 直近20本の高値を最終日に更新したかどうか
+    recent_highs = df["High"].iloc[-HIGH_LOOKBACK_BARS:]
+    row["High_20D"] = recent_highs.max()
+    row["New_High_20D"] = bool(recent_highs.iloc[-1] >= row["High_20D"])
+
+    # 出来高倍率は最終日の出来高 ÷ 直近20本（最終日を含む）の平均出来高
+    row["Volume"] = df["Volume"].iloc[-1]
+    row["Avg_Volume_20D"] = df["Volume"].iloc[-AVERAGE_VOLUME_BARS:].mean()
+    row["Volume_Ratio"] = row["Volume"] / row["Avg_Volume_20D"] if row["Avg_Volume_20D"] else np.nan
+    return row
+
+def update_summary(output_dir, catalog, tickers, full=False):
+    """
+    全銘柄のサマリーを更新してCSVに保存する（日足データが変わった銘柄だけを読み込む）
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    catalog (dict): 成果物カタログ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    full (bool): Trueの場合は状態を使わずに全体を読み直す
+
+    Returns:
+    pd.DataFrame: サマリー（行=銘柄）
+    """
+    state = {"symbols": {}} if full else load_state(output_dir)
+    symbols_state = {}
+    updated = 0
+    for symbol in tickers:
+        previous = state["symbols"].get(symbol)
+        try:
+            current = update_symbol_state(output_dir, catalog, symbol, previous)
+        except Exception as e:
+            print(f"{symbol}のサマリーの更新中にエラーが発生しました: {e}")
+            current = previous
+        if current is None:
+            continue
+        if current is not previous:
+            updated += 1
+        symbols_state[symbol] = current
+
+    state["symbols"] = symbols_state
+    save_state(state, output_dir)
+
+    rows = []
+    for symbol, symbol_state in symbols_state.items():
+        row = compute_summary_row(symbol_state["bars"])
+        row["Name"] = tickers.get(symbol, symbol)
+        rows.append(pd.Series(row, name=symbol))
+    summary = pd.DataFrame(rows).reindex(columns=SUMMARY_COLUMNS)
+    summary.index.name = "Symbol"
+
+    summary_path = os.path.join(output_dir, SUMMARY_CSV)
+    with file_lock(summary_path), atomic_path(summary_path) as tmp_path:
+        summary.to_csv(tmp_path, encoding='utf-8-sig')
+    print(f"サマリーを更新しました（{updated}/{len(symbols_state)}銘柄を再計算）: {summary_path}")
+    return summary
+
+def main():
+    """
+    メイン関数：設定ファイルの全銘柄のサマリーを更新する
+    "-full" で状態を使わずに作り直し、"-xlsx" でExcelファイルにも出力する
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    summary = update_summary(output_dir, catalog, tickers, full="-full" in sys.argv)
+
+    if "-xlsx" in sys.argv:
+        excel_path = os.path.join(output_dir, os.path.splitext(SUMMARY_CSV)[0] + ".xlsx")
+        with file_lock(excel_path), atomic_path(excel_path) as tmp_path:
+            summary.to_excel(tmp_path, sheet_name="サマリー")
+        print(f"Excelファイルを保存しました: {excel_path}")
+    print(summary)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+class TickerListModel:
+    """
+    GUIの銘柄リストの表示用モデル
+
+    全銘柄を保持し、検索条件に合う銘柄の並び（表示対象）を管理する。
+    画面には表示対象のうち見えている範囲（ページ）だけを描画するため、
+    銘柄数が数千になっても追加・削除のたびに全行を作り直す必要がない。
+    """
+
+    def __init__(self, tickers):
+        # シンボル → 銘柄名（登録順を保持）
+        self.names = {}
+        # シンボル → 検索用の小文字の文字列
+        self.search_keys = {}
+        self.filter_text = ""
+        self.visible = []
+        for ticker in tickers:
+            self.names[ticker['symbol']] = ticker['name']
+            self.search_keys[ticker['symbol']] = self.make_search_key(ticker['symbol'], ticker['name'])
+        self.apply_filter("")
+
+    @staticmethod
+    def make_search_key(symbol, name):
+        return f"{symbol}\t{name}".lower()
+
+    def matches(self, symbol):
+        """銘柄が現在の検索条件に合うかどうか"""
+        return not self.filter_text or self.filter_text in self.search_keys[symbol]
+
+    def apply_filter(self, text):
+        """検索条件を変更して表示対象を作り直す"""
+        self.filter_text = text.strip().lower()
+        self.visible = [symbol for symbol in self.names if self.matches(symbol)]
+
+    def __len__(self):
+        return len(self.visible)
+
+    def upsert(self, symbol, name):
+        """
+        銘柄を追加または更新する
+
+        Returns:
+        bool: 新しく追加した場合はTrue
+        """
+        added = symbol not in self.names
+        self.names[symbol] = name
+        self.search_keys[symbol] = self.make_search_key(symbol, name)
+        if added:
+            if self.matches(symbol):
+                self.visible.append(symbol)
+        elif self.matches(symbol) != (symbol in self.visible):
+            # 名前の変更で検索条件に合う・合わないが変わった場合だけ作り直す
+            self.apply_filter(self.filter_text)
+        return added
+
+    def remove(self, symbols):
+        """銘柄を削除する"""
+        removed = set(symbols)
+        for symbol in removed:
+            self.names.pop(symbol, None)
+            self.search_keys.pop(symbol, None)
+        self.visible = [symbol for symbol in self.visible if symbol not in removed]
+
+    def page(self, offset, count):
+        """表示対象のうち offset から count 件の (シンボル, 銘柄名) を返す"""
+        return [(symbol, self.names[symbol]) for symbol in self.visible[offset:offset + count]]
+
+    def index_of(self, symbol):
+        """表示対象の中での位置を返す（表示対象でない場合は-1）"""
+        try:
+            return self.visible.index(symbol)
+        except ValueError:
+            return -1
@@ -0,0 +1,282 @@
+import os
+import sys
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_or_rebuild_catalog
+from price_store import read_prices, get_data_version
+from file_lock import file_lock, atomic_path, read_json, write_json
+
+# 分析結果の保存先（出力ディレクトリ内のサブフォルダ）
+ANALYTICS_DIR_NAME = "analytics"
+
+# 年率換算に使う1年あたりの取引日数
+TRADING_DAYS = 252
+
+# 一度に計算する銘柄の数（メモリ使用量はおよそ 取引日数 × この値 × 2列ブロック分）
+CHUNK_SIZE = 256
+
+# 休場日の前日終値で埋める最大日数（それ以上の欠損はリターンを計算しない）
+FILL_LIMIT = 5
+
+def get_cache_key(symbols, benchmark):
+    """
+    銘柄と条件から計算結果の保存先のキーを作成する
+
+    データバージョンはキーに含めず meta.json に記録する（データが更新されるたびに
+    別のフォルダを作らず、同じフォルダの結果を置き換えるため）。
+    """
+    parts = sorted(symbols)
+    parts.append(f"benchmark={benchmark}")
+    parts.append(f"fill={FILL_LIMIT}")
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def get_data_key(catalog, symbols):
+    """銘柄ごとのデータバージョンから、計算に使ったデータを表すキーを作成する"""
+    parts = [f"{s}={get_data_version(catalog, s, '日足')}" for s in sorted(symbols)]
+    return hashlib.sha1("|".join(parts).encode('utf-8')).hexdigest()[:16]
+
+def load_cache_meta(meta_path, data_key):
+    """保存済みの結果のメタ情報を読み込む（データが更新された場合や読めない場合はNone）"""
+    if not os.path.exists(meta_path):
+        return None
+    try:
+        meta = read_json(meta_path)
+    except (OSError, ValueError):
+        return None
+    return meta if meta.get("data_key") == data_key else None
+
+def load_daily_closes(output_dir, catalog, symbol):
+    """銘柄の日足終値を日付（タイムゾーンなし）インデックスで読み込む"""
+    df = read_prices(output_dir, symbol, "日足", catalog)
+    if df is None or df.empty or 'Close' not in df.columns:
+        return None
+    index = df.index.tz_localize(None) if df.index.tz is not None else df.index
+    closes = pd.Series(df['Close'].to_numpy(dtype=float), index=index.normalize())
+    return closes[~closes.index.duplicated(keep='last')]
+
+def build_returns_matrix(output_dir, catalog, symbols, path):
+    """
+    全銘柄の日次リターンを共通の取引日カレンダーに揃えた行列を作成する
+
+    行列はディスク上のメモリマップ（float32、行=日付・列=銘柄）に1銘柄ずつ書き込むため、
+    銘柄数が増えてもメモリに載るのは1銘柄分の系列だけになる。
+
+    Returns:
+    tuple: (メモリマップの行列, 日付のDatetimeIndex, 読み込めた銘柄のリスト)
+    """
+    # 1回目の走査で共通カレンダー（全銘柄の取引日の和集合）を作る
+    calendar = pd.DatetimeIndex([])
+    loaded = []
+    for symbol in symbols:
+        closes = load_daily_closes(output_dir, catalog, symbol)
+        if closes is None:
+            print(f"警告: {symbol} の日足データがありません。スキップします。")
+            continue
+        calendar = calendar.union(closes.index)
+        loaded.append(symbol)
+
+    matrix = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(calendar), len(loaded)))
+
+    # 2回目の走査でリターンを書き込む（前日終値で埋めるのは休場日の数日分まで）
+    for column, symbol in enumerate(loaded):
+        closes = load_daily_closes(output_dir, catalog, symbol)
+        aligned = closes.reindex(calendar)
+        filled = aligned.ffill(limit=FILL_LIMIT)
+        returns = filled.pct_change(fill_method=None)
+        # 上場前・データ終了後は欠損のままにする
+        returns[aligned.index < closes.index[0]] = np.nan
+        returns[aligned.index > closes.index[-1]] = np.nan
+        matrix[:, column] = returns.to_numpy(dtype=np.float32)
+    matrix.flush()
+    return matrix, calendar, loaded
+
+def compute_column_stats(returns, benchmark_returns):
+    """
+    銘柄ごとのリターン・ボラティリティ・ベータを計算する（列のブロックごとにベクトル化）
+
+    Parameters:
+    returns (np.ndarray): 日次リターンの行列（行=日付・列=銘柄、欠損はNaN）
+    benchmark_returns (np.ndarray): 指数の日次リターン（欠損はNaN）
+
+    Returns:
+    dict: 各統計量の配列
+    """
+    n_columns = returns.shape[1]
+    stats = {key: np.full(n_columns, np.nan) for key in
+             ["days", "total_return", "annual_return", "volatility", "beta", "correlation_to_benchmark"]}
+
+    b = benchmark_returns.astype(np.float64)
+    b_valid = ~np.isnan(b)
+    b_filled = np.where(b_valid, b, 0.0)
+
+    for start in range(0, n_columns, CHUNK_SIZE):
+        block = np.asarray(returns[:, start:start + CHUNK_SIZE], dtype=np.float64)
+        valid = ~np.isnan(block)
+        x = np.where(valid, block, 0.0)
+        n = valid.sum(axis=0)
+        cols = slice(start, start + block.shape[1])
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = x.sum(axis=0) / n
+            var = ((x - mean) ** 2 * valid).sum(axis=0) / (n - 1)
+            stats["days"][cols] = n
+            stats["total_return"][cols] = np.exp(np.log1p(x).sum(axis=0)) - 1
+            stats["annual_return"][cols] = mean * TRADING_DAYS
+            stats["volatility"][cols] = np.sqrt(var * TRADING_DAYS)
+
+            # 指数とのベータ・相関は両方のリターンがある日だけで計算する
+            both = valid & b_valid[:, None]
+            m = both.sum(axis=0)
+            bx = np.where(both, b_filled[:, None], 0.0)
+            xx = np.where(both, x, 0.0)
+            sum_x, sum_b = xx.sum(axis=0), bx.sum(axis=0)
+            cov = ((xx * bx).sum(axis=0) - sum_x * sum_b / m) / (m - 1)
+            var_b = ((bx ** 2).sum(axis=0) - sum_b ** 2 / m) / (m - 1)
+            var_x = ((xx ** 2).sum(axis=0) - sum_x ** 2 / m) / (m - 1)
+            stats["beta"][cols] = cov / var_b
+            stats["correlation_to_benchmark"][cols] = cov / np.sqrt(var_b * var_x)
+    return stats
+
+def compute_correlation_matrix(returns, path):
+    """
+    銘柄間の相関行列を計算する（両方のリターンがある日だけを使うペアワイズ相関）
+
+    列を CHUNK_SIZE 銘柄ずつのブロックに分け、ブロックの組ごとに行列積で計算する。
+    結果はディスク上のメモリマップ（float32）に書き込む。
+
+    Parameters:
+    returns (np.ndarray): 日次リターンの行列（行=日付・列=銘柄）
+    path (str): 相関行列の保存先（.npy）
+
+    Returns:
+    np.ndarray: 相関行列のメモリマップ
+    """
+    n_columns = returns.shape[1]
+    corr = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(n_columns, n_columns))
+
+    def prepare(start):
+        block = np.asarray(returns[:, start:start + CHUNK_SIZE], dtype=np.float64)
+        valid = (~np.isnan(block)).astype(np.float64)
+        x = np.nan_to_num(block)
+        return valid, x, x * x
+
+    for i in range(0, n_columns, CHUNK_SIZE):
+        valid_a, xa, xa2 = prepare(i)
+        for j in range(i, n_columns, CHUNK_SIZE):
+            valid_b, xb, xb2 = prepare(j) if j != i else (valid_a, xa, xa2)
+            n = valid_a.T @ valid_b
+            sum_a = xa.T @ valid_b
+            sum_b = valid_a.T @ xb
+            with np.errstate(invalid='ignore', divide='ignore'):
+                cov = xa.T @ xb - sum_a * sum_b / n
+                var_a = xa2.T @ valid_b - sum_a ** 2 / n
+                var_b = valid_a.T @ xb2 - sum_b ** 2 / n
+                block = cov / np.sqrt(var_a * var_b)
+            block[n < 2] = np.nan
+            corr[i:i + block.shape[0], j:j + block.shape[1]] = block
+            corr[j:j + block.shape[1], i:i + block.shape[0]] = block.T
+    corr.flush()
+    return corr
+
+def analyze_universe(output_dir, tickers, benchmark):
+    """
+    ユニバース全体の統計量と相関行列を計算する（データバージョンが同じなら前回の結果を使う）
+
+    結果は銘柄と条件ごとのフォルダに保存し、データが更新された場合は同じフォルダの結果を置き換える。
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    tickers (dict): ティッカーシンボルと銘柄名の辞書
+    benchmark (str): ベータの基準にする指数のシンボル（例: ^N225、^GSPC）
+
+    Returns:
+    tuple: (統計量のデータフレーム, 相関行列のデータフレーム)
+    """
+    catalog = load_or_rebuild_catalog(output_dir, tickers)
+    symbols = list(tickers)
+    if benchmark not in symbols:
+        symbols.append(benchmark)
+
+    cache_dir = os.path.join(output_dir, ANALYTICS_DIR_NAME, get_cache_key(symbols, benchmark))
+    meta_path = os.path.join(cache_dir, "meta.json")
+    stats_path = os.path.join(cache_dir, "stats.csv")
+    returns_path = os.path.join(cache_dir, "returns.npy")
+    corr_path = os.path.join(cache_dir, "correlation.npy")
+    data_key = get_data_key(catalog, symbols)
+
+    meta = load_cache_meta(meta_path, data_key)
+    if meta is not None:
+        print(f"データが更新されていないため前回の分析結果を使用します: {cache_dir}")
+        stats = pd.read_csv(stats_path, index_col=0)
+        corr = np.load(corr_path, mmap_mode='r')
+        return stats, pd.DataFrame(corr, index=meta["symbols"], columns=meta["symbols"])
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # 計算中は他の処理が同じ結果を作らないようロックし、前回のメタ情報を先に削除する
+    # （各ファイルは一時ファイルに書いてから置き換え、途中で失敗した結果をキャッシュとして使わない）
+    with file_lock(meta_path, timeout=None):
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        with atomic_path(returns_path) as tmp_returns:
+            returns, calendar, loaded = build_returns_matrix(output_dir, catalog, symbols, tmp_returns)
+            print(f"共通カレンダー: {len(calendar)}日 × {len(loaded)}銘柄")
+
+            if benchmark in loaded:
+                benchmark_returns = np.asarray(returns[:, loaded.index(benchmark)], dtype=np.float64)
+            else:
+                print(f"警告: 指数 {benchmark} のデータがないためベータは計算しません。")
+                benchmark_returns = np.full(len(calendar), np.nan)
+
+            column_stats = compute_column_stats(returns, benchmark_returns)
+            with atomic_path(corr_path) as tmp_corr:
+                corr = compute_correlation_matrix(returns, tmp_corr)
+                # 置き換える前にメモリマップを閉じる（Windowsでは開いたままのファイルを置き換えられない）
+                del corr
+            del returns
+
+        stats = pd.DataFrame(column_stats, index=pd.Index(loaded, name="Symbol"))
+        stats.insert(0, "Name", [tickers.get(s, s) for s in loaded])
+        with atomic_path(stats_path) as tmp_path:
+            stats.to_csv(tmp_path, encoding='utf-8-sig')
+
+        # メタ情報は最後に書き込む（途中で失敗した結果をキャッシュとして使わないため）
+        write_json(meta_path, {"symbols": loaded, "benchmark": benchmark, "data_key": data_key,
+                               "start": str(calendar[0].date()) if len(calendar) else None,
+                               "end": str(calendar[-1].date()) if len(calendar) else None})
+    corr = np.load(corr_path, mmap_mode='r')
+    return stats, pd.DataFrame(corr, index=loaded, columns=loaded)
+
+def main():
+    """
+    メイン関数：設定ファイルの全銘柄を分析してCSVに保存する
+    "-benchmark <シンボル>" でベータの基準にする指数を指定できる（既定は設定の benchmark または ^N225）
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    tickers = {item["symbol"]: item["name"] for item in config.get("tickers", [])}
+
+    benchmark = config.get("benchmark", "^N225")
+    if "-benchmark" in sys.argv and sys.argv.index("-benchmark") + 1 < len(sys.argv):
+        benchmark = sys.argv[sys.argv.index("-benchmark") + 1]
+
+    print("===== ユニバース分析 =====")
+    print(f"対象銘柄数: {len(tickers)}  指数: {benchmark}")
+    stats, corr = analyze_universe(output_dir, tickers, benchmark)
+
+    stats_csv = os.path.join(output_dir, "ユニバース分析_統計.csv")
+    with file_lock(stats_csv), atomic_path(stats_csv) as tmp_path:
+        stats.to_csv(tmp_path, encoding='utf-8-sig')
+    print(f"統計量を保存しました: {stats_csv}")
+
+    corr_csv = os.path.join(output_dir, "ユニバース分析_相関行列.csv")
+    with file_lock(corr_csv), atomic_path(corr_csv) as tmp_path:
+        corr.to_csv(tmp_path, encoding='utf-8-sig', float_format='%.4f')
+    print(f"相関行列を保存しました: {corr_csv}")
+    print(stats.head(20))
+
+if __name__ == "__main__":
+    main()
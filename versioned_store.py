@@ -0,0 +1,471 @@
+import io
+import os
+import sys
+import hashlib
+from datetime import datetime
+
+import pandas as pd
+
+import stock_data_all_new
+from artifact_catalog import load_catalog
+from csv_compression import get_compression_method, compress_bytes, decompress_bytes, strip_csv_suffix
+from market_calendar import EXCHANGES, get_exchange
+from price_store import CSV_FLOAT_PRECISION, parse_dates, normalize_columns, resolve_interval
+from file_lock import file_lock, atomic_path, read_json, write_json
+
+# 履歴を保存するフォルダ名（出力ディレクトリ直下に作成）
+HISTORY_DIR_NAME = "history"
+
+# セグメント（内容のハッシュをファイル名にした断片）を保存するフォルダ名
+SEGMENTS_DIR_NAME = "segments"
+
+# 実行ごとのマニフェスト（どのファイルがどのセグメントでできているか）を保存するフォルダ名
+MANIFESTS_DIR_NAME = "manifests"
+
+# 実行の一覧のファイル名
+RUNS_FILE_NAME = "runs.json"
+
+# マニフェスト形式のバージョン
+MANIFEST_FORMAT_VERSION = 1
+
+# セグメントの圧縮形式（内容が同じなら同じバイト列になる gzip を使う）
+SEGMENT_COMPRESSION = "gzip"
+
+# 実行IDの形式
+RUN_ID_FORMAT = "%Y%m%d-%H%M%S"
+
+def get_history_dir(output_dir):
+    """履歴を保存するフォルダのパスを返す"""
+    return os.path.join(output_dir, HISTORY_DIR_NAME)
+
+def get_segment_path(output_dir, digest):
+    """セグメントのファイルのパスを返す（ハッシュの先頭2文字でフォルダを分ける）"""
+    return os.path.join(get_history_dir(output_dir), SEGMENTS_DIR_NAME, digest[:2], f"{digest}.gz")
+
+def get_manifest_path(output_dir, run_id):
+    """実行のマニフェストのパスを返す"""
+    return os.path.join(get_history_dir(output_dir), MANIFESTS_DIR_NAME, f"{run_id}.json")
+
+def get_runs_path(output_dir):
+    """実行の一覧のファイルのパスを返す"""
+    return os.path.join(get_history_dir(output_dir), RUNS_FILE_NAME)
+
+def split_segments(data):
+    """
+    CSVのバイト列をヘッダー行と年ごとのセグメントに分ける
+
+    行の先頭の4文字（日付の年）が変わるところで区切る。過去の年の行が変わらなければ
+    セグメントの内容も変わらないため、前回の実行と同じセグメントを共有できる。
+
+    Returns:
+    list: (キー, バイト列) のリスト（キーはヘッダーが "header"、それ以外は年）
+    """
+    lines = data.splitlines(keepends=True)
+    if not lines:
+        return []
+    segments = [("header", lines[0])]
+    current_key, current = None, []
+    for line in lines[1:]:
+        key = line[:4].decode('ascii', errors='replace')
+        if key != current_key and current:
+            segments.append((current_key, b"".join(current)))
+            current = []
+        current_key = key
+        current.append(line)
+    if current:
+        segments.append((current_key, b"".join(current)))
+    return segments
+
+def write_segment(output_dir, data):
+    """
+    セグメントを保存する（同じ内容のセグメントがすでにあれば書き込まない）
+
+    Returns:
+    tuple: (ハッシュ, 新しく書き込んだバイト数)
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    path = get_segment_path(output_dir, digest)
+    if os.path.exists(path):
+        return digest, 0
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    compressed = compress_bytes(data, SEGMENT_COMPRESSION)
+    with file_lock(path), atomic_path(path) as tmp_path:
+        with open(tmp_path, 'wb') as f:
+            f.write(compressed)
+    return digest, len(compressed)
+
+def read_segment(output_dir, digest):
+    """セグメントを読み込み、内容がハッシュと一致するか確認する"""
+    path = get_segment_path(output_dir, digest)
+    with open(path, 'rb') as f:
+        data = decompress_bytes(f.read(), SEGMENT_COMPRESSION, os.path.basename(path))
+    if hashlib.sha256(data).hexdigest() != digest:
+        raise ValueError(f"セグメントの内容が壊れています: {path}")
+    return data
+
+def get_file_stamp(path):
+    """ファイルのサイズと更新時刻（前回から変わっていないかの判定に使う）"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+def snapshot_file(output_dir, path):
+    """
+    1ファイルをセグメントに分けて保存する
+
+    CSVファイルは展開してから年ごとに分け、それ以外のファイル（Excelブックなど）は1つのセグメントにする。
+
+    Returns:
+    tuple: (マニフェストのエントリ, 新しいセグメント数, 新しく書き込んだバイト数)
+    """
+    is_csv = strip_csv_suffix(path) is not None
+    compression = get_compression_method(path)
+    with file_lock(path, shared=True):
+        with open(path, 'rb') as f:
+            data = f.read()
+    if is_csv:
+        pieces = split_segments(decompress_bytes(data, compression, os.path.basename(path)))
+    else:
+        pieces = [("file", data)]
+
+    segments, new_segments, new_bytes = [], 0, 0
+    for key, piece in pieces:
+        digest, written = write_segment(output_dir, piece)
+        segments.append([key, digest])
+        new_segments += written > 0
+        new_bytes += written
+    entry = {"kind": "csv" if is_csv else "file", "compression": compression if is_csv else None,
+             "segments": segments}
+    return entry, new_segments, new_bytes
+
+def get_revised_keys(previous, entry):
+    """
+    前回の実行から内容が変わった過去のセグメント（最後の年とヘッダー以外）のキーを返す
+
+    データ提供元が過去の価格を修正した（配当・分割の調整など）場合に検出するために使う。
+    """
+    if previous is None or previous.get("kind") != "csv" or entry["kind"] != "csv":
+        return []
+    before = dict(map(tuple, previous["segments"]))
+    return [key for key, digest in entry["segments"][1:-1] if key in before and before[key] != digest]
+
+def load_runs(output_dir):
+    """実行の一覧を読み込む（古い順）"""
+    path = get_runs_path(output_dir)
+    if not os.path.exists(path):
+        return []
+    return read_json(path).get("runs", [])
+
+def load_manifest(output_dir, run_id):
+    """実行のマニフェストを読み込む"""
+    return read_json(get_manifest_path(output_dir, run_id))
+
+def new_run_id(output_dir, runs):
+    """現在時刻から重複しない実行IDを作成する"""
+    base = datetime.now().strftime(RUN_ID_FORMAT)
+    run_id, number = base, 1
+    existing = {run["run_id"] for run in runs}
+    while run_id in existing or os.path.exists(get_manifest_path(output_dir, run_id)):
+        number += 1
+        run_id = f"{base}-{number}"
+    return run_id
+
+def take_snapshot(output_dir, catalog, note=None):
+    """
+    カタログに登録された全てのCSVファイルの現在の内容を履歴に記録する
+
+    前回の実行からサイズ・更新時刻・カタログのバージョンが変わっていないファイルは読み込まずに
+    前回のエントリをそのまま使う。変わったファイルも、内容が同じセグメント（過去の年など）は
+    前回と共有するため、新しく書き込むのは変わった部分だけになる。CSV以外の成果物（Excelブック・
+    受け渡し用のファイルなど）はCSVから作り直せるため記録しない。フォルダの成果物
+    （分足のパーティション・列ファイル）も追記のみのため記録しない。
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    catalog (dict): 成果物カタログ
+    note (str): 実行のメモ（マニフェストに記録する）
+
+    Returns:
+    dict: 実行の情報（実行ID・ファイル数・新しいセグメント数・修正された過去のデータなど）
+    """
+    history_dir = get_history_dir(output_dir)
+    os.makedirs(history_dir, exist_ok=True)
+    # 記録が終わるまで実行の一覧のロックを取り、マニフェストに載る前のセグメントを prune_runs が削除しないようにする
+    with file_lock(get_runs_path(output_dir), timeout=None):
+        runs = load_runs(output_dir)
+        previous_files = {}
+        if runs:
+            try:
+                previous_files = load_manifest(output_dir, runs[-1]["run_id"]).get("files", {})
+            except (OSError, ValueError) as e:
+                print(f"前回のマニフェストを読み込めません（全ファイルを記録し直します）: {e}")
+
+        files, revisions = {}, []
+        stats = {"files": 0, "reused": 0, "new_segments": 0, "new_bytes": 0}
+        for symbol, entry in catalog["symbols"].items():
+            for interval, artifact in entry.get("artifacts", {}).items():
+                path = artifact["path"] if os.path.isabs(artifact["path"]) else os.path.join(output_dir, artifact["path"])
+                if not os.path.isfile(path) or strip_csv_suffix(path) is None:
+                    continue
+                key = f"{symbol}|{interval}"
+                previous = previous_files.get(key)
+                stamp = get_file_stamp(path)
+                if previous is not None and previous.get("stamp") == stamp and \
+                        previous.get("version") == artifact.get("version") and previous.get("path") == artifact["path"]:
+                    # 取引所は設定ファイルで変わることがあるため、最新のカタログから記録し直す
+                    files[key] = dict(previous, exchange=entry.get("exchange"))
+                    stats["reused"] += 1
+                else:
+                    try:
+                        file_entry, new_segments, new_bytes = snapshot_file(output_dir, path)
+                    except (OSError, ValueError) as e:
+                        print(f"警告: {symbol} の{interval}を履歴に記録できません: {e}")
+                        continue
+                    file_entry.update({"symbol": symbol, "interval": interval, "path": artifact["path"],
+                                       "version": artifact.get("version"), "rows": artifact.get("rows"),
+                                       "start": artifact.get("start"), "end": artifact.get("end"), "stamp": stamp,
+                                       "exchange": entry.get("exchange")})
+                    revised = get_revised_keys(previous, file_entry)
+                    if revised:
+                        revisions.append({"symbol": symbol, "interval": interval, "years": revised})
+                    files[key] = file_entry
+                    stats["new_segments"] += new_segments
+                    stats["new_bytes"] += new_bytes
+                stats["files"] += 1
+
+        run_id = new_run_id(output_dir, runs)
+        created = datetime.now().isoformat(timespec='seconds')
+        manifest = {"format": MANIFEST_FORMAT_VERSION, "run_id": run_id, "created": created, "note": note,
+                    "parent": runs[-1]["run_id"] if runs else None, "files": files, "revisions": revisions}
+        os.makedirs(os.path.dirname(get_manifest_path(output_dir, run_id)), exist_ok=True)
+        write_json(get_manifest_path(output_dir, run_id), manifest)
+        run = dict(stats, run_id=run_id, created=created, note=note, revisions=len(revisions))
+        runs.append(run)
+        write_json(get_runs_path(output_dir), {"runs": runs})
+
+    print(f"履歴に記録しました: {run_id}（{stats['files']}ファイル、変更なし{stats['reused']}件、"
+          f"新しいセグメント{stats['new_segments']}件・{stats['new_bytes'] / 1024:,.1f}KB）")
+    for revision in revisions:
+        print(f"  警告: {revision['symbol']} の{revision['interval']}で過去のデータが修正されました"
+              f"（{', '.join(revision['years'])}年）")
+    return run
+
+def resolve_run(output_dir, as_of=None):
+    """
+    実行IDまたは日時から、その時点の実行IDを返す
+
+    Parameters:
+    as_of (str): 実行ID、日時（その日時以前の最後の実行）、省略時は最新の実行
+
+    Returns:
+    str: 実行ID（該当する実行がない場合はNone）
+    """
+    runs = load_runs(output_dir)
+    if not runs:
+        return None
+    if as_of is None:
+        return runs[-1]["run_id"]
+    if any(run["run_id"] == as_of for run in runs):
+        return as_of
+    try:
+        as_of_ts = pd.Timestamp(as_of)
+    except ValueError:
+        return None
+    # 日付だけの指定はその日の終わりまでを含める
+    if as_of_ts == as_of_ts.normalize() and len(str(as_of)) <= 10:
+        as_of_ts += pd.Timedelta(days=1) - pd.Timedelta(seconds=1)
+    candidates = [run["run_id"] for run in runs if pd.Timestamp(run["created"]) <= as_of_ts]
+    return candidates[-1] if candidates else None
+
+def read_file_bytes(output_dir, file_entry):
+    """マニフェストのエントリからファイルの内容（CSVは展開した状態）を組み立てる"""
+    return b"".join(read_segment(output_dir, digest) for _, digest in file_entry["segments"])
+
+def lookup_file(output_dir, symbol, interval, as_of=None):
+    """
+    指定した時点のマニフェストから銘柄・期間のエントリを探す
+
+    Returns:
+    tuple: (実行ID, エントリ)（該当する実行・ファイルがない場合はエントリがNone）
+    """
+    run_id = resolve_run(output_dir, as_of)
+    if run_id is None:
+        return None, None
+    files = load_manifest(output_dir, run_id).get("files", {})
+    return run_id, files.get(f"{symbol}|{resolve_interval(interval)}")
+
+def read_prices_as_of(output_dir, symbol, interval, as_of=None):
+    """
+    指定した時点の価格データを読み込む（price_store.read_prices と同じ形式）
+
+    Parameters:
+    output_dir (str): 出力ディレクトリ
+    symbol (str): ティッカーシンボル
+    interval (str): 期間コードまたは期間名
+    as_of (str): 実行ID、日時、省略時は最新の実行
+
+    Returns:
+    pd.DataFrame: 英語カラム名・日時インデックスのデータフレーム（記録がない場合はNone）
+    """
+    _, file_entry = lookup_file(output_dir, symbol, interval, as_of)
+    if file_entry is None or file_entry["kind"] != "csv":
+        return None
+    data = read_file_bytes(output_dir, file_entry)
+    df = pd.read_csv(io.BytesIO(data), index_col=0, float_precision=CSV_FLOAT_PRECISION, encoding='utf-8-sig')
+    df.index = parse_dates(df.index, EXCHANGES[get_exchange(symbol, file_entry.get("exchange"))]["timezone"])
+    return normalize_columns(df)
+
+def restore_run(output_dir, run_id, dest_dir):
+    """
+    実行の時点の全ファイルを別のフォルダに復元する（出力ディレクトリからの相対パスを保つ）
+
+    CSVファイルは元の圧縮形式で書き出す（展開した内容は記録した時点のファイルと同じになる）。
+
+    Returns:
+    int: 復元したファイル数
+    """
+    manifest = load_manifest(output_dir, run_id)
+    restored = 0
+    for file_entry in manifest.get("files", {}).values():
+        relative = file_entry["path"]
+        if os.path.isabs(relative):
+            relative = os.path.basename(relative)
+        path = os.path.join(dest_dir, relative)
+        os.makedirs(os.path.dirname(path) or dest_dir, exist_ok=True)
+        data = read_file_bytes(output_dir, file_entry)
+        if file_entry["kind"] == "csv":
+            data = compress_bytes(data, file_entry.get("compression"))
+        with atomic_path(path) as tmp_path:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+        restored += 1
+    return restored
+
+def diff_runs(output_dir, old_run, new_run):
+    """
+    2つの実行の間で内容が変わったファイルと年を返す
+
+    Returns:
+    pd.DataFrame: 銘柄・期間ごとの変更内容（追加・削除・変更された年）
+    """
+    old_files = load_manifest(output_dir, old_run).get("files", {})
+    new_files = load_manifest(output_dir, new_run).get("files", {})
+    rows = []
+    for key in sorted(set(old_files) | set(new_files)):
+        old, new = old_files.get(key), new_files.get(key)
+        if old is not None and new is not None and old["segments"] == new["segments"]:
+            continue
+        symbol, interval = key.split("|", 1)
+        if old is None or new is None:
+            rows.append({"Symbol": symbol, "Interval": interval, "Change": "追加" if old is None else "削除",
+                         "Segments": ""})
+            continue
+        before, after = dict(map(tuple, old["segments"])), dict(map(tuple, new["segments"]))
+        changed = [k for k in after if before.get(k) != after[k]] + [k for k in before if k not in after]
+        rows.append({"Symbol": symbol, "Interval": interval, "Change": "変更", "Segments": ", ".join(changed)})
+    return pd.DataFrame(rows, columns=["Symbol", "Interval", "Change", "Segments"])
+
+def prune_runs(output_dir, keep):
+    """
+    最新の keep 件より古い実行を削除し、どの実行からも参照されないセグメントを削除する
+
+    Returns:
+    tuple: (削除した実行数, 削除したセグメント数)
+    """
+    with file_lock(get_runs_path(output_dir), timeout=None):
+        runs = load_runs(output_dir)
+        if keep <= 0 or len(runs) <= keep:
+            return 0, 0
+        removed, runs = runs[:-keep], runs[-keep:]
+        write_json(get_runs_path(output_dir), {"runs": runs})
+        for run in removed:
+            path = get_manifest_path(output_dir, run["run_id"])
+            if os.path.exists(path):
+                os.remove(path)
+
+        referenced = set()
+        for run in runs:
+            for file_entry in load_manifest(output_dir, run["run_id"]).get("files", {}).values():
+                referenced.update(digest for _, digest in file_entry["segments"])
+        deleted = 0
+        segments_dir = os.path.join(get_history_dir(output_dir), SEGMENTS_DIR_NAME)
+        for folder, _, file_names in os.walk(segments_dir):
+            for file_name in file_names:
+                if file_name.endswith(".gz") and file_name[:-3] not in referenced:
+                    os.remove(os.path.join(folder, file_name))
+                    deleted += 1
+    return len(removed), deleted
+
+def snapshot_after_fetch(output_dir, catalog, config):
+    """データ取得の後に履歴を記録する（設定の history_keep_runs で保存する実行数を制限する）"""
+    if not config.get("history", True):
+        return None
+    run = take_snapshot(output_dir, catalog, note="fetch")
+    keep = config.get("history_keep_runs")
+    if keep:
+        removed, deleted = prune_runs(output_dir, int(keep))
+        if removed:
+            print(f"古い履歴を削除しました: 実行{removed}件、セグメント{deleted}件")
+    return run
+
+def main():
+    """
+    メイン関数：履歴の記録・一覧・時点を指定した読み込み・復元を行う
+
+    使い方:
+    python versioned_store.py                          実行の一覧を表示
+    python versioned_store.py -snapshot                現在のファイルを履歴に記録
+    python versioned_store.py -show 7203.T [日足] [-as-of 実行IDまたは日時]
+    python versioned_store.py -restore 実行ID 復元先フォルダ
+    python versioned_store.py -diff 実行ID 実行ID
+    python versioned_store.py -prune 保存する実行数
+    """
+    config = stock_data_all_new.load_config()
+    output_dir = config.get("output_dir", "C:\\Users\\rilak\\Desktop\\株価\\株価データ")
+    args = sys.argv[1:]
+    as_of = args[args.index("-as-of") + 1] if "-as-of" in args[:-1] else None
+
+    if "-snapshot" in args:
+        take_snapshot(output_dir, load_catalog(output_dir), note="manual")
+    elif "-show" in args[:-1]:
+        position = args.index("-show")
+        symbol = args[position + 1]
+        interval = args[position + 2] if len(args) > position + 2 and not args[position + 2].startswith("-") else "日足"
+        run_id, _ = lookup_file(output_dir, symbol, interval, as_of)
+        df = read_prices_as_of(output_dir, symbol, interval, as_of)
+        if df is None:
+            print(f"履歴に記録がありません: {symbol} {interval}（時点: {as_of or '最新'}）")
+            sys.exit(1)
+        print(f"{symbol} {interval}（実行 {run_id} の時点）: {len(df)}行")
+        print(df.tail())
+    elif "-restore" in args[:-2]:
+        position = args.index("-restore")
+        run_id = resolve_run(output_dir, args[position + 1])
+        if run_id is None:
+            print(f"実行が見つかりません: {args[position + 1]}")
+            sys.exit(1)
+        restored = restore_run(output_dir, run_id, args[position + 2])
+        print(f"実行 {run_id} の時点のファイル{restored}件を復元しました: {args[position + 2]}")
+    elif "-diff" in args[:-2]:
+        position = args.index("-diff")
+        old_run, new_run = resolve_run(output_dir, args[position + 1]), resolve_run(output_dir, args[position + 2])
+        if old_run is None or new_run is None:
+            print("実行が見つかりません。")
+            sys.exit(1)
+        changes = diff_runs(output_dir, old_run, new_run)
+        print(f"{old_run} → {new_run}: {len(changes)}件の変更")
+        if len(changes):
+            print(changes.to_string(index=False))
+    elif "-prune" in args[:-1]:
+        removed, deleted = prune_runs(output_dir, int(args[args.index("-prune") + 1]))
+        print(f"古い履歴を削除しました: 実行{removed}件、セグメント{deleted}件")
+    else:
+        runs = load_runs(output_dir)
+        if not runs:
+            print("履歴はまだ記録されていません。")
+            return
+        print("===== 履歴の一覧 =====")
+        columns = ["run_id", "created", "note", "files", "reused", "new_segments", "new_bytes", "revisions"]
+        print(pd.DataFrame(runs).reindex(columns=columns).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -73,6 +73,12 @@ def main():
     print("=" * 50)
 
 if __name__ == "__main__":
+    # "-daemon"フラグがある場合は常駐モードで起動（取引終了時刻ごとに処理を実行）
+    if "-daemon" in sys.argv:
+        import stock_daemon
+        stock_daemon.main()
+        sys.exit(0)
+    
     try:
         main()
     except KeyboardInterrupt:
@@ -81,5 +87,7 @@ if __name__ == "__main__":
         print(f"\n\n予期せぬエラーが発生しました: {e}")
         traceback.print_exc()
     
-    print("\n処理を終了します。何かキーを押すと終了します...")
-    input()
+    # cronなどから実行された場合は入力待ちをしない
+    if sys.stdin is not None and sys.stdin.isatty():
+        print("\n処理を終了します。何かキーを押すと終了します...")
+        input()